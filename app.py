@@ -6,49 +6,235 @@ app.py
 contains all methods for mapping urls to specific functions and webpages
 contains methods for GET and POST HTTP method calls to urls
 """
+import time
+
+_import_started = time.perf_counter()
+
 from flask import (
     Flask,
+    Response,
+    current_app,
+    jsonify,
     render_template,
     url_for,
     redirect,
     request,
     session,
     flash,
+    send_file,
+    abort,
 )
 import os
 
+import click
+
 from data_utils import (
     register_user,
     login_user,
     add_patient,
-    get_patients,
+    get_patients_page,
     add_activity,
     get_activities,
     get_patient,
     get_patient_activities,
-    get_patient_scores,
+    get_patient_scores_frame,
+    get_patient_summary,
     add_comment,
-    retrieve_comments,
+    fetch_all,
+    is_medical_staff,
+    verify_id_token,
+    refresh_login,
+    migrate_patient_traces,
+    patient_emails,
+    live_cache,
 )
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib.figure import Figure
-import io
-import base64
-import plotly.express as px
+import async_data_utils
+import charts
+import metrics
+import profiling
+import session_store
+from session_store import ServerSessionInterface, SessionStore
+from auth_tokens import InvalidToken, TokenExpired
+from charts import ChartStore, data_hash
+from render_pool import PlotlyRenderPool
+from backends import set_backend
+import summary as progress_summary
 from datetime import date, timedelta, datetime
-import numpy as np
+import re
+import atexit
+import inspect
+import multiprocessing
+import importlib.util
+from importlib import metadata
+
+# comments that are not about one activity are kept under this activity name
+GENERAL_COMMENTS = "General comments"
+
+# comment thread of an activity without comments, see data_utils.comment_thread
+EMPTY_THREAD = {"comments": [], "more": False, "next_page_token": None}
+
+# url rules registered on the application by create_app
+routes = []
+
+chart_store = None
+
+render_pool = None
+
+# process the chart workers were started in
+workers_pid = None
+
+
+def route(rule, **options):
+    """
+    records a view function for an url rule, the same as Flask.route
+    """
+
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+
+    return decorator
+
+
+def create_app(config=None, backend=None):
+    """
+    creates the web application
+    
+    charts are rendered on the server in the "server" CHART_MODE, and drawn in the
+    browser from their series in the "client" mode (BALANCE_CHART_MODE)
+    with WARM_CHARTS set (BALANCE_WARM_CHARTS, on by default) the server mode
+    starts its chart renderers on the first request, otherwise the first chart
+    request starts them, so plotting libraries are never imported at boot
+    
+    Parameters
+    -------------
+    config : map of flask settings applied over the defaults
+    backend : storage backend to use, by default the firestore or local backend
+        named by BALANCE_BACKEND is created by the first request reading data
+    """
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = os.urandom(24)
+    app.config["WARM_CHARTS"] = os.environ.get("BALANCE_WARM_CHARTS", "1") == "1"
+    # "server" renders charts to png images, "client" sends their series as json
+    # to be drawn in the browser with plotly.js
+    app.config["CHART_MODE"] = os.environ.get("BALANCE_CHART_MODE", "server")
+    # sqlite file the server side sessions are kept in, see session_store.py
+    app.config["SESSION_DB"] = session_store.default_session_db(app.instance_path)
+    app.config.update(config or {})
+    app.session_interface = ServerSessionInterface(SessionStore(app.config["SESSION_DB"]))
+    for rule, view, options in routes:
+        if inspect.iscoroutinefunction(view):
+            # the body of an async view runs on another thread than the request
+            view = profiling.profiled_view(view)
+        app.add_url_rule(rule, view.__name__, view, **options)
+    app.jinja_env.globals["plotly_version"] = plotly_version
+    app.cli.add_command(migrate_traces_command)
+    app.before_request(metrics.start_request)
+    app.after_request(metrics.finish_request)
+    app.before_request(profiling.start_request)
+    app.after_request(profiling.finish_request)
+    app.teardown_request(profiling.teardown_request)
+    if backend is not None:
+        set_backend(backend)
+    if app.config["WARM_CHARTS"] and app.config["CHART_MODE"] == "server":
+        # started by the first request rather than at import, so neither a spawned
+        # chart process importing this module nor a preloading server that forks
+        # after import starts renderers that are lost
+        app.before_request(start_chart_workers)
+    return app
+
+
+def is_logged_in():
+    """
+    returns True if the current session belongs to a logged in medical personnel
+    the result is kept for the rest of the request, see authenticate
+    """
+    if "balance.logged_in" not in request.environ:
+        request.environ["balance.logged_in"] = authenticate()
+    return request.environ["balance.logged_in"]
+
+
+def authenticate():
+    """
+    checks the firebase id token of the session
+    the token is verified locally against the cached signing keys and the user
+    must be in the cached medical_staff lookup, so no request is made to firebase
+    an expired token is exchanged once for a new one with the refresh token
+    """
+    token = session.get("idToken")
+    if token is None:
+        return False
+    try:
+        claims = verify_id_token(token)
+    except TokenExpired:
+        tokens = refresh_login(session.get("refreshToken"))
+        if tokens is None:
+            return False
+        session["idToken"] = tokens["idToken"]
+        session["refreshToken"] = tokens["refreshToken"]
+        try:
+            claims = verify_id_token(tokens["idToken"])
+        except InvalidToken:
+            return False
+    except InvalidToken:
+        return False
+    return claims["sub"] == session.get("userId") and is_medical_staff(claims["sub"])
 
-user = {"is_logged_in": False}
 
-app = Flask(__name__)
+def get_chart_store():
+    """
+    returns the chart store, creating it on first use
+    """
+    global chart_store
+    if chart_store is None:
+        chart_store = ChartStore(charts.default_chart_dir())
+    return chart_store
 
-app.config["SECRET_KEY"] = os.urandom(24)
 
+def start_chart_workers():
+    """
+    starts the kaleido render pool and the matplotlib process pool once
+    
+    the renderers are warmed in the background, so this does not wait for them
+    nothing is started in a chart process, and a process forked after the pools
+    were started starts its own, as the renderer threads do not survive a fork
+    """
+    global render_pool, workers_pid
+    if multiprocessing.parent_process() is not None:
+        return
+    if workers_pid != os.getpid():
+        render_pool = None
+        charts.process_pool = None
+    if render_pool is None:
+        workers_pid = os.getpid()
+        # kaleido renderers are kept warm so chart requests only pay for the render
+        render_pool = PlotlyRenderPool(
+            size=int(os.environ.get("BALANCE_RENDER_WORKERS", 2)),
+            timeout=float(os.environ.get("BALANCE_RENDER_TIMEOUT", 30)),
+        ).start()
+        charts.set_render_pool(render_pool)
+
+        # matplotlib charts are drawn in separate processes so rendering uses every core
+        charts.start_process_pool(int(os.environ.get("BALANCE_CHART_PROCESSES", 2)))
+
+
+@atexit.register
+def stop_chart_workers():
+    """
+    stops the chart pools at exit, only in the process that started them
+    """
+    if render_pool is not None and workers_pid == os.getpid():
+        render_pool.shutdown()
+        charts.shutdown_process_pool()
 
-@app.route("/")
-@app.route("/login", methods=["GET", "POST"])
+
+# snapshot listeners of the live cache are closed before the firestore client
+if live_cache is not None:
+    atexit.register(live_cache.close)
+
+
+@route("/")
+@route("/login", methods=["GET", "POST"])
 def login():
     """
     login function
@@ -62,27 +248,26 @@ def login():
         userlogin = login_user(userDetails)
         if userlogin == None:
             return render_template("login.html")
-        global user
-        user["is_logged_in"] = True
+        session.regenerate()
         session["userId"] = userlogin["localId"]
+        session["idToken"] = userlogin["idToken"]
+        session["refreshToken"] = userlogin["refreshToken"]
         return render_template("welcome.html")
     return render_template("login.html")
 
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     """
     logout function
     clears session variables
     returns user to login page
     """
-    global user
-    user["is_logged_in"] = False
     session.clear()
     return redirect(url_for("login"))
 
 
-@app.route("/register", methods=["GET", "POST"])
+@route("/register", methods=["GET", "POST"])
 def register():
     """
     register function
@@ -101,20 +286,20 @@ def register():
     return render_template("register.html")
 
 
-@app.route("/welcome")
+@route("/welcome")
 def welcome():
     """
     welcome function
     GET -displays welcome webpage
     """
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         return render_template("welcome.html")
     else:
         flash("You must be logged in to access webpage.", "error")
         return redirect(url_for("login"))
 
 
-@app.route("/create_patient", methods=["GET", "POST"])
+@route("/create_patient", methods=["GET", "POST"])
 def create_patient():
     """
 	create patient function
@@ -123,7 +308,7 @@ def create_patient():
 		if successful creates new patient
 		if unsuccessful returns user to create patient page displaying an error message
 	"""
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         if request.method == "POST":
             userDetails = request.form
             add_patient(userDetails)
@@ -135,7 +320,7 @@ def create_patient():
         return redirect(url_for("login"))
 
 
-@app.route("/edit_patient", methods=["GET", "POST"])
+@route("/edit_patient", methods=["GET", "POST"])
 def edit_patient():
     """
     edit patient function
@@ -144,8 +329,9 @@ def edit_patient():
     	if successful edits a patients details
     	if unsuccessful returns user to edit patient page displaying an error message
     """
-    if user["is_logged_in"] == True:
-        data = get_patients()
+    if is_logged_in():
+        page_token = request.values.get("page_token")
+        data, next_page_token = get_patients_page(page_token=page_token)
         patient_details = None
         if request.method == "POST":
             userDetails = request.form
@@ -157,84 +343,143 @@ def edit_patient():
                 patient_details = get_patient(email)
 
             return render_template(
-                "edit_patient.html", data=data, patient_details=patient_details
+                "edit_patient.html",
+                data=data,
+                patient_details=patient_details,
+                page_token=page_token,
+                next_page_token=next_page_token,
             )
         return render_template(
-            "edit_patient.html", data=data, patient_details=patient_details
+            "edit_patient.html",
+            data=data,
+            patient_details=patient_details,
+            page_token=page_token,
+            next_page_token=next_page_token,
         )
     else:
         flash("You must be logged in to access webpage.", "error")
         return redirect(url_for("login"))
 
 
-@app.route("/view_patients", methods=["GET", "POST"])
+@route("/view_patients", methods=["GET", "POST"])
 def view_patients():
     """
     view patients function
     GET - displays view patients webpage
     POST - dispalys the patient details webpage of the selected patient from patient list
     """
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         if request.method == "POST":
             session["user_email"] = request.form["user_email"]
             return redirect(url_for("patient_details"))
-        data = get_patients()
-        return render_template("view_patients.html", data=data)
+        page_token = request.args.get("page_token")
+        data, next_page_token = get_patients_page(page_token=page_token)
+        return render_template(
+            "view_patients.html",
+            data=data,
+            page_token=page_token,
+            next_page_token=next_page_token,
+        )
     else:
         flash("You must be logged in to access webpage.", "error")
         return redirect(url_for("login"))
 
 
-@app.route("/patient_details", methods=["GET", "POST"])
-def patient_details():
+@route("/patient_details", methods=["GET", "POST"])
+async def patient_details():
     """
     patient details function
     GET - displays patient details webpage
     	displays the patients personal details and actvities
     	displays any comments left by the medical staff on each of the actvities carried out
-    POST - retrieves selected activities comments and displays in table format
+    POST - displays the comments of the selected activity
+    the patient, activities and comments are read concurrently with the asyncio client
+    the newest comments of every activity are read at once and switched between in
+    the page, the older comments of a thread are read a page at a time, GET with the
+    activity and page_token of the thread
     """
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         if "user_email" in session:
             user_email = session["user_email"]
 
-        patient_detail = get_patient(user_email)
+        (
+            patient_detail,
+            patient_activities,
+            patient_comments,
+        ) = await async_data_utils.gather(
+            (async_data_utils.get_patient, user_email),
+            (async_data_utils.get_activities,),
+            (async_data_utils.get_patient_comments, user_email),
+        )
         if patient_detail == None:
             return redirect(url_for("view_patients"))
         session["patient_detail"] = patient_detail
-
-        patient_activities = get_activities()
         session["patient_activities"] = patient_activities
 
-        if request.method == "POST":
-            details = request.form
-            if details["activity"] == "feetTogether":
-                patient_comments = retrieve_comments(
-                    "Stand with your feet side-by-side", user_email
-                )
-            elif details["activity"] == "instep":
-                patient_comments = retrieve_comments("Instep Stance", user_email)
-            elif details["activity"] == "tandem":
-                patient_comments = retrieve_comments("Tandem Stance", user_email)
-            elif details["activity"] == "general":
-                patient_comments = retrieve_comments("General comments", user_email)
-            else:
-                patient_comments = retrieve_comments("Stand on one foot", user_email)
-        else:
-            patient_comments = retrieve_comments("General comments", user_email)
+        threads = comment_threads(patient_activities, patient_comments)
+        activity = request.form.get("activity") or request.args.get("activity")
+        if activity not in [value for value, _, _ in threads]:
+            activity = threads[0][0]
+
+        page_token = None
+        if "activity" in request.args:
+            # an older page of the selected thread is read from the thread itself
+            page_token = request.args.get("page_token")
+            index = [value for value, _, _ in threads].index(activity)
+            value, name, _ = threads[index]
+            comments, next_page_token = await async_data_utils.retrieve_comments_page(
+                name, user_email, page_token=page_token
+            )
+            threads[index] = (
+                value,
+                name,
+                {
+                    "comments": comments,
+                    "more": next_page_token is not None,
+                    "next_page_token": next_page_token,
+                },
+            )
 
         return render_template(
             "patient_details.html",
             data=patient_detail,
-            patient_comments=patient_comments,
             patient_activities=patient_activities,
+            comment_threads=threads,
+            comment_activity=activity,
+            page_token=page_token,
         )
     else:
         flash("You must be logged in to access webpage.", "error")
         return redirect(url_for("login"))
 
 
-@app.route("/create_activity", methods=["GET", "POST"])
+def comment_threads(activities, comments):
+    """
+    returns the comment threads of the patient details page as (form value,
+    activity name, thread), the general comments first, then every activity and
+    any other activity the patient has comments under
+    
+    Parameters
+    -------------
+    activities : activities of the patient
+    comments : map of activity name to its thread, see get_patient_comments
+    """
+    comments = comments or {}
+    names = [GENERAL_COMMENTS]
+    for name in [a.get("name") for a in activities or []] + sorted(comments):
+        if name and name not in names:
+            names.append(name)
+    return [
+        (
+            re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_"),
+            name,
+            comments.get(name, EMPTY_THREAD),
+        )
+        for name in names
+    ]
+
+
+@route("/create_activity", methods=["GET", "POST"])
 def create_activity():
     """
     create activity function
@@ -243,7 +488,7 @@ def create_activity():
     	if successful adds an activity
     	if unsuccessful returns user to create activity page displaying an error message
     """
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         if request.method == "POST":
             activityDetails = request.form
             add_activity(activityDetails)
@@ -254,14 +499,14 @@ def create_activity():
         return redirect(url_for("login"))
 
 
-@app.route("/view_activities")
+@route("/view_activities")
 def view_activities():
     """
     view activities function
     GET - displays view activities webpage
     POST - dispalys the created activities details in a table
     """
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         data = get_activities()
         return render_template("view_activities.html", data=data)
     else:
@@ -269,7 +514,7 @@ def view_activities():
         return redirect(url_for("login"))
 
 
-@app.route("/view_activity_progress", methods=["GET", "POST"])
+@route("/view_activity_progress", methods=["GET", "POST"])
 def view_activity_progress():
     """
 	view activity progress function
@@ -279,96 +524,95 @@ def view_activity_progress():
 	POST - dispalys the users activities results for the selected amount of time
 		from the dropdown provided
 	"""
-    if user["is_logged_in"] == True:
-
+    if is_logged_in():
         user_email = session["user_email"]
-        activities = get_activities()
-        patient_scores = get_patient_scores(user_email)
-        rows = create_activity_rows(patient_scores)
-        df = pd.DataFrame(rows)
-        df["date_set"] = pd.to_datetime(
-            df["date_set"], format="%Y-%m-%d", utc=True
-        ).dt.date
-
-        activitiesTaken_df = df[
-            df["activityName"] == "Stand with your feet side-by-side"
+        progress = load_progress(user_email)
+        activities = progress["activities"]
+        summary = progress["summary"]
+        percentages = progress["percentages"]
+        today = progress["today"]
+        progress_charts = None
+        if client_charts():
+            chart_data_url = url_for("progress_chart_data")
+        else:
+            chart_data_url = None
+            start_chart_workers()
+            store = get_chart_store()
+            progress_charts = {
+                "activity_week": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "activity_week",
+                    data_hash(progress["week_counts"]),
+                    charts.render_week_activity,
+                    progress["week_counts"],
+                ),
+                "activities_completed": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "activities_completed",
+                    data_hash(percentages),
+                    charts.render_activities_completed,
+                    percentages,
+                ),
+                "results_sunburst": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "results_sunburst",
+                    data_hash(progress["daily_rows"]),
+                    charts.render_results_sunburst,
+                    progress["daily_rows"],
+                ),
+            }
+        rolling = [
+            progress_summary.rolling_stats(summary, today, 7),
+            progress_summary.rolling_stats(summary, today, 28),
         ]
-        firstDate = activitiesTaken_df["date_set"].min()
-        today = date.today()
-
-        idx = pd.date_range(firstDate, today)
-        idx = idx[-7:]
-        s = activitiesTaken_df.groupby(["date_set"]).size()
-        s = s.reindex(idx, fill_value=0)
-        fig, ax = plt.subplots()
-        plt.xticks(rotation=90)
-        plt.yticks([0, 1])
-
-        ax.bar(idx.to_pydatetime(), s, color="red")
-        ax.set_title("Dates activities taken last week", fontsize=18, color="#8C55AA")
-
-        fig.savefig("static/images/fig.png")
-
-        fig = px.bar(
-            df,
-            x="activityName",
-            color="completed",
-            barmode="group",
-            text="date_set",
-            title="Activities completed",
-            labels=dict(count="Activities carried out"),
-        )
-        fig.write_image("static/images/fig1.png")
-
-        percentages = calculate_percentages(df)
-
-        sunburst = px.sunburst(df, path=["activityName", "date_set", "completed"])
-        sunburst.write_image("static/images/fig4.png")
-
-        df = df.sort_values(by="date_set", ascending=False)
-        df = df[
-            [
-                "activityName",
-                "date_set",
-                "max_value",
-                "min_value",
-                "avg_value",
-                "completed",
-            ]
+        last_date = progress_summary.last_date(summary)
+        lastActivity = [
+            [row[field] for field in progress_summary.SUMMARY_FIELDS]
+            for row in summary["last_session"]
         ]
-        last_date = df["date_set"].max()
-        lastActivity = df[df["date_set"] == last_date]
-        last_week = df[df["date_set"] > (today - timedelta(7))]
-        last_month = df[df["date_set"] > (today - timedelta(28))]
 
         if request.method == "POST":
             details = request.form
             comment = details["comment_made"]
             if comment == "":
-                if details["results"] == "row_data_lastweek":
-                    row_data = list(last_week.values.tolist())
-                elif details["results"] == "row_data":
-                    row_data = list(lastActivity.values.tolist())
-                elif details["results"] == "row_data_lastmonth":
-                    row_data = list(last_month.values.tolist())
+                if details["results"] == "row_data":
+                    row_data = lastActivity
                 else:
+                    since = None
+                    if details["results"] == "row_data_lastweek":
+                        since = today - timedelta(6)
+                    elif details["results"] == "row_data_lastmonth":
+                        since = today - timedelta(27)
+                    df = get_patient_scores_frame(
+                        user_email,
+                        [activity["activityName"] for activity in percentages],
+                        since=since,
+                    )
+                    df["date_set"] = df["date_set"].dt.date
+                    df = df.sort_values(by="date_set", ascending=False)
+                    df = df[progress_summary.SUMMARY_FIELDS]
                     row_data = list(df.values.tolist())
             else:
                 if "user_email" in session:
                     user_email = session["user_email"]
-                add_comment(details, user_email, "General comments")
-                row_data = list(lastActivity.values.tolist())
+                add_comment(details, user_email, GENERAL_COMMENTS)
+                row_data = lastActivity
         else:
-            row_data = list(lastActivity.values.tolist())
+            row_data = lastActivity
 
         return render_template(
             "view_activity_progress.html",
             activities=activities,
-            patient_scores=patient_scores,
-            column_names=df.columns.values,
+            column_names=progress_summary.SUMMARY_FIELDS,
             row_data=row_data,
             percentages=percentages,
             lastActivity=last_date,
+            rolling=rolling,
+            charts=progress_charts,
+            chart_data_url=chart_data_url,
         )
 
     else:
@@ -376,81 +620,125 @@ def view_activity_progress():
         return redirect(url_for("login"))
 
 
-def create_activity_rows(patient_scores):
+def load_progress(user_email):
     """
-    create activity rows function
+    load progress function
     
     Parameters
     -------------
-    patient scores : List of users balance scores retrieved from database
+    user_email : email address of patient
     
     Returns
     ------------
-    List containing each of the activities taken separated into maps
-    """
-    rows = []
-    for data in patient_scores:
-        if "Stand with your feet side-by-side" in data.keys():
-            data_row = data["Stand with your feet side-by-side"]
-            rows.append(data_row)
-        if "Tandem Stance" in data.keys():
-            data_row1 = data["Tandem Stance"]
-            rows.append(data_row1)
-        if "Instep Stance" in data.keys():
-            data_row2 = data["Instep Stance"]
-            rows.append(data_row2)
-        if "Stand on one foot" in data.keys():
-            data_row3 = data["Stand on one foot"]
-            rows.append(data_row3)
-    return rows
-
-
-def calculate_percentages(df):
-    """
-    calculte percentages function
+    Map of the activity catalogue, the patients summary and the series drawn on
+    the progress page, read concurrently
+    """
+    activities, summary = fetch_all((get_activities,), (get_patient_summary, user_email))
+    activity_names = [a["name"] for a in activities or []]
+    today = date.today()
+    return {
+        "activities": activities,
+        "summary": summary,
+        "today": today,
+        "week_counts": progress_summary.daily_counts(
+            summary, today - timedelta(6), today
+        ),
+        "percentages": progress_summary.activity_stats(summary, activity_names),
+        "daily_rows": progress_summary.daily_activity_rows(summary),
+    }
+
+
+def client_charts():
+    """
+    returns True when charts are drawn in the browser from the chart data api
+    """
+    return current_app.config["CHART_MODE"] == "client"
+
+
+def chart_data_response(data):
+    """
+    chart data response function
     
     Parameters
     -------------
-    df : dataframe containing users performance scores
+    data : chart series
     
-    Returns
-    ------------
-    List contaning the perrcantages of completed exercises for each actvity
-    contained in the dataframe calculated
-    """
-    numInstepSuccess = df[
-        (df["completed"] == True) & (df["activityName"] == "Instep Stance")
-    ].shape[0]
-    numInstep = df[(df["activityName"] == "Instep Stance")].shape[0]
-
-    numTademSuccess = df[
-        (df["completed"] == True) & (df["activityName"] == "Tandem Stance")
-    ].shape[0]
-    numTandem = df[(df["activityName"] == "Tandem Stance")].shape[0]
-
-    numFeetTogetherSuccess = df[
-        (df["completed"] == True)
-        & (df["activityName"] == "Stand with your feet side-by-side")
-    ].shape[0]
-    numFeetTogether = df[
-        (df["activityName"] == "Stand with your feet side-by-side")
-    ].shape[0]
-
-    numOneFootSuccess = df[
-        (df["completed"] == True) & (df["activityName"] == "Stand on one foot")
-    ].shape[0]
-    numOneFoot = df[(df["activityName"] == "Stand on one foot")].shape[0]
-
-    percentages = [
-        (round(((numFeetTogetherSuccess / numFeetTogether) * 100), 2)),
-        (round(((numInstepSuccess / numInstep) * 100), 2)),
-        (round(((numTademSuccess / numTandem) * 100), 2)),
-        (round(((numOneFootSuccess / numOneFoot) * 100), 2)),
-    ]
-    return percentages
+    Returns a json response tagged with a hash of the series, so the browser only
+    downloads them again when they change
+    """
+    response = jsonify(data)
+    response.set_etag(data_hash(data))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@route("/api/progress")
+def progress_chart_data():
+    """
+    progress chart data function
+    GET - returns the series of the progress page charts of the selected patient
+    """
+    if is_logged_in() and "user_email" in session:
+        progress = load_progress(session["user_email"])
+        return chart_data_response(
+            {
+                "activity_week": charts.week_activity_data(progress["week_counts"]),
+                "activities_completed": charts.activities_completed_data(
+                    progress["percentages"]
+                ),
+                "results_sunburst": charts.results_sunburst_data(
+                    progress["daily_rows"]
+                ),
+            }
+        )
+    abort(401)
+
+
+@route("/api/activity/<activity>")
+def activity_chart_data(activity):
+    """
+    activity chart data function
+    GET - returns the series of the selected activity page charts of the selected patient
+    """
+    if is_logged_in() and "user_email" in session:
+        df = get_patient_scores_frame(session["user_email"], [activity], True)
+        df["date_set"] = df["date_set"].dt.date
+        return chart_data_response(
+            {
+                "activity": activity,
+                "activity_average": charts.activity_average_data(df),
+                "activity_sunburst": charts.activity_sunburst_data(df),
+                "activity_movements": charts.activity_movements_data(df),
+            }
+        )
+    abort(401)
+
+
+@route("/js/plotly.min.js")
+def plotly_js():
+    """
+    plotly js function
+    GET - returns the plotly.js bundle shipped with the plotly package, used to
+    	draw the charts in the browser
+    """
+    package = os.path.dirname(importlib.util.find_spec("plotly").origin)
+    return send_file(
+        os.path.join(package, "package_data", "plotly.min.js"),
+        mimetype="text/javascript",
+        max_age=31536000,
+    )
+
+
+def plotly_version():
+    """
+    returns the version of the plotly.js bundle, added to its url so a new bundle
+    is never served from a browser cache
+    """
+    return metadata.version("plotly")
 
 
-@app.route("/view_selected_activity/<activity>", methods=["GET", "POST"])
+@route("/view_selected_activity/<activity>", methods=["GET", "POST"])
 def view_selected_activity(activity):
     """
 	view selected activity function
@@ -465,67 +753,66 @@ def view_selected_activity(activity):
 	POST - adds any cooments made by the medical staff to the database
 		refreshes page
 	"""
-    if user["is_logged_in"] == True:
+    if is_logged_in():
         if request.method == "POST":
             if "user_email" in session:
                 user_email = session["user_email"]
             comments = request.form
             add_comment(comments, user_email, activity)
 
-        activities = get_activities()
+        if "user_email" in session:
+            user_email = session["user_email"]
+        if client_charts():
+            activities = get_activities()
+            activity_charts = None
+            chart_data_url = url_for("activity_chart_data", activity=activity)
+        else:
+            start_chart_workers()
+            store = get_chart_store()
+            activities, df = fetch_all(
+                (get_activities,),
+                (get_patient_scores_frame, user_email, [activity], True),
+            )
+            df["date_set"] = df["date_set"].dt.date
+            activity_hash = data_hash(df)
+            activity_charts = {
+                "activity_sunburst": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "activity_sunburst",
+                    activity_hash,
+                    charts.render_activity_sunburst,
+                    df,
+                ),
+                "activity_average": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "activity_average",
+                    activity_hash,
+                    charts.render_activity_average,
+                    df,
+                ),
+                "activity_movements": store.get_or_render(
+                    session["userId"],
+                    user_email,
+                    "activity_movements",
+                    data_hash(activity_hash, charts.MOVEMENT_POINTS),
+                    charts.render_activity_movements,
+                    df,
+                    activity,
+                    charts.MOVEMENT_POINTS,
+                ),
+            }
+            chart_data_url = None
         activities = [i for i in activities if not (i["name"] == activity)]
         dict1 = {"name": "Overall"}
         activities.append(dict1)
-        if "user_email" in session:
-            user_email = session["user_email"]
-        patient_scores = get_patient_scores(user_email)
-        rows = create_activity_rows(patient_scores)
-        df = pd.DataFrame(rows)
-        df = df[df["activityName"] == activity]
-
-        fig2 = px.sunburst(
-            df.head(7),
-            path=["date_set", "completed"],
-            hover_name="activityName",
-            color="completed",
-        )
-        fig2.write_image("static/images/fig3.png")
-
-        fig = px.line(
-            df,
-            x="date_set",
-            y=["avg_value", "max_value"],
-            title="Overall Average Score",
-        )
-        fig.write_image("static/images/fig2.png")
-
-        i = 0
-        fig = Figure()
-        font1 = {"family": "serif", "color": "blue", "size": 10}
-        fig = plt.figure(figsize=(18, 16))
-        for index, row in df.head(7).iterrows():
-            i = i + 1
-
-            y = np.array(row["acc_data"])
-            plt.subplot(3, 3, i)
-            if row["completed"] is False:
-                plt.plot(y, color="r")
-            else:
-                plt.plot(y)  # Plot the chart
-
-            plt.title(activity + row["date_set"], fontdict=font1)
-            plt.xlabel("Time")
-            plt.ylabel("Movement")
-
-        pngImage = io.BytesIO()
-        FigureCanvas(fig).print_png(pngImage)
-        pngImageB64String = "data:image/png;base64,"
-        pngImageB64String += base64.b64encode(pngImage.getvalue()).decode("utf8")
 
         return render_template(
             "view_selected_activity.html",
             activities=activities,
-            image=pngImageB64String,
+            charts=activity_charts,
+            chart_data_url=chart_data_url,
         )
 
     else:
@@ -533,6 +820,58 @@ def view_selected_activity(activity):
         return redirect(url_for("login"))
 
 
+@route("/charts/<key>.png")
+def chart(key):
+    """
+    chart function
+    GET - returns a rendered chart from the chart store
+    	charts are content addressed so they are cached by the browser indefinitely
+    	a chart is only served to the medical personnel it was rendered for
+    """
+    if is_logged_in():
+        store = get_chart_store()
+        if (
+            not re.fullmatch(r"[a-z_]+-[0-9a-f]{32}-[0-9a-f]{16}", key)
+            or not store.owns(key, session["userId"])
+            or not store.exists(key)
+        ):
+            abort(404)
+        response = send_file(store.path(key), mimetype="image/png", max_age=31536000)
+        response.set_etag(key)
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+    else:
+        flash("You must be logged in to access webpage.", "error")
+        return redirect(url_for("login"))
+
+
+@route("/metrics")
+def metrics_endpoint():
+    """
+    metrics function
+    GET - returns the request, database, chart and cache metrics in the prometheus
+    	text format, when BALANCE_METRICS_TOKEN is set it must be sent as a bearer token
+    """
+    token = os.environ.get("BALANCE_METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != "Bearer " + token:
+        abort(401)
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@click.command("migrate-traces")
+@click.argument("emails", nargs=-1)
+@click.option("--sample-rate", type=float, default=0.0, help="samples per second")
+def migrate_traces_command(emails, sample_rate):
+    """
+    moves the inline acc_data traces of the given patients, or of every patient,
+    out of their score documents into the traces collection
+    """
+    for email in emails or patient_emails():
+        migrated = migrate_patient_traces(email, sample_rate)
+        click.echo("%s: %d score documents migrated" % (email, migrated))
+
+
 def validate_register_details(data):
     """
     validate register details
@@ -549,5 +888,10 @@ def validate_register_details(data):
     return True
 
 
+app = create_app()
+
+# seconds taken to import the application, checked against a budget by the tests
+startup_time = time.perf_counter() - _import_started
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0")
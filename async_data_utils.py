@@ -0,0 +1,417 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+async_data_utils.py
+contains asyncio versions of the data_utils reads for use in async views
+
+reads use the asyncio client of the storage backend, so a worker waiting on the
+database is free to serve other requests and independent reads can be gathered
+the caches, page tokens and error messages are shared with data_utils
+
+flask runs every async view on an event loop of its own, so the reads are run on
+one long-lived loop in a background thread instead, and the process keeps a single
+asyncio client and its connections rather than opening one per request
+
+a few steps still call the blocking data_utils code on a worker thread
+    live_documents, the first read of a collection, which waits for the first
+        snapshot of its listener, reads of a watched collection do not block
+    get_patient_comments, building the comment index of a patient whose comments
+        predate it, done once per patient
+    get_patient_summary, rebuilding a missing, outdated or inconsistent summary and
+        storing new scores in the summary in a transaction
+"""
+import asyncio
+import functools
+import json
+import os
+import threading
+
+from flask import flash, session
+
+import data_utils
+import metrics
+import profiling
+import summary as progress_summary
+from backends import get_backend, DESCENDING, DOCUMENT_ID
+
+
+client_loop = None
+client_loop_pid = None
+_client_loop_lock = threading.Lock()
+
+
+def get_client_loop():
+    """
+    returns the event loop the asyncio client is used on, starting it once
+    a process forked after the loop was started starts its own, as the thread
+    running it does not survive a fork
+    """
+    global client_loop, client_loop_pid
+    with _client_loop_lock:
+        if client_loop is None or client_loop_pid != os.getpid():
+            client_loop = asyncio.new_event_loop()
+            client_loop_pid = os.getpid()
+            threading.Thread(
+                target=client_loop.run_forever, name="balance-client-loop", daemon=True
+            ).start()
+        return client_loop
+
+
+def on_client_loop(function):
+    """
+    decorator running a coroutine function on the client loop
+
+    the request context of the caller is copied to the coroutine, so session,
+    flash and the request metrics work as they do on the loop of the view, and a
+    profiled request profiles the coroutine on the client loop, including the
+    reads gather runs as tasks of their own
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        loop = get_client_loop()
+        coroutine = function(*args, **kwargs)
+        profile = profiling.current_profile()
+        if profile is not None:
+            coroutine = profile.wrap_coroutine(coroutine)
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        return await asyncio.wrap_future(future)
+
+    return wrapper
+
+
+def get_async_db():
+    """
+    returns the asyncio client of the active storage backend for the running loop,
+    the client loop for the reads of this module
+    """
+    return metrics.instrument_client(get_backend().async_db())
+
+
+async def to_thread(function, *args):
+    """
+    runs a blocking data_utils function on a worker thread, the same as
+    asyncio.to_thread, profiled with the request
+    """
+    profile = profiling.current_profile()
+    if profile is not None:
+        function = profile.wrap(function)
+    return await asyncio.to_thread(function, *args)
+
+
+@on_client_loop
+async def gather(*calls):
+    """
+    runs independent reads concurrently and waits for all of them
+
+    Parameters
+    -------------
+    calls : tuples of (coroutine function, arguments...)
+
+    Returns a list with the result of each call in the order given
+    """
+    return list(await asyncio.gather(*(call[0](*call[1:]) for call in calls)))
+
+
+@metrics.timed
+@on_client_loop
+async def live_documents(path):
+    """
+    returns the documents of a collection from the live cache, or None when it is
+    disabled, see data_utils.live_documents
+    """
+    if data_utils.live_cache is None:
+        return None
+    documents = data_utils.live_cache.peek(path)
+    if documents is not None:
+        return documents
+    # subscribing waits for the first snapshot of the collection
+    return await to_thread(data_utils.live_documents, path)
+
+
+@metrics.timed
+@on_client_loop
+async def get_page(query, fields, page_size=None, page_token=None):
+    """
+    reads one page of an ordered query, see data_utils.get_page
+    """
+    page_size = page_size or data_utils.PAGE_SIZE
+    cursor = data_utils.decode_page_token(page_token, fields)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    docs = [doc async for doc in query.limit(page_size + 1).stream()]
+    next_page_token = None
+    if len(docs) > page_size:
+        docs = docs[:page_size]
+        last = docs[-1]
+        next_page_token = data_utils.encode_page_token(
+            {
+                field: last.id if field == DOCUMENT_ID else last.get(field)
+                for field in fields
+            }
+        )
+    return docs, next_page_token
+
+
+@metrics.timed
+@on_client_loop
+async def get_activities():
+    """
+    retrieves activities from the database
+    results are shared with data_utils.get_activities and its caches
+
+    Displays a message if retrieving activities was unsuccessful
+    """
+    if data_utils.live_cache is None:
+        activities = data_utils.activity_cache.get("activities")
+        if activities is not None:
+            return [dict(a) for a in activities]
+    try:
+        documents = await live_documents(u"activities")
+        if documents is not None:
+            return [data for _, data in documents]
+        activities = [
+            doc.to_dict() async for doc in get_async_db().collection(u"activities").stream()
+        ]
+        if data_utils.live_cache is None:
+            data_utils.activity_cache.set("activities", activities)
+        return [dict(a) for a in activities]
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+@metrics.timed
+@on_client_loop
+async def get_patient(email):
+    """
+    retrieves a selected patients details from the database
+
+    Parameters
+    -------------
+    email : email address of patient
+
+    Displays a message if request was successful or not
+    """
+    try:
+        userid = session["userId"]
+        doc = await (
+            get_async_db().collection(u"patients")
+            .document(userid)
+            .collection(u"patient_details")
+            .document(email)
+            .get()
+        )
+        if doc.exists:
+            return doc.to_dict()
+        flash("No record found for patient.", "error")
+        return None
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return None
+
+
+@metrics.timed
+@on_client_loop
+async def get_patients_page(page_size=None, page_token=None):
+    """
+    retrieves one page of the patient list of the logged in medical personnel
+
+    Parameters
+    -------------
+    page_size : number of patients on a page, defaults to data_utils.PAGE_SIZE
+    page_token : token of the page to read, None reads the first page
+
+    Returns a tuple of the patients and the token of the next page.
+    Displays a message if retrieving patients was unsuccessful
+    """
+    try:
+        userid = session["userId"]
+        documents = await live_documents(u"patients/%s/patient_details" % userid)
+        if documents is not None:
+            return data_utils.live_page(documents, page_size, page_token)
+        query = (
+            get_async_db().collection(u"patients")
+            .document(userid)
+            .collection(u"patient_details")
+            .order_by(DOCUMENT_ID)
+        )
+        docs, next_page_token = await get_page(
+            query, [DOCUMENT_ID], page_size, page_token
+        )
+        return [doc.to_dict() for doc in docs], next_page_token
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return [], None
+
+
+@metrics.timed
+@on_client_loop
+async def get_patient_activities(email):
+    """
+    retrieves activities set for a patient from the database
+
+    Parameters
+    -------------
+    email : email address of patient
+
+    Displays a message if the request was unsuccessful
+    """
+    try:
+        documents = await live_documents(u"patient_activities/%s/activities" % email)
+        if documents is not None:
+            return [data for _, data in documents]
+        return [
+            doc.to_dict()
+            async for doc in get_async_db()
+            .collection(u"patient_activities")
+            .document(email)
+            .collection(u"activities")
+            .stream()
+        ]
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+@metrics.timed
+@on_client_loop
+async def retrieve_comments_page(activity, email, page_size=None, page_token=None):
+    """
+    retrieves one page of the comments made for a patients balance activity performance
+
+    Parameters
+    -------------
+    activity : name of activity to retrieve comments from
+    email : patients email address
+    page_size : number of comments on a page, defaults to data_utils.PAGE_SIZE
+    page_token : token of the page to read, None reads the newest comments
+
+    Returns a tuple of the comments and the token of the next page.
+    Displays a message if retrieving activity comments was unsuccessful
+    """
+    try:
+        query = (
+            get_async_db().collection(u"comments")
+            .document(email)
+            .collection(activity)
+            .order_by(u"date", direction=DESCENDING)
+            .order_by(DOCUMENT_ID, direction=DESCENDING)
+        )
+        docs, next_page_token = await get_page(
+            query, [u"date", DOCUMENT_ID], page_size, page_token
+        )
+        return [doc.to_dict() for doc in docs], next_page_token
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return [], None
+
+
+@metrics.timed
+@on_client_loop
+async def get_patient_comments(email):
+    """
+    retrieves the comments of every activity of a patient with one query of the
+    comment index, see data_utils.get_patient_comments
+
+    Parameters
+    -------------
+    email : patients email address
+
+    Results are shared with data_utils.comment_cache. An index missing for a
+    patient whose comments predate it is built by data_utils on a worker thread
+    Displays a message if retrieving comments was unsuccessful
+    """
+    threads = data_utils.comment_cache.get(email)
+    if threads is not None:
+        return data_utils.copy_threads(threads)
+    try:
+        index = get_async_db().collection(u"patient_comments").document(email)
+        comments = [
+            (doc.id, doc.to_dict())
+            async for doc in index.collection(u"comments")
+            .order_by(u"date", direction=DESCENDING)
+            .order_by(DOCUMENT_ID, direction=DESCENDING)
+            .limit(data_utils.COMMENT_LIMIT)
+            .stream()
+        ]
+        if not comments and not (await index.get()).exists:
+            comments = await to_thread(data_utils.build_comment_index, email)
+        threads = data_utils.group_comments(comments)
+        data_utils.comment_cache.set(email, threads)
+        return data_utils.copy_threads(threads)
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return {}
+
+
+@metrics.timed
+@on_client_loop
+async def get_patient_summary(email):
+    """
+    retrieves a patients progress summary from the database
+
+    Parameters
+    -------------
+    email : email address of patient
+
+    New scores are read on the event loop, the summary is stored and a missing or
+    outdated summary is rebuilt by data_utils on a worker thread
+    Displays a message if the request was unsuccessful
+    """
+    try:
+        doc = await get_async_db().collection(u"patient_summaries").document(email).get()
+        if doc.exists:
+            summary = doc.to_dict()
+            if summary.get("version") == progress_summary.SUMMARY_VERSION:
+                return await sync_patient_summary(email, summary)
+        return await to_thread(data_utils.rebuild_patient_summary, email)
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+@metrics.timed
+@on_client_loop
+async def sync_patient_summary(email, summary):
+    """
+    adds the scores written since a summary was last updated to it, see
+    data_utils.sync_patient_summary
+
+    Parameters
+    -------------
+    email : email address of patient
+    summary : the patients stored summary
+
+    The query of every activity and the count of the scores run concurrently
+    Returns the summary, stored again if new scores were added
+    """
+    names = data_utils.summary_activity_names(summary, await get_activities())
+    known = set(summary["last_ids"])
+    db = get_async_db()
+    queries = [
+        data_utils.activity_scores_query(
+            email, name, names, since=summary["last_date"], db=db
+        )
+        for name in names
+    ]
+    results = await asyncio.gather(
+        data_utils.scores_query(email, db=db).count().get(),
+        *(stream_documents(query) for query in queries)
+    )
+    docs = {}
+    for query_docs in results[1:]:
+        for doc in query_docs:
+            if doc.id not in known:
+                docs.setdefault(doc.id, doc)
+    if results[0][0][0].value != summary["sessions"] + len(docs):
+        return await to_thread(data_utils.rebuild_patient_summary, email)
+    if not docs:
+        return summary
+    return await to_thread(
+        data_utils.store_summary_scores, email, summary, list(docs.values())
+    )
+
+
+async def stream_documents(query):
+    return [doc async for doc in query.stream()]
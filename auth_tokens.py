@@ -0,0 +1,172 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+auth_tokens.py
+contains the verification of firebase id tokens
+
+a token is verified locally against the google signing keys, which are fetched
+once and kept until the max-age of their Cache-Control header passes, so checking
+the login of a request needs no round trip to firebase
+"""
+import base64
+import json
+import re
+import threading
+import time
+import urllib.request
+
+CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+
+ISSUER = "https://securetoken.google.com/"
+
+# seconds signing keys are kept when the response has no max-age
+DEFAULT_MAX_AGE = 3600
+
+# a token signed with an unknown key refetches the keys at most once in this
+# number of seconds, so made up key ids cannot cause a fetch on every request
+MIN_REFRESH_INTERVAL = 60
+
+# seconds a token is still accepted after its expiry time, and before its issue
+# time, to allow for the clocks of the server and firebase differing
+CLOCK_SKEW = 10
+
+
+class InvalidToken(Exception):
+    """
+    raised when an id token is malformed, has a bad signature or claims
+    """
+
+
+class TokenExpired(InvalidToken):
+    """
+    raised when an id token is valid but past its expiry time
+    """
+
+
+def unverified_claims(token):
+    """
+    returns the header and claims of a token without checking its signature
+    """
+    try:
+        header, payload = token.split(".")[:2]
+        return tuple(
+            json.loads(base64.urlsafe_b64decode(part + "=" * (-len(part) % 4)))
+            for part in (header, payload)
+        )
+    except Exception:
+        raise InvalidToken("Token is malformed")
+
+
+def fetch_certs(url=CERTS_URL):
+    """
+    returns the signing certificates at url and the number of seconds they may
+    be cached for
+
+    raises OSError, urllib's URLError and HTTPError included, when they cannot be
+    fetched and ValueError when the response is not json
+    """
+    with urllib.request.urlopen(url, timeout=10) as response:
+        certs = json.loads(response.read().decode("utf8"))
+        cache_control = response.headers.get("Cache-Control", "")
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return certs, int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class PublicKeyCache:
+    """
+    signing certificates keyed by key id, refetched once their max-age passes
+
+    when a refetch fails the certificates already held are kept and retried after
+    MIN_REFRESH_INTERVAL seconds, InvalidToken is raised if none were fetched yet
+
+    Parameters
+    -------------
+    fetch : function returning (certificates, max-age seconds)
+    timer : clock used for expiry, defaults to time.monotonic
+    """
+
+    def __init__(self, fetch=fetch_certs, timer=time.monotonic):
+        self.fetch = fetch
+        self.timer = timer
+        self.fetches = 0
+        self._certs = None
+        self._fetched = 0.0
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def certs(self, refresh=False):
+        """
+        returns the certificates, fetching them if they expired or refresh is set
+        """
+        with self._lock:
+            now = self.timer()
+            if refresh and now - self._fetched < MIN_REFRESH_INTERVAL:
+                refresh = False
+            if refresh or self._certs is None or now >= self._expires:
+                self.fetches += 1
+                try:
+                    certs, max_age = self.fetch()
+                except (OSError, ValueError):
+                    if self._certs is None:
+                        raise InvalidToken("Signing keys could not be fetched")
+                    self._fetched = now
+                    self._expires = now + MIN_REFRESH_INTERVAL
+                    return self._certs
+                self._certs = certs
+                self._fetched = now
+                self._expires = now + max_age
+            return self._certs
+
+
+class TokenVerifier:
+    """
+    verifies firebase id tokens of one firebase project
+
+    Parameters
+    -------------
+    project_id : id of the firebase project the tokens are issued for
+    keys : PublicKeyCache holding the signing certificates
+    """
+
+    def __init__(self, project_id, keys=None):
+        self.project_id = project_id
+        self.issuer = ISSUER + project_id
+        self.keys = keys or PublicKeyCache()
+
+    def verify(self, token):
+        """
+        returns the claims of a valid id token, the uid of the user is in "sub"
+
+        raises TokenExpired for an expired token, otherwise InvalidToken
+        """
+        from google.auth import jwt
+
+        header, claims = unverified_claims(token)
+        if header.get("alg") != "RS256":
+            raise InvalidToken("Token is not signed with RS256")
+        if claims.get("exp", 0) + CLOCK_SKEW < time.time():
+            raise TokenExpired("Token expired")
+        certs = self.keys.certs()
+        if header.get("kid") not in certs:
+            # the keys are rotated, a token signed with a new key refetches them once
+            certs = self.keys.certs(refresh=True)
+        try:
+            claims = jwt.decode(
+                token,
+                certs=certs,
+                audience=self.project_id,
+                clock_skew_in_seconds=CLOCK_SKEW,
+            )
+        except Exception as e:
+            if str(e).startswith("Token expired"):
+                raise TokenExpired(str(e))
+            raise InvalidToken(str(e))
+        if claims.get("iss") != self.issuer:
+            raise InvalidToken("Token has an incorrect issuer")
+        if not claims.get("sub"):
+            raise InvalidToken("Token has no subject")
+        return claims
@@ -0,0 +1,1002 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+backends.py
+contains the storage backends used by data_utils
+FirestoreBackend connects to the live firebase project
+LocalBackend keeps the same collection layout in a local sqlite database so the
+application can be run, tested and benchmarked without firebase credentials
+"""
+import os
+import json
+import asyncio
+import weakref
+import sqlite3
+import threading
+import hashlib
+import uuid
+import secrets
+import time
+import base64
+from datetime import datetime, timezone
+
+BACKEND_ENV = "BALANCE_BACKEND"
+LOCAL_DB_ENV = "BALANCE_LOCAL_DB"
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+# field path ordering documents by their id, the same as firestore FieldPath.document_id()
+DOCUMENT_ID = "__name__"
+
+# project id in the audience and issuer of local id tokens
+LOCAL_PROJECT_ID = "balance-local"
+
+_backend = None
+_backend_lock = threading.Lock()
+
+_local_key = None
+_local_key_lock = threading.Lock()
+
+
+class Backend:
+    """
+    storage backend interface
+
+    db : firestore style client exposing collection() and batch()
+    auth : pyrebase style client exposing create_user_with_email_and_password()
+        and sign_in_with_email_and_password()
+    """
+
+    name = None
+
+    def __init__(self, db, auth):
+        self.db = db
+        self.auth = auth
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def async_db(self):
+        """
+        returns the asyncio client of the backend for the running event loop
+
+        a client is created per event loop, as its connections belong to the loop
+        they were opened on, async_data_utils runs its reads on one long-lived loop
+        so a process uses a single client
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = self.create_async_db()
+        return client
+
+    def create_async_db(self):
+        raise NotImplementedError
+
+    def verify_id_token(self, token):
+        """
+        returns the claims of a valid id token issued by auth, the uid is in "sub"
+
+        raises auth_tokens.TokenExpired or auth_tokens.InvalidToken
+        """
+        return self.token_verifier().verify(token)
+
+    def token_verifier(self):
+        raise NotImplementedError
+
+    def run_transaction(self, function):
+        """
+        runs function(transaction) as a transaction and returns its result
+
+        reads are made with reference.get(transaction=transaction) and writes with
+        transaction.set/update/delete, which are committed together when it returns
+        """
+        raise NotImplementedError
+
+
+class FirestoreBackend(Backend):
+    """
+    backend connected to the firebase project described by firebase_sdk.json and config.py
+    """
+
+    name = "firestore"
+
+    def __init__(self, sdk_file="firebase_sdk.json"):
+        import firebase_admin
+        from firebase_admin import credentials
+        from firebase_admin import firestore
+        import pyrebase
+        import config as cfg
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(sdk_file)
+            firebase_admin.initialize_app(cred)
+        firebase = pyrebase.initialize_app(cfg.firebaseConfig)
+        self.storage = firebase.storage()
+        self._verifier = None
+        super().__init__(firestore.client(), firebase.auth())
+
+    def create_async_db(self):
+        import firebase_admin
+        from google.cloud.firestore import AsyncClient
+
+        app = firebase_admin.get_app()
+        return AsyncClient(
+            credentials=app.credential.get_credential(), project=app.project_id
+        )
+
+    def token_verifier(self):
+        import firebase_admin
+        from auth_tokens import TokenVerifier
+
+        if self._verifier is None:
+            self._verifier = TokenVerifier(firebase_admin.get_app().project_id)
+        return self._verifier
+
+    def run_transaction(self, function):
+        from firebase_admin import firestore
+
+        return firestore.transactional(function)(self.db.transaction())
+
+
+class LocalBackend(Backend):
+    """
+    backend storing documents and users in a local sqlite database
+
+    Parameters
+    -------------
+    path : sqlite database file, ":memory:" keeps everything in process
+    """
+
+    name = "local"
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.lock, self.connection:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    parent TEXT NOT NULL,
+                    collection TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (parent, id)
+                );
+                CREATE INDEX IF NOT EXISTS documents_collection
+                    ON documents (collection);
+                CREATE TABLE IF NOT EXISTS users (
+                    email TEXT PRIMARY KEY,
+                    local_id TEXT NOT NULL,
+                    password_hash TEXT NOT NULL
+                );
+                """
+            )
+        super().__init__(LocalClient(self), LocalAuth(self))
+
+    def create_async_db(self):
+        return LocalAsyncClient(self.db)
+
+    def token_verifier(self):
+        return self.auth.verifier
+
+    def run_transaction(self, function):
+        # the backend lock is held throughout, so local transactions never conflict
+        with self.lock:
+            transaction = LocalWriteBatch(self.db)
+            result = function(transaction)
+            transaction.commit()
+            return result
+
+
+def get_backend():
+    """
+    returns the active backend, creating it on first use
+
+    the backend is chosen by the BALANCE_BACKEND environment variable
+    "firestore" (default) or "local", BALANCE_LOCAL_DB sets the local database file
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(os.environ.get(BACKEND_ENV, "firestore"))
+    return _backend
+
+
+def set_backend(backend):
+    """
+    replaces the active backend, used by tests and benchmarks
+
+    Parameters
+    -------------
+    backend : Backend instance, None resets to the configured default
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def create_backend(name):
+    """
+    creates a backend by name
+
+    Parameters
+    -------------
+    name : "firestore" or "local"
+    """
+    if name == "firestore":
+        return FirestoreBackend()
+    if name == "local":
+        return LocalBackend(os.environ.get(LOCAL_DB_ENV, ":memory:"))
+    raise ValueError("Unknown storage backend: %s" % name)
+
+
+class LocalBackendError(Exception):
+    """
+    error raised by the local backend, args[1] holds the same json body as a pyrebase HTTPError
+    """
+
+    def __init__(self, message):
+        super().__init__(message, json.dumps({"error": {"code": 400, "message": message}}))
+
+
+class LocalAuth:
+    """
+    pyrebase style email/password authentication stored in the local database
+
+    id tokens are RS256 tokens with the claims of firebase id tokens, signed with
+    a key generated once per process, so they are verified like firebase tokens
+    """
+
+    # seconds an id token is valid for, the same as firebase
+    token_lifetime = 3600
+
+    def __init__(self, backend):
+        from auth_tokens import PublicKeyCache, TokenVerifier, DEFAULT_MAX_AGE
+
+        self.backend = backend
+        self.refresh_tokens = {}
+        self.verifier = TokenVerifier(
+            LOCAL_PROJECT_ID,
+            PublicKeyCache(lambda: (_local_signing_key()[1], DEFAULT_MAX_AGE)),
+        )
+
+    def create_token(self, local_id, email):
+        """
+        returns a signed id token for a user
+        """
+        from google.auth import jwt
+        from auth_tokens import ISSUER
+
+        signer = _local_signing_key()[0]
+        now = int(time.time())
+        return jwt.encode(
+            signer,
+            {
+                "iss": ISSUER + LOCAL_PROJECT_ID,
+                "aud": LOCAL_PROJECT_ID,
+                "sub": local_id,
+                "user_id": local_id,
+                "email": email,
+                "auth_time": now,
+                "iat": now,
+                "exp": now + self.token_lifetime,
+            },
+        ).decode("utf8")
+
+    def _login(self, local_id, email):
+        refresh_token = secrets.token_hex(32)
+        self.refresh_tokens[refresh_token] = (local_id, email)
+        return {
+            "localId": local_id,
+            "email": email,
+            "idToken": self.create_token(local_id, email),
+            "refreshToken": refresh_token,
+            "expiresIn": str(self.token_lifetime),
+        }
+
+    def refresh(self, refresh_token):
+        """
+        returns a new id token for a refresh token, like pyrebase auth.refresh
+        """
+        if refresh_token not in self.refresh_tokens:
+            raise LocalBackendError("INVALID_REFRESH_TOKEN")
+        local_id, email = self.refresh_tokens.pop(refresh_token)
+        login = self._login(local_id, email)
+        return {
+            "userId": local_id,
+            "idToken": login["idToken"],
+            "refreshToken": login["refreshToken"],
+        }
+
+    def create_user_with_email_and_password(self, email, password):
+        local_id = uuid.uuid4().hex[:28]
+        try:
+            with self.backend.lock, self.backend.connection:
+                self.backend.connection.execute(
+                    "INSERT INTO users (email, local_id, password_hash) VALUES (?, ?, ?)",
+                    (email, local_id, _hash_password(email, password)),
+                )
+        except sqlite3.IntegrityError:
+            raise LocalBackendError("EMAIL_EXISTS")
+        return self._login(local_id, email)
+
+    def sign_in_with_email_and_password(self, email, password):
+        with self.backend.lock:
+            row = self.backend.connection.execute(
+                "SELECT local_id, password_hash FROM users WHERE email = ?", (email,)
+            ).fetchone()
+        if row is None:
+            raise LocalBackendError("EMAIL_NOT_FOUND")
+        if row[1] != _hash_password(email, password):
+            raise LocalBackendError("INVALID_PASSWORD")
+        return self._login(row[0], email)
+
+
+def _local_signing_key():
+    """
+    returns the signer of local id tokens and the public key certificates by key id
+    """
+    global _local_key
+    with _local_key_lock:
+        if _local_key is None:
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.hazmat.primitives.asymmetric import rsa
+            from google.auth import crypt
+
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            private_pem = key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+            public_pem = key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+            key_id = uuid.uuid4().hex
+            _local_key = (
+                crypt.RSASigner.from_string(private_pem, key_id=key_id),
+                {key_id: public_pem.decode("utf8")},
+            )
+        return _local_key
+
+
+def _hash_password(email, password):
+    return hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf8"), email.encode("utf8"), 10000
+    ).hex()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _split_field_path(field_path):
+    """
+    splits a firestore field path such as `Tandem Stance`.date_set into its parts
+    """
+    parts = []
+    current = ""
+    quoted = False
+    for char in field_path:
+        if char == "`":
+            quoted = not quoted
+        elif char == "." and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+_MISSING = object()
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in _split_field_path(field_path):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, field_path, value):
+    parts = _split_field_path(field_path)
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _project(data, field_paths):
+    projected = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(projected, field_path, value)
+    return projected
+
+
+def _type_rank(value):
+    # firestore orders mixed types null < bool < number < string < bytes < array < map
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 6
+    return 7
+
+
+def _compare(a, b):
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 7:
+        a, b = sorted(a.items()), sorted(b.items())
+    if a == b:
+        return 0
+    return -1 if a < b else 1
+
+
+_OPERATORS = {
+    "==": lambda a, b: _compare(a, b) == 0,
+    "!=": lambda a, b: _compare(a, b) != 0,
+    "<": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) < 0,
+    "<=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) <= 0,
+    ">": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) > 0,
+    ">=": lambda a, b: _type_rank(a) == _type_rank(b) and _compare(a, b) >= 0,
+    "in": lambda a, b: any(_compare(a, v) == 0 for v in b),
+    "not-in": lambda a, b: all(_compare(a, v) != 0 for v in b),
+    "array-contains": lambda a, b: isinstance(a, list) and b in a,
+    "array-contains-any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+
+def _encode(data):
+    return json.dumps(data, default=_encode_value)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError("Cannot store value of type %s" % type(value).__name__)
+
+
+def _decode(text):
+    return json.loads(text, object_hook=_decode_value)
+
+
+def _decode_value(value):
+    if "__datetime__" in value and len(value) == 1:
+        return datetime.fromisoformat(value["__datetime__"])
+    if "__bytes__" in value and len(value) == 1:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+class LocalDocumentSnapshot:
+    """
+    firestore style snapshot of a local document
+    """
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return _decode(_encode(self._data))
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+class LocalDocumentReference:
+    """
+    firestore style reference to a local document
+    """
+
+    def __init__(self, client, parent, doc_id):
+        self._client = client
+        self._parent = parent
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return self._parent + "/" + self.id
+
+    @property
+    def parent(self):
+        return LocalCollectionReference(self._client, self._parent)
+
+    def collection(self, name):
+        return LocalCollectionReference(self._client, self.path + "/" + name)
+
+    def collections(self):
+        return [
+            LocalCollectionReference(self._client, parent)
+            for parent in self._client._collections(self.path)
+        ]
+
+    def get(self, field_paths=None, transaction=None):
+        snapshot = LocalDocumentSnapshot(
+            self, self._client._read(self._parent, self.id)
+        )
+        if field_paths is not None and snapshot.exists:
+            snapshot._data = _project(snapshot._data, field_paths)
+        return snapshot
+
+    def set(self, data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def update(self, data):
+        batch = self._client.batch()
+        batch.update(self, data)
+        batch.commit()
+
+    def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        batch.commit()
+
+
+class LocalQuery:
+    """
+    firestore style query over the documents of a local collection
+    """
+
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(
+        self,
+        client,
+        parent,
+        filters=(),
+        orders=(),
+        limit=None,
+        cursor=None,
+        projection=None,
+    ):
+        self._client = client
+        self._parent = parent
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        values = dict(
+            filters=self._filters,
+            orders=self._orders,
+            limit=self._limit,
+            cursor=self._cursor,
+            projection=self._projection,
+        )
+        values.update(changes)
+        return LocalQuery(self._client, self._parent, **values)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def where(self, field_path, op_string, value):
+        if op_string not in _OPERATORS:
+            raise ValueError("Unsupported operator: %s" % op_string)
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def count(self, alias=None):
+        return LocalAggregationQuery(self, alias or "count")
+
+    def _documents(self):
+        return self._client._list(self._parent)
+
+    def on_snapshot(self, callback):
+        """
+        calls callback(docs, changes, read_time) with the query results now and
+        after every commit writing to the queried collection, like firestore watch
+        """
+        return self._client._listen(self, callback)
+
+    def _matching(self):
+        # snapshots passing the filters and holding every ordered field, unsorted
+        snapshots = []
+        for parent, doc_id, data in self._documents():
+            reference = LocalDocumentReference(self._client, parent, doc_id)
+            snapshot = LocalDocumentSnapshot(reference, data)
+            if all(
+                _snapshot_value(snapshot, field) is not _MISSING
+                and _OPERATORS[op](_snapshot_value(snapshot, field), value)
+                for field, op, value in self._filters
+            ) and all(
+                _snapshot_value(snapshot, field) is not _MISSING
+                for field, _ in self._orders
+            ):
+                snapshots.append(snapshot)
+        return snapshots
+
+    def stream(self):
+        snapshots = self._matching()
+        snapshots.sort(key=lambda snapshot: snapshot.reference.path)
+        for field, direction in reversed(self._orders):
+            snapshots.sort(
+                key=_SortKey.factory(field), reverse=direction == DESCENDING,
+            )
+        if self._cursor is not None:
+            snapshots = [s for s in snapshots if self._after_cursor(s)]
+        if self._limit is not None:
+            snapshots = snapshots[: self._limit]
+        if self._projection is not None:
+            for snapshot in snapshots:
+                snapshot._data = _project(snapshot._data, self._projection)
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+    def _after_cursor(self, snapshot):
+        cursor = self._cursor
+        for field, direction in self._orders:
+            if isinstance(cursor, LocalDocumentSnapshot):
+                cursor_value = _snapshot_value(cursor, field)
+            elif field == DOCUMENT_ID and field in cursor:
+                cursor_value = getattr(cursor[field], "id", cursor[field])
+            else:
+                cursor_value = _get_field(cursor, field)
+            result = _compare(_snapshot_value(snapshot, field), cursor_value)
+            if direction == DESCENDING:
+                result = -result
+            if result != 0:
+                return result > 0
+        if isinstance(cursor, LocalDocumentSnapshot):
+            return snapshot.reference.path > cursor.reference.path
+        return False
+
+
+class LocalAggregationQuery:
+    """
+    count aggregation of a local query, get returns results in the form of the
+    firestore AggregationQuery
+    """
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        # like firestore the documents are counted without being returned, cursors
+        # are not supported by the local aggregation
+        count = len(self._query._matching())
+        if self._query._limit is not None:
+            count = min(count, self._query._limit)
+        return [[LocalAggregationResult(self._alias, count, _now())]]
+
+
+class LocalAggregationResult:
+    def __init__(self, alias, value, read_time):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+def _snapshot_value(snapshot, field):
+    if field == DOCUMENT_ID:
+        return snapshot.reference.id
+    return _get_field(snapshot._data, field)
+
+
+class _SortKey:
+    """
+    sort key wrapper ordering values the same way firestore does
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return _compare(self.value, other.value) < 0
+
+    @staticmethod
+    def factory(field):
+        return lambda snapshot: _SortKey(_snapshot_value(snapshot, field))
+
+
+class LocalCollectionReference(LocalQuery):
+    """
+    firestore style reference to a local collection
+    """
+
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._parent.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return LocalDocumentReference(self._client, self._parent, document_id)
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.set(document_data)
+        return _now(), reference
+
+
+class LocalWriteBatch:
+    """
+    firestore style write batch, committed in a single sqlite transaction
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference, field_updates, None))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, None))
+
+    def commit(self):
+        self._client._commit(self._writes)
+        self._writes = []
+        return []
+
+
+class LocalClient:
+    """
+    firestore style client for the local backend
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._listeners = {}
+        self._listeners_lock = threading.Lock()
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def document(self, path):
+        parent, doc_id = path.rsplit("/", 1)
+        return LocalDocumentReference(self, parent, doc_id)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
+
+    def _read(self, parent, doc_id):
+        with self._backend.lock:
+            row = self._backend.connection.execute(
+                "SELECT data FROM documents WHERE parent = ? AND id = ?",
+                (parent, doc_id),
+            ).fetchone()
+        return None if row is None else _decode(row[0])
+
+    def _list(self, parent):
+        with self._backend.lock:
+            rows = self._backend.connection.execute(
+                "SELECT parent, id, data FROM documents WHERE parent = ?", (parent,)
+            ).fetchall()
+        return [(row[0], row[1], _decode(row[2])) for row in rows]
+
+    def _collections(self, path):
+        # paths of the collections directly below a document
+        prefix = path + "/"
+        with self._backend.lock:
+            rows = self._backend.connection.execute(
+                "SELECT DISTINCT parent FROM documents WHERE substr(parent, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+        return sorted(row[0] for row in rows if "/" not in row[0][len(prefix) :])
+
+    def _listen(self, query, callback):
+        watch = LocalWatch(self)
+        with self._listeners_lock:
+            self._listeners[watch] = (query, callback)
+        callback(query.get(), [], _now())
+        return watch
+
+    def _notify(self, parents):
+        with self._listeners_lock:
+            listeners = [
+                listener
+                for listener in self._listeners.values()
+                if listener[0]._parent in parents
+            ]
+        for query, callback in listeners:
+            callback(query.get(), [], _now())
+
+    def _commit(self, writes):
+        connection = self._backend.connection
+        with self._backend.lock, connection:
+            for kind, reference, data, merge in writes:
+                parent, doc_id = reference._parent, reference.id
+                if kind == "delete":
+                    connection.execute(
+                        "DELETE FROM documents WHERE parent = ? AND id = ?",
+                        (parent, doc_id),
+                    )
+                    continue
+                row = connection.execute(
+                    "SELECT data FROM documents WHERE parent = ? AND id = ?",
+                    (parent, doc_id),
+                ).fetchone()
+                if kind == "update":
+                    if row is None:
+                        raise LocalBackendError("NOT_FOUND: No document to update")
+                    document = _decode(row[0])
+                    for field_path, value in data.items():
+                        _set_field(document, field_path, value)
+                elif merge and row is not None:
+                    document = _decode(row[0])
+                    document.update(data)
+                else:
+                    document = data
+                connection.execute(
+                    "INSERT OR REPLACE INTO documents (parent, collection, id, data)"
+                    " VALUES (?, ?, ?, ?)",
+                    (parent, parent.rsplit("/", 1)[-1], doc_id, _encode(document)),
+                )
+        self._notify(set(reference._parent for _, reference, _, _ in writes))
+
+
+class LocalWatch:
+    """
+    listener registered by on_snapshot, unsubscribe stops its callbacks
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._client._listeners_lock:
+            self._client._listeners.pop(self, None)
+
+
+class LocalAsyncClient:
+    """
+    firestore AsyncClient style client for the local backend
+
+    reads and writes run the local client on a worker thread, so they never
+    block the event loop
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, path):
+        return LocalAsyncQuery(self._client.collection(path))
+
+    def document(self, path):
+        return LocalAsyncDocumentReference(self._client.document(path))
+
+    async def get_all(self, references):
+        for reference in references:
+            yield await reference.get()
+
+
+class LocalAsyncDocumentReference:
+    def __init__(self, reference):
+        self._reference = reference
+
+    @property
+    def id(self):
+        return self._reference.id
+
+    @property
+    def path(self):
+        return self._reference.path
+
+    def collection(self, name):
+        return LocalAsyncQuery(self._reference.collection(name))
+
+    async def get(self, field_paths=None):
+        return await asyncio.to_thread(self._reference.get, field_paths)
+
+    async def set(self, document_data, merge=False):
+        return await asyncio.to_thread(self._reference.set, document_data, merge)
+
+    async def update(self, field_updates):
+        return await asyncio.to_thread(self._reference.update, field_updates)
+
+    async def delete(self):
+        return await asyncio.to_thread(self._reference.delete)
+
+
+class LocalAsyncQuery:
+    def __init__(self, query):
+        self._query = query
+
+    @property
+    def id(self):
+        return self._query.id
+
+    def document(self, document_id=None):
+        return LocalAsyncDocumentReference(self._query.document(document_id))
+
+    def select(self, field_paths):
+        return LocalAsyncQuery(self._query.select(field_paths))
+
+    def where(self, field_path, op_string, value):
+        return LocalAsyncQuery(self._query.where(field_path, op_string, value))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return LocalAsyncQuery(self._query.order_by(field_path, direction=direction))
+
+    def limit(self, count):
+        return LocalAsyncQuery(self._query.limit(count))
+
+    def start_after(self, document_fields_or_snapshot):
+        return LocalAsyncQuery(self._query.start_after(document_fields_or_snapshot))
+
+    def count(self, alias=None):
+        return LocalAsyncAggregationQuery(self._query.count(alias))
+
+    async def add(self, document_data, document_id=None):
+        return await asyncio.to_thread(self._query.add, document_data, document_id)
+
+    async def get(self):
+        return await asyncio.to_thread(self._query.get)
+
+    async def stream(self):
+        for snapshot in await self.get():
+            yield snapshot
+
+
+class LocalAsyncAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+
+    async def get(self):
+        return await asyncio.to_thread(self._query.get)
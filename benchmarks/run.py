@@ -0,0 +1,354 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+run.py
+contains the benchmark suite for the analytics and chart rendering pipeline
+
+each benchmark is timed on a synthetic patient at every scale and compared with
+the stored baseline, a benchmark slower than its baseline by more than the
+threshold is reported as a regression
+
+    python -m benchmarks.run                          # 10, 100 and 1000 sessions
+    python -m benchmarks.run --sessions 10 10000      # other scales
+    python -m benchmarks.run --only activity_stats scores_frame
+    python -m benchmarks.run --update                 # store results as the baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DEFAULT_SESSIONS = [10, 100, 1000]
+
+# a benchmark whose median is more than this fraction above its baseline regresses
+THRESHOLD = 0.5
+
+# seconds of timer noise allowed on top of the threshold, so very short
+# benchmarks do not fail on scheduling jitter
+MIN_SLACK = 0.002
+
+USER = {
+    "email": "bench@email.com",
+    "password": "bench123",
+    "confirm_password": "bench123",
+    "first_name": "Bench",
+    "last_name": "Mark",
+}
+
+PATIENT = "synthetic@email.com"
+
+ACTIVITY = "Tandem Stance"
+
+
+def timeit(function, repeat, setup=None):
+    """
+    returns the durations in seconds of repeat calls of function, after one
+    untimed call which warms caches and renderers
+
+    setup is called untimed before every call when given
+    """
+    function()
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+class Environment:
+    """
+    local backend holding one synthetic patient and a logged in test client
+
+    Parameters
+    -------------
+    sessions : number of score documents of the patient
+    samples : number of accelerometer samples in each trace
+    """
+
+    def __init__(self, sessions, samples):
+        os.environ.setdefault("BALANCE_BACKEND", "local")
+        import app as webapp
+        import data_utils
+        from backends import LocalBackend
+        from charts import ChartStore
+        from benchmarks import synthetic
+
+        self.webapp = webapp
+        self.backend = LocalBackend()
+        self.chart_dir = tempfile.mkdtemp(prefix="balance_bench_")
+        self.previous_store = webapp.chart_store
+        webapp.chart_store = ChartStore(self.chart_dir)
+        self.app = webapp.create_app(
+            {"TESTING": True, "WARM_CHARTS": False}, self.backend
+        )
+        data_utils.clear_caches()
+        webapp.start_chart_workers()
+
+        self.client = self.app.test_client()
+        self.client.post("/register", data=USER)
+        self.client.post("/login", data=USER)
+        with self.client.session_transaction() as session:
+            session["user_email"] = PATIENT
+            userid = session["userId"]
+
+        self.scores = synthetic.make_sessions(sessions, samples)
+        synthetic.populate(userid, PATIENT, self.scores)
+
+    def clear_charts(self):
+        """
+        removes every rendered chart, so the next chart request renders again
+        """
+        for name in os.listdir(self.chart_dir):
+            os.remove(os.path.join(self.chart_dir, name))
+
+    def close(self):
+        import data_utils
+        from backends import set_backend
+
+        self.client.get("/logout")
+        self.webapp.chart_store = self.previous_store
+        set_backend(None)
+        data_utils.clear_caches()
+        shutil.rmtree(self.chart_dir, ignore_errors=True)
+
+
+def benchmarks(env):
+    """
+    returns a map of benchmark name to the function it times in an environment,
+    or to a tuple of the function and a setup called untimed before every call
+
+    the page routes drawing charts are timed with an empty chart store, so they
+    render their charts on every call, and again with the charts already stored
+    """
+    import charts
+    import data_utils
+    import summary as progress_summary
+
+    with env.app.test_request_context():
+        docs = list(data_utils.scores_query(PATIENT).stream())
+        activity_names = [a["name"] for a in data_utils.get_activities() or []]
+        activity_df = data_utils.get_patient_scores_frame(PATIENT, [ACTIVITY], True)
+        summary = data_utils.get_patient_summary(PATIENT)
+    activity_df["date_set"] = activity_df["date_set"].dt.date
+    last_date = progress_summary.last_date(summary)
+    progress = {
+        "week_counts": progress_summary.daily_counts(
+            summary, last_date - timedelta(6), last_date
+        ),
+        "percentages": progress_summary.activity_stats(summary, activity_names),
+        "daily_rows": progress_summary.daily_activity_rows(summary),
+    }
+
+    def read_scores_frame():
+        data_utils.score_cache.invalidate()
+        with env.app.test_request_context():
+            data_utils.get_patient_scores_frame(PATIENT)
+
+    def request(url):
+        def get():
+            response = env.client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError("%s returned %s" % (url, response.status_code))
+
+        return get
+
+    return {
+        "scores_frame": lambda: data_utils.scores_frame(docs),
+        "activity_stats": lambda: progress_summary.activity_stats(
+            summary, activity_names
+        ),
+        "daily_activity_rows": lambda: progress_summary.daily_activity_rows(summary),
+        "read_scores_frame": read_scores_frame,
+        "build_summary": lambda: progress_summary.build_summary(
+            doc.to_dict() for doc in docs
+        ),
+        "render_week_activity": lambda: charts.render_week_activity(
+            progress["week_counts"]
+        ),
+        "render_activities_completed": lambda: charts.render_activities_completed(
+            progress["percentages"]
+        ),
+        "render_results_sunburst": lambda: charts.render_results_sunburst(
+            progress["daily_rows"]
+        ),
+        "render_activity_sunburst": lambda: charts.render_activity_sunburst(
+            activity_df
+        ),
+        "render_activity_average": lambda: charts.render_activity_average(activity_df),
+        "render_activity_movements": lambda: charts.render_activity_movements(
+            activity_df, ACTIVITY
+        ),
+        "route_view_activity_progress": (
+            request("/view_activity_progress"),
+            env.clear_charts,
+        ),
+        "route_view_selected_activity": (
+            request("/view_selected_activity/" + ACTIVITY),
+            env.clear_charts,
+        ),
+        "route_view_activity_progress_cached": request("/view_activity_progress"),
+        "route_view_selected_activity_cached": request(
+            "/view_selected_activity/" + ACTIVITY
+        ),
+        "route_patient_details": request("/patient_details"),
+        "route_progress_chart_data": request("/api/progress"),
+        "route_activity_chart_data": request("/api/activity/" + ACTIVITY),
+    }
+
+
+def run(sessions=DEFAULT_SESSIONS, repeat=5, samples=500, only=None, output=print):
+    """
+    runs the benchmarks at every scale
+
+    Parameters
+    -------------
+    sessions : list of numbers of sessions of the synthetic patient
+    repeat : number of timed calls of each benchmark
+    samples : number of accelerometer samples in each trace
+    only : names of the benchmarks to run, every benchmark when None
+    output : function printing progress lines
+
+    Returns
+    ------------
+    Map of "name[sessions]" to the median and minimum duration in seconds
+    """
+    results = {}
+    for count in sessions:
+        env = Environment(count, samples)
+        try:
+            for name, function in benchmarks(env).items():
+                if only and name not in only:
+                    continue
+                setup = None
+                if isinstance(function, tuple):
+                    function, setup = function
+                durations = timeit(function, repeat, setup)
+                key = "%s[%d]" % (name, count)
+                results[key] = {
+                    "median": statistics.median(durations),
+                    "min": min(durations),
+                }
+                output("%-45s %10.2f ms" % (key, results[key]["median"] * 1000))
+        finally:
+            env.close()
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_slack=MIN_SLACK):
+    """
+    compares benchmark results with a baseline
+
+    Parameters
+    -------------
+    results : results returned by run
+    baseline : map of "name[sessions]" to baseline median seconds
+    threshold : fraction a median may exceed its baseline by
+    min_slack : seconds a median may exceed its baseline by regardless of threshold
+
+    Returns a list of (key, median, baseline median) tuples of the regressions,
+    benchmarks missing from the baseline are not compared
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        limit = baseline[key] * (1 + threshold) + min_slack
+        if result["median"] > limit:
+            regressions.append((key, result["median"], baseline[key]))
+    return regressions
+
+
+def environment(samples):
+    """
+    returns the description of the machine benchmarks run on, stored with the
+    baseline as medians are only comparable on the same kind of machine
+    """
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processors": os.cpu_count(),
+        "samples": samples,
+    }
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def load_baseline_environment(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get("environment")
+
+
+def save_baseline(results, samples, path=BASELINE_FILE):
+    """
+    stores the medians of a run as the baseline, keeping the baselines of
+    benchmarks that were not run
+    """
+    baseline = load_baseline(path)
+    baseline.update({key: round(r["median"], 6) for key, r in results.items()})
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "environment": environment(samples),
+                "results": dict(sorted(baseline.items())),
+            },
+            f,
+            indent=2,
+        )
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balance Health benchmarks")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--only", nargs="+")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.sessions, args.repeat, args.samples, args.only)
+    if args.update:
+        save_baseline(results, args.samples, args.baseline)
+        print("Baseline written to %s" % args.baseline)
+        return 0
+
+    baseline_environment = load_baseline_environment(args.baseline)
+    if baseline_environment not in (None, environment(args.samples)):
+        # the timings of another machine are not comparable, only report them
+        print(
+            "Baseline was recorded on %s, this run is on %s, not comparing"
+            % (baseline_environment, environment(args.samples))
+        )
+        return 0
+    regressions = compare(results, load_baseline(args.baseline), args.threshold)
+    for key, median, baseline in regressions:
+        print(
+            "REGRESSION %s: %.2f ms, baseline %.2f ms"
+            % (key, median * 1000, baseline * 1000)
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
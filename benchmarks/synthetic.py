@@ -0,0 +1,137 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+synthetic.py
+contains methods for generating synthetic patients, score histories and
+accelerometer traces for the benchmarks
+
+the data is generated from a seeded random number generator, so every run of a
+benchmark at the same scale works on identical data
+"""
+import random
+from datetime import date, timedelta
+import math
+
+import data_utils
+import summary as progress_summary
+
+ACTIVITY_NAMES = [
+    "Stand with your feet side-by-side",
+    "Instep Stance",
+    "Tandem Stance",
+    "Stand on one foot",
+]
+
+
+def make_trace(rng, samples):
+    """
+    returns a synthetic accelerometer trace, a slow sway with sensor noise and an
+    occasional stumble
+    """
+    sway = rng.uniform(0.05, 0.4)
+    period = rng.uniform(40, 120)
+    stumble = rng.randrange(samples) if rng.random() < 0.2 else None
+    trace = []
+    for i in range(samples):
+        value = 1.0 + sway * math.sin(i / period * 2 * math.pi) + rng.gauss(0, 0.02)
+        if stumble is not None and stumble <= i < stumble + 10:
+            value += rng.uniform(0.5, 1.5)
+        trace.append(round(value, 4))
+    return trace
+
+
+def make_entry(rng, activity, day, samples):
+    """
+    returns the score entry of one attempt at an activity
+    """
+    trace = make_trace(rng, samples)
+    return {
+        "activityName": activity,
+        "date_set": day.strftime("%Y-%m-%d"),
+        "max_value": max(trace),
+        "min_value": min(trace),
+        "avg_value": round(sum(trace) / len(trace), 4),
+        "completed": max(trace) < 2.0,
+        "acc_data": trace,
+    }
+
+
+def make_sessions(sessions, samples=500, seed=0, end=None):
+    """
+    returns a patients synthetic score history
+
+    Parameters
+    -------------
+    sessions : number of score documents, one per session
+    samples : number of accelerometer samples in each trace
+    seed : random seed
+    end : date of the last session, defaults to today
+
+    Returns a list of score documents, each a map of activity name to score
+    entry holding one to four activities. Sessions are spread over the days
+    before end, up to three a day
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    scores = []
+    for i in range(sessions):
+        day = end - timedelta((sessions - 1 - i) // 3)
+        activities = rng.sample(ACTIVITY_NAMES, rng.randint(1, len(ACTIVITY_NAMES)))
+        scores.append(
+            {activity: make_entry(rng, activity, day, samples) for activity in activities}
+        )
+    return scores
+
+
+def populate(userid, email, scores, sample_rate=50.0):
+    """
+    writes a synthetic patient and their score history to the active storage backend
+
+    Parameters
+    -------------
+    userid : id of the medical personnel the patient belongs to
+    email : email address of the patient
+    scores : score documents, see make_sessions
+    sample_rate : accelerometer samples per second
+
+    The scores are stored the same way as data_utils.add_patient_score stores
+    them, with the traces split out and a summary, but written in batches
+    """
+    db = data_utils.get_db()
+    db.collection(u"patients").document(userid).collection(
+        u"patient_details"
+    ).document(email).set(
+        {
+            u"firstname": "Synthetic",
+            u"lastname": "Patient",
+            u"email": email,
+            u"D.O.B": "1950-01-01",
+            u"condition": "none",
+        }
+    )
+    for activity in ACTIVITY_NAMES:
+        db.collection(u"activities").document(activity).set(
+            {u"name": activity, u"description": "hold the pose", u"time_limit": 30}
+        )
+        db.collection(u"patient_activities").document(email).collection(
+            u"activities"
+        ).document(activity).set({u"name": activity})
+
+    patient_scores = db.collection(u"patient_scores").document(email)
+    writes = []
+    stored = []
+    for i, score in enumerate(scores):
+        doc_id = "session%06d" % i
+        score_doc, trace_writes = data_utils.split_traces(
+            patient_scores, doc_id, score, sample_rate
+        )
+        writes.append((patient_scores.collection(u"scores").document(doc_id), score_doc))
+        writes += trace_writes
+        stored.append((doc_id, score_doc))
+    data_utils.commit_writes(writes)
+    db.collection(u"patient_summaries").document(email).set(
+        progress_summary.build_summary(
+            [score_doc for _, score_doc in stored], [doc_id for doc_id, _ in stored]
+        )
+    )
@@ -0,0 +1,656 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+charts.py
+contains methods for rendering a patients balance performance charts to png images
+and the chart store used to keep rendered charts between requests
+
+pandas, numpy, matplotlib and plotly are imported by the functions using them, so
+they are only loaded once a chart is first rendered
+"""
+import os
+import io
+import json
+import hashlib
+import hmac
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import profiling
+
+CHART_DIR_ENV = "BALANCE_CHART_DIR"
+
+# seconds a stored chart is kept after it was last served
+CHART_MAX_AGE = float(os.environ.get("BALANCE_CHART_MAX_AGE", 7 * 24 * 3600))
+
+# bytes the chart store may hold, the least recently served charts are removed first
+CHART_MAX_BYTES = int(os.environ.get("BALANCE_CHART_MAX_BYTES", 512 * 1024 * 1024))
+
+# the chart store is pruned by a write at most once in this number of seconds
+PRUNE_INTERVAL = 300
+
+# PlotlyRenderPool used to export plotly charts, set by the application at start up
+render_pool = None
+
+# number of points each movement trace is reduced to before it is plotted
+MOVEMENT_POINTS = int(os.environ.get("BALANCE_MOVEMENT_POINTS", 500))
+
+# process pool the matplotlib charts are drawn in, set by the application at start up
+process_pool = None
+
+
+class ChartStore:
+    """
+    content addressed store of rendered charts
+
+    a chart is keyed by the patient, the chart type and a hash of the data it was
+    rendered from, so unchanged data is never rendered twice and requests for
+    different patients never share an image
+    the key ends with a tag of the medical personnel it was rendered for, the chart
+    route only serves a chart to its owner, see owns
+
+    charts are removed once they were not served for max_age seconds, or the least
+    recently served first while the store holds more than max_bytes, the store is
+    pruned when a chart is written, so only a worker rendering charts pays for it
+    
+    Parameters
+    -------------
+    directory : folder the png files are kept in
+    max_age : seconds a chart is kept after it was last served
+    max_bytes : size the png files of the store are kept under
+    """
+
+    def __init__(self, directory, max_age=CHART_MAX_AGE, max_bytes=CHART_MAX_BYTES):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.last_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, owner, patient, chart_type, data_hash):
+        """
+        returns the key a chart is stored under
+        """
+        digest = hashlib.sha256(
+            "\0".join([owner, patient, chart_type, data_hash]).encode("utf8")
+        ).hexdigest()
+        return "%s-%s-%s" % (chart_type, digest[:32], owner_tag(owner))
+
+    def owns(self, key, owner):
+        """
+        returns True if a chart key was made for owner
+        """
+        tag = key.rsplit("-", 1)[-1]
+        return hmac.compare_digest(tag.encode("utf8"), owner_tag(owner).encode("utf8"))
+
+    def path(self, key):
+        """
+        returns the file path of a stored chart
+        """
+        return os.path.join(self.directory, key + ".png")
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def touch(self, key):
+        """
+        marks a stored chart as just served, returns False if it is not stored
+        """
+        try:
+            os.utime(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def save(self, key, image):
+        """
+        writes a rendered png image to the store
+
+        the image is written to a temporary file first so a chart being read is
+        never seen half written
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(image)
+        os.replace(tmp_path, self.path(key))
+        now = time.time()
+        if now - self.last_prune > PRUNE_INTERVAL:
+            self.last_prune = now
+            self.prune(now)
+
+    def prune(self, now=None):
+        """
+        removes the charts not served for max_age seconds, then the least recently
+        served charts until the store is under max_bytes
+        
+        the modification time of a chart is its last use, see get_or_render, and
+        a file removed by another worker at the same time is skipped
+        returns the number of files removed
+        """
+        now = time.time() if now is None else now
+        files = []
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            # temporary files left by a worker that died while writing are removed too
+            if now - stat.st_mtime > self.max_age:
+                removed += self.remove(entry.path)
+            elif entry.name.endswith(".png"):
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            removed += self.remove(path)
+            total -= size
+        return removed
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def get_or_render(self, owner, patient, chart_type, data_hash, render, *args):
+        """
+        returns the key of a chart, rendering it only if it is not already stored
+
+        Parameters
+        -------------
+        owner : user id of the medical personnel the chart is served to
+        patient : email address of patient
+        chart_type : name of the chart
+        data_hash : hash of the data the chart is rendered from, see data_hash
+        render : function returning the png image bytes
+        args : arguments passed to render
+
+        lookups and render times are recorded in metrics by chart type
+        """
+        key = self.key(owner, patient, chart_type, data_hash)
+        if self.touch(key):
+            metrics.CHART_STORE.inc(chart=chart_type, result="hit")
+            return key
+        metrics.CHART_STORE.inc(chart=chart_type, result="miss")
+        start = time.perf_counter()
+        image = render(*args)
+        metrics.observe_render(chart_type, time.perf_counter() - start)
+        self.save(key, image)
+        return key
+
+
+def owner_tag(owner):
+    """
+    returns the part of a chart key naming the user it was rendered for
+    """
+    return hashlib.sha256(owner.encode("utf8")).hexdigest()[:16]
+
+
+def data_hash(*data):
+    """
+    returns a stable hash of the data a chart is rendered from
+
+    dataframes are hashed column by column without converting them back to rows
+    """
+    import numpy as np
+    import pandas as pd
+
+    digest = hashlib.sha256()
+    for value in data:
+        if isinstance(value, pd.DataFrame):
+            for name in value.columns:
+                column = value[name]
+                digest.update(str(name).encode("utf8"))
+                if len(column) and isinstance(column.iloc[0], np.ndarray):
+                    for array in column:
+                        digest.update(np.ascontiguousarray(array).tobytes())
+                else:
+                    hashed = pd.util.hash_pandas_object(column, index=False)
+                    digest.update(hashed.values.tobytes())
+        else:
+            text = json.dumps(value, sort_keys=True, default=str)
+            digest.update(text.encode("utf8"))
+    return digest.hexdigest()
+
+
+def default_chart_dir():
+    return os.environ.get(
+        CHART_DIR_ENV, os.path.join(tempfile.gettempdir(), "balance_health_charts")
+    )
+
+
+def set_render_pool(pool):
+    """
+    sets the kaleido render pool used for plotly charts, None exports in process
+    """
+    global render_pool
+    render_pool = pool
+
+
+def _plotly_png(fig):
+    if render_pool is not None:
+        return render_pool.render(fig, format="png")
+    return fig.to_image(format="png")
+
+
+def start_process_pool(workers):
+    """
+    starts the process pool matplotlib charts are drawn in
+
+    Parameters
+    -------------
+    workers : number of processes, 0 draws charts in the calling thread
+
+    processes are spawned rather than forked as the web server already runs
+    threads, and each one is warmed by importing this module
+    """
+    global process_pool
+    if workers > 0 and process_pool is None:
+        process_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        for _ in range(workers):
+            process_pool.submit(_warm_up)
+    return process_pool
+
+
+def shutdown_process_pool():
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown()
+        process_pool = None
+
+
+def _warm_up():
+    return True
+
+
+def _in_process_pool(draw, *args):
+    if process_pool is None:
+        return draw(*args)
+    profile = profiling.current_profile()
+    if profile is None:
+        return process_pool.submit(draw, *args).result()
+    # a profiled request also profiles the drawing in the worker process
+    image, stats = process_pool.submit(profiling.profiled_call, draw, *args).result()
+    profile.add(profiling.ProfileStats(stats))
+    return image
+
+
+def _matplotlib_png(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+
+    image = io.BytesIO()
+    FigureCanvas(fig).print_png(image)
+    fig.clear()
+    return image.getvalue()
+
+
+def render_week_activity(counts):
+    """
+    renders a bar chart of the number of activities taken on each day of the last week
+
+    Parameters
+    -------------
+    counts : list of (date, attempts, completed) tuples, see summary.daily_counts
+    """
+    return _in_process_pool(_draw_week_activity, counts)
+
+
+def _draw_week_activity(counts):
+    from matplotlib.figure import Figure
+
+    days = [count[0] for count in counts]
+    attempts = [count[1] for count in counts]
+    fig = Figure()
+    ax = fig.subplots()
+
+    ax.bar(days, attempts, color="red")
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_yticks(range(0, max(attempts + [1]) + 1))
+    ax.set_title("Dates activities taken last week", fontsize=18, color="#8C55AA")
+    fig.tight_layout()
+    return _matplotlib_png(fig)
+
+
+def render_activities_completed(stats):
+    """
+    renders a bar chart of completed and failed attempts for each activity
+
+    Parameters
+    -------------
+    stats : per activity statistics, see summary.activity_stats
+    """
+    import pandas as pd
+    import plotly.express as px
+
+    rows = []
+    for activity in stats:
+        rows.append(
+            {
+                "activityName": activity["activityName"],
+                "completed": True,
+                "count": activity["completed"],
+            }
+        )
+        rows.append(
+            {
+                "activityName": activity["activityName"],
+                "completed": False,
+                "count": activity["attempts"] - activity["completed"],
+            }
+        )
+    fig = px.bar(
+        pd.DataFrame(rows, columns=["activityName", "completed", "count"]),
+        x="activityName",
+        y="count",
+        color="completed",
+        barmode="group",
+        text="count",
+        title="Activities completed",
+        labels=dict(count="Activities carried out"),
+    )
+    return _plotly_png(fig)
+
+
+def render_results_sunburst(daily_rows):
+    """
+    renders a sunburst chart of the results of every activity by date, over the
+    days kept in the summary
+
+    Parameters
+    -------------
+    daily_rows : per day and activity counts, see summary.daily_activity_rows
+    """
+    import pandas as pd
+    import plotly.express as px
+
+    rows = []
+    for row in daily_rows:
+        for completed, count in [
+            (True, row["completed"]),
+            (False, row["attempts"] - row["completed"]),
+        ]:
+            if count:
+                rows.append(
+                    {
+                        "activityName": row["activityName"],
+                        "date_set": row["date_set"],
+                        "completed": completed,
+                        "count": count,
+                    }
+                )
+    sunburst = px.sunburst(
+        pd.DataFrame(rows, columns=["activityName", "date_set", "completed", "count"]),
+        path=["activityName", "date_set", "completed"],
+        values="count",
+    )
+    return _plotly_png(sunburst)
+
+
+def render_activity_sunburst(df):
+    """
+    renders a sunburst chart of the last seven results of an activity
+    """
+    import plotly.express as px
+
+    fig = px.sunburst(
+        df.head(7),
+        path=["date_set", "completed"],
+        hover_name="activityName",
+        color="completed",
+    )
+    return _plotly_png(fig)
+
+
+def render_activity_average(df):
+    """
+    renders a line chart of the average and maximum scores of an activity over time
+    """
+    import plotly.express as px
+
+    fig = px.line(
+        df, x="date_set", y=["avg_value", "max_value"], title="Overall Average Score",
+    )
+    return _plotly_png(fig)
+
+
+def render_activity_movements(df, activity, max_points=None, method="minmax"):
+    """
+    renders the accelerometer movement of the last seven attempts of an activity
+
+    Parameters
+    -------------
+    df : dataframe containing the users scores for the activity
+    activity : name of the activity
+    max_points : number of points each trace is reduced to before plotting,
+        defaults to MOVEMENT_POINTS
+    method : downsampling method, "minmax" or "lttb"
+
+    traces are downsampled before they are sent to the process pool, so neither
+    the drawing time nor the image depends on the sensor sample rate
+    """
+    if max_points is None:
+        max_points = MOVEMENT_POINTS
+    traces = []
+    for index, row in df.head(7).iterrows():
+        x, y = downsample(row["acc_data"], max_points, method)
+        traces.append((str(row["date_set"]), bool(row["completed"]), x, y))
+    return _in_process_pool(_draw_activity_movements, traces, activity)
+
+
+def _draw_activity_movements(traces, activity):
+    from matplotlib.figure import Figure
+
+    font1 = {"family": "serif", "color": "blue", "size": 10}
+    fig = Figure(figsize=(18, 16))
+    for i, (date_set, completed, x, y) in enumerate(traces, start=1):
+        ax = fig.add_subplot(3, 3, i)
+        if not completed:
+            ax.plot(x, y, color="r")
+        else:
+            ax.plot(x, y)  # Plot the chart
+
+        ax.set_title(activity + date_set, fontdict=font1)
+        ax.set_xlabel("Time")
+        ax.set_ylabel("Movement")
+    return _matplotlib_png(fig)
+
+
+def week_activity_data(counts):
+    """
+    returns the series of the week activity chart for rendering in the browser
+
+    Parameters
+    -------------
+    counts : list of (date, attempts, completed) tuples, see summary.daily_counts
+    """
+    return {
+        "dates": [str(count[0]) for count in counts],
+        "attempts": [count[1] for count in counts],
+    }
+
+
+def activities_completed_data(stats):
+    """
+    returns the series of the activities completed chart for rendering in the browser
+
+    Parameters
+    -------------
+    stats : per activity statistics, see summary.activity_stats
+    """
+    return {
+        "activities": [activity["activityName"] for activity in stats],
+        "completed": [activity["completed"] for activity in stats],
+        "failed": [activity["attempts"] - activity["completed"] for activity in stats],
+    }
+
+
+def results_sunburst_data(daily_rows):
+    """
+    returns the sunburst of the results of every activity by date for rendering
+    in the browser
+
+    Parameters
+    -------------
+    daily_rows : per day and activity counts, see summary.daily_activity_rows
+    """
+    paths = []
+    for row in daily_rows:
+        for completed, count in [
+            (True, row["completed"]),
+            (False, row["attempts"] - row["completed"]),
+        ]:
+            if count:
+                paths.append(
+                    ((row["activityName"], row["date_set"], str(completed)), count)
+                )
+    return _sunburst_data(paths)
+
+
+def activity_sunburst_data(df):
+    """
+    returns the sunburst of the last seven results of an activity for rendering
+    in the browser
+    """
+    paths = [
+        ((str(row["date_set"]), str(bool(row["completed"]))), 1)
+        for _, row in df.head(7).iterrows()
+    ]
+    return _sunburst_data(paths)
+
+
+def _sunburst_data(paths):
+    # ids, labels, parents and values of a plotly sunburst, a parents value is the
+    # total of its children
+    values = {}
+    for path, count in paths:
+        for depth in range(1, len(path) + 1):
+            values[path[:depth]] = values.get(path[:depth], 0) + count
+    nodes = sorted(values)
+    return {
+        "ids": ["/".join(node) for node in nodes],
+        "labels": [node[-1] for node in nodes],
+        "parents": ["/".join(node[:-1]) for node in nodes],
+        "values": [values[node] for node in nodes],
+    }
+
+
+def activity_average_data(df):
+    """
+    returns the average and maximum scores of an activity over time for rendering
+    in the browser
+    """
+    return {
+        "dates": [str(day) for day in df["date_set"]],
+        "avg_value": _json_floats(df["avg_value"]),
+        "max_value": _json_floats(df["max_value"]),
+    }
+
+
+def activity_movements_data(df, max_points=None, method="minmax"):
+    """
+    returns the downsampled accelerometer traces of the last seven attempts of an
+    activity for rendering in the browser
+
+    Parameters
+    -------------
+    df : dataframe containing the users scores for the activity
+    max_points : number of points each trace is reduced to, defaults to MOVEMENT_POINTS
+    method : downsampling method, "minmax" or "lttb"
+    """
+    if max_points is None:
+        max_points = MOVEMENT_POINTS
+    traces = []
+    for _, row in df.head(7).iterrows():
+        x, y = downsample(row["acc_data"], max_points, method)
+        traces.append(
+            {
+                "date": str(row["date_set"]),
+                "completed": bool(row["completed"]),
+                "x": x.tolist(),
+                "y": _json_floats(y),
+            }
+        )
+    return {"traces": traces}
+
+
+def _json_floats(values):
+    # json has no nan, missing values are sent as null
+    return [None if value != value else float(value) for value in values]
+
+
+def downsample(y, max_points, method="minmax"):
+    """
+    reduces a trace to at most max_points points
+
+    Parameters
+    -------------
+    y : sequence of trace values
+    max_points : maximum number of points returned
+    method : "minmax" keeps the lowest and highest value of each bucket,
+        "lttb" keeps the point of each bucket forming the largest triangle
+        with its neighbours
+
+    Returns
+    ------------
+    Tuple of the sample positions kept and their values
+    """
+    import numpy as np
+
+    y = np.asarray(y, dtype=float)
+    if max_points is None or len(y) <= max_points or max_points < 3:
+        return np.arange(len(y)), y
+    if method == "lttb":
+        index = _lttb_index(y, max_points)
+    elif method == "minmax":
+        index = _minmax_index(y, max_points)
+    else:
+        raise ValueError("Unknown downsampling method: %s" % method)
+    return index, y[index]
+
+
+def _minmax_index(y, max_points):
+    import numpy as np
+
+    buckets = max_points // 2
+    size = -(-len(y) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[: len(y)] = y
+    padded = padded.reshape(buckets, size)
+    rows = ~np.all(np.isnan(padded), axis=1)
+    padded = padded[rows]
+    offsets = np.arange(buckets)[rows] * size
+    low = np.nanargmin(padded, axis=1) + offsets
+    high = np.nanargmax(padded, axis=1) + offsets
+    return np.unique(np.concatenate([low, high]))
+
+
+def _lttb_index(y, max_points):
+    import numpy as np
+
+    n = len(y)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    index = np.zeros(max_points, dtype=int)
+    index[-1] = n - 1
+    selected = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        index[i + 1] = selected
+    return index
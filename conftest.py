@@ -1,8 +1,116 @@
+import os
+
+os.environ.setdefault("BALANCE_BACKEND", "local")
+os.environ.setdefault("BALANCE_SESSION_DB", ":memory:")
+
 import pytest
 import app as webapp
+import data_utils
+from backends import LocalBackend, LocalQuery, set_backend
+
+ACTIVITY_NAMES = [
+    "Stand with your feet side-by-side",
+    "Instep Stance",
+    "Tandem Stance",
+    "Stand on one foot",
+]
 
 
 @pytest.fixture
 def app():
     app = webapp.app
     return app
+
+
+@pytest.fixture
+def backend():
+    backend = LocalBackend()
+    set_backend(backend)
+    data_utils.clear_caches()
+    yield backend
+    set_backend(None)
+    data_utils.clear_caches()
+
+
+@pytest.fixture
+def logged_in_client(app, backend, client):
+    details = {
+        "email": "bob@email.com",
+        "password": "bob123",
+        "confirm_password": "bob123",
+        "first_name": "Bob",
+        "last_name": "Smith",
+    }
+    client.post("/register", data=details)
+    client.post("/login", data=details)
+    yield client
+    client.get("/logout")
+
+
+@pytest.fixture
+def patient(app, backend, logged_in_client):
+    email = "pat@email.com"
+    logged_in_client.post(
+        "/create_patient",
+        data={
+            "email": email,
+            "first_name": "Pat",
+            "last_name": "Jones",
+            "age": "1950-01-01",
+            "condition": "none",
+        },
+    )
+    for name in ACTIVITY_NAMES:
+        backend.db.collection("activities").document(name).set(
+            {"name": name, "description": "hold the pose", "time_limit": 30}
+        )
+    with logged_in_client.session_transaction() as sess:
+        sess["user_email"] = email
+    return email
+
+
+def make_score(activity, day, completed=True, samples=50):
+    return {
+        "activityName": activity,
+        "date_set": day,
+        "max_value": 1.5 + samples / 100,
+        "min_value": 0.1,
+        "avg_value": 0.8,
+        "completed": completed,
+        "acc_data": [((i * 7) % 11) / 10 for i in range(samples)],
+    }
+
+
+@pytest.fixture
+def scores(backend, patient):
+    collection = (
+        backend.db.collection("patient_scores").document(patient).collection("scores")
+    )
+    days = ["2022-03-0%d" % d for d in range(1, 8)]
+    for i, day in enumerate(days):
+        for activity in ACTIVITY_NAMES:
+            collection.add({activity: make_score(activity, day, completed=i % 3 != 0)})
+    return collection
+
+
+@pytest.fixture
+def chart_store(app, tmp_path, monkeypatch):
+    from charts import ChartStore
+
+    store = ChartStore(str(tmp_path))
+    monkeypatch.setattr(webapp, "chart_store", store)
+    return store
+
+
+def count_reads(monkeypatch):
+    reads = []
+    stream = LocalQuery.stream
+
+    def counting_stream(query):
+        docs = list(stream(query))
+        if query._parent.endswith("/scores"):
+            reads.append(len(docs))
+        return iter(docs)
+
+    monkeypatch.setattr(LocalQuery, "stream", counting_stream)
+    return reads
@@ -4,29 +4,312 @@ Project : Balance Health Web Application
 Date : 05/04/2022
 data_utils.py 
 contains methods for connecting to and communicating with firestore database
+the database used is provided by the active backend in backends.py
 """
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-import pyrebase
 from flask import flash
 import json
-from flask import session
+from flask import session, has_request_context, copy_current_request_context
 from models.patient import Patient
-import config as cfg
+from backends import get_backend, DESCENDING, DOCUMENT_ID
+from cache import TTLCache
+from live_cache import LiveCache
+import summary as progress_summary
 from datetime import date, timedelta, datetime
+from concurrent.futures import ThreadPoolExecutor
+import os
+import base64
+import threading
+import metrics
+import profiling
 
-cred = credentials.Certificate("firebase_sdk.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# firestore rejects write batches with more than 500 operations
+BATCH_LIMIT = 500
 
-firebaseConfig = cfg.firebaseConfig
-firebase = pyrebase.initialize_app(firebaseConfig)
-storage = firebase.storage()
-# storage = getStorage(firebase_admin);
-auth = firebase.auth()
+# summary fields of a score entry, acc_data holds the raw accelerometer trace
+SCORE_FIELDS = [
+    "activityName",
+    "date_set",
+    "max_value",
+    "min_value",
+    "avg_value",
+    "completed",
+]
 
+# the activity catalogue only changes through add_activity, which invalidates it
+# in its own process only, the time to live bounds how long the other workers
+# show a stale catalogue, the live cache keeps every worker current instead
+activity_cache = TTLCache(
+    maxsize=1, ttl=float(os.environ.get("BALANCE_ACTIVITY_CACHE_TTL", 30))
+)
 
+# medical_staff lookups of the users whose id tokens were verified, kept briefly
+# so a request is authenticated without a database read
+staff_cache = TTLCache(
+    maxsize=int(os.environ.get("BALANCE_STAFF_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("BALANCE_STAFF_CACHE_TTL", 60)),
+)
+
+# every comment thread of recently viewed patients, add_comment invalidates the
+# patient it writes to in its own process, so a comment added through another
+# worker shows up once the time to live passes
+comment_cache = TTLCache(
+    maxsize=int(os.environ.get("BALANCE_COMMENT_CACHE_SIZE", 64)),
+    ttl=float(os.environ.get("BALANCE_COMMENT_CACHE_TTL", 30)),
+)
+
+# number of patients or comments shown on each page of a list
+PAGE_SIZE = int(os.environ.get("BALANCE_PAGE_SIZE", 25))
+
+# newest comments of a patient read from the comment index for the patient details
+# page, so the page costs the same however long the comment history is
+COMMENT_LIMIT = int(os.environ.get("BALANCE_COMMENT_LIMIT", 100))
+
+# score frames of recently viewed patients with the latest date_set read, a
+# frame is reloaded in full once its time to live passes
+score_cache = TTLCache(
+    maxsize=int(os.environ.get("BALANCE_SCORE_CACHE_SIZE", 64)),
+    ttl=float(os.environ.get("BALANCE_SCORE_CACHE_TTL", 3600)),
+)
+
+# optional copies of the activity catalogue, patient lists and patient activities
+# kept current by snapshot listeners, enabled with BALANCE_LIVE_CACHE=1
+live_cache = None
+if os.environ.get("BALANCE_LIVE_CACHE", "0") == "1":
+    live_cache = LiveCache(
+        maxsize=int(os.environ.get("BALANCE_LIVE_CACHE_SIZE", 100)),
+        timeout=float(os.environ.get("BALANCE_LIVE_CACHE_TIMEOUT", 10)),
+    )
+
+# shared pool used by fetch_all to run independent reads of a request concurrently
+fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BALANCE_FETCH_WORKERS", 8)),
+    thread_name_prefix="data_utils_fetch",
+)
+
+
+def get_db():
+    """
+    returns the firestore style client of the active storage backend
+    """
+    return metrics.instrument_client(get_backend().db)
+
+
+def get_auth():
+    """
+    returns the pyrebase style auth client of the active storage backend
+    """
+    return get_backend().auth
+
+
+def get_cache_stats():
+    """
+    returns the hit and miss counters of the data caches
+    """
+    stats = {
+        "activities": activity_cache.stats(),
+        "scores": score_cache.stats(),
+        "staff": staff_cache.stats(),
+        "comments": comment_cache.stats(),
+    }
+    if live_cache is not None:
+        stats["live"] = live_cache.stats()
+    return stats
+
+
+@metrics.registry.register_collector
+def cache_metrics():
+    """
+    returns the hit rates and sizes of the data caches as metrics gauges
+    """
+    gauges = []
+    for name, stats in get_cache_stats().items():
+        labels = {"cache": name}
+        gauges.extend(
+            [
+                ("balance_cache_hits", "Cache hits", labels, stats["hits"]),
+                ("balance_cache_misses", "Cache misses", labels, stats["misses"]),
+                ("balance_cache_hit_rate", "Cache hit rate", labels, stats["hit_rate"]),
+                ("balance_cache_size", "Cache entries", labels, stats["size"]),
+            ]
+        )
+    return gauges
+
+
+def clear_caches():
+    """
+    empties the data caches and their counters, used when the storage backend is replaced
+    """
+    for cache in [activity_cache, score_cache, staff_cache, comment_cache]:
+        cache.invalidate()
+        cache.reset_stats()
+    if live_cache is not None:
+        live_cache.close()
+
+
+def submit(function, *args):
+    """
+    runs a data_utils function on the fetch pool
+    
+    Parameters
+    -------------
+    function : function to run
+    args : arguments passed to the function
+    
+    Returns a future for the result, the current request context is copied so the
+    function can still use session and flash, and it is profiled with the request
+    """
+    if has_request_context():
+        profile = profiling.current_profile()
+        if profile is not None:
+            function = profile.wrap(function)
+        function = copy_current_request_context(function)
+    return fetch_executor.submit(function, *args)
+
+
+def fetch_all(*calls):
+    """
+    runs independent reads concurrently and waits for all of them
+    
+    Parameters
+    -------------
+    calls : tuples of (function, arguments...)
+    
+    Returns a list with the result of each call in the order given, so the total
+    latency is roughly that of the slowest read
+    """
+    futures = [submit(call[0], *call[1:]) for call in calls]
+    return [future.result() for future in futures]
+
+
+@metrics.timed
+def commit_writes(writes):
+    """
+    commits set operations using firestore write batches
+    
+    Parameters
+    -------------
+    writes : List of (document reference, document data) pairs
+    
+    Writes are split into batches of BATCH_LIMIT operations, so up to BATCH_LIMIT
+    documents cost a single round trip. Any error is raised to the caller
+    """
+    db = get_db()
+    for start in range(0, len(writes), BATCH_LIMIT):
+        batch = db.batch()
+        for doc_ref, data in writes[start : start + BATCH_LIMIT]:
+            batch.set(doc_ref, data)
+        batch.commit()
+
+
+def encode_page_token(cursor):
+    """
+    encodes the order by values of the last document of a page as an url safe token
+    """
+    text = json.dumps(cursor, sort_keys=True, separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode("utf8")).decode("ascii").rstrip("=")
+
+
+def decode_page_token(page_token, fields):
+    """
+    decodes a page token returned by encode_page_token, returns None if it is empty
+    or was not created by encode_page_token for a query ordered by fields
+    
+    the token comes from the client, so a cursor with other keys, a document id
+    that is not a string or values that are not plain json values reads the first
+    page rather than reaching start_after
+    """
+    if not page_token:
+        return None
+    try:
+        padding = "=" * (-len(page_token) % 4)
+        cursor = json.loads(base64.urlsafe_b64decode(page_token + padding))
+    except ValueError:
+        return None
+    if not isinstance(cursor, dict) or set(cursor) != set(fields):
+        return None
+    if not isinstance(cursor.get(DOCUMENT_ID, ""), str):
+        return None
+    if not all(
+        value is None or isinstance(value, (str, int, float, bool))
+        for value in cursor.values()
+    ):
+        return None
+    return cursor
+
+
+@metrics.timed
+def get_page(query, fields, page_size=None, page_token=None):
+    """
+    reads one page of an ordered query
+    
+    Parameters
+    -------------
+    query : query ordered by fields, DOCUMENT_ID last so every document has a
+        distinct position
+    fields : field paths the query is ordered by
+    page_size : number of documents on a page, defaults to PAGE_SIZE
+    page_token : token of the page to read, None reads the first page
+    
+    Returns
+    ------------
+    Tuple of the document snapshots of the page and the token of the next page,
+    which is None on the last page. One more document than the page size is read
+    to find out whether another page follows, so a page costs the same number of
+    reads however long the list is
+    """
+    page_size = page_size or PAGE_SIZE
+    cursor = decode_page_token(page_token, fields)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    docs = list(query.limit(page_size + 1).stream())
+    next_page_token = None
+    if len(docs) > page_size:
+        docs = docs[:page_size]
+        last = docs[-1]
+        next_page_token = encode_page_token(
+            {
+                field: last.id if field == DOCUMENT_ID else last.get(field)
+                for field in fields
+            }
+        )
+    return docs, next_page_token
+
+
+@metrics.timed
+def live_documents(path):
+    """
+    returns the documents of a collection from the live cache
+    
+    Parameters
+    -------------
+    path : firestore path of the collection
+    
+    Returns a list of (document id, data) pairs, or None when the live cache is
+    disabled or the collection could not be watched, the caller then reads it directly
+    """
+    if live_cache is None:
+        return None
+    return live_cache.documents(path, get_db().collection(path))
+
+
+def live_page(documents, page_size=None, page_token=None):
+    """
+    returns one page of a live collection ordered by document id, in the same form
+    as get_page
+    """
+    page_size = page_size or PAGE_SIZE
+    documents = sorted(documents, key=lambda document: document[0])
+    cursor = decode_page_token(page_token, [DOCUMENT_ID])
+    if cursor is not None:
+        documents = [d for d in documents if d[0] > cursor[DOCUMENT_ID]]
+    next_page_token = None
+    if len(documents) > page_size:
+        documents = documents[:page_size]
+        next_page_token = encode_page_token({DOCUMENT_ID: documents[-1][0]})
+    return [data for _, data in documents], next_page_token
+
+
+@metrics.timed
 def register_user(user_details):
     """
     register a user using firbase authentication
@@ -38,10 +321,11 @@ def register_user(user_details):
     Displays a message if the user was registered successfully or not
     """
     try:
-        user = auth.create_user_with_email_and_password(
+        user = get_auth().create_user_with_email_and_password(
             user_details["email"], user_details["password"]
         )
-        register_medical_staff(user["localId"], user_details)
+        if not register_medical_staff(user["localId"], user_details):
+            return None
         flash("SUCCESSFULLY REGISTERED USER.", "success")
         return user
     except Exception as e:
@@ -49,6 +333,7 @@ def register_user(user_details):
         return None
 
 
+@metrics.timed
 def register_medical_staff(userId, user_details):
     """
     adss a newly register user details to the firestore database
@@ -58,10 +343,11 @@ def register_medical_staff(userId, user_details):
     user_id : created user firebase UID
     user_details : Entered user details
     
-    Displays a message if the user details were added successfully or not
+    Returns True if the user details were added, otherwise displays an error message
+    and returns False
     """
     try:
-        doc_ref = db.collection(u"medical_staff").document(userId)
+        doc_ref = get_db().collection(u"medical_staff").document(userId)
         doc_ref.set(
             {
                 u"firstname": user_details["first_name"],
@@ -70,10 +356,14 @@ def register_medical_staff(userId, user_details):
                 u"userUid": userId,
             }
         )
+        staff_cache.invalidate(userId)
+        return True
     except Exception as e:
         flash(json.loads(e.args[1])["error"]["message"], "error")
+        return False
 
 
+@metrics.timed
 def login_user(user_details):
     """
     logs in a user using firbase authentication
@@ -85,12 +375,10 @@ def login_user(user_details):
     Displays an error message if the user details do not match the database entry
     """
     try:
-        login = auth.sign_in_with_email_and_password(
+        login = get_auth().sign_in_with_email_and_password(
             user_details["email"], user_details["password"]
         )
-        doc_ref = db.collection(u"medical_staff").document(login["localId"])
-        doc = doc_ref.get()
-        if doc.exists:
+        if is_medical_staff(login["localId"]):
             return login
         else:
             flash("Could not authenticate user", "error")
@@ -101,6 +389,52 @@ def login_user(user_details):
         return None
 
 
+@metrics.timed
+def is_medical_staff(userId):
+    """
+    checks a user is registered as medical personnel
+
+    Parameters
+    -------------
+    userId : firebase UID of the user
+
+    results are cached in staff_cache for BALANCE_STAFF_CACHE_TTL seconds
+    """
+    registered = staff_cache.get(userId)
+    if registered is None:
+        registered = get_db().collection(u"medical_staff").document(userId).get().exists
+        staff_cache.set(userId, registered)
+    return registered
+
+
+def verify_id_token(token):
+    """
+    returns the claims of a valid firebase id token, verified locally by the backend
+
+    raises auth_tokens.TokenExpired or auth_tokens.InvalidToken
+    """
+    return get_backend().verify_id_token(token)
+
+
+@metrics.timed
+def refresh_login(refresh_token):
+    """
+    exchanges a refresh token for a new id token
+
+    Parameters
+    -------------
+    refresh_token : refresh token returned at login
+
+    Returns a map with the new idToken and refreshToken, or None if the refresh
+    token is no longer valid
+    """
+    try:
+        return get_auth().refresh(refresh_token)
+    except Exception:
+        return None
+
+
+@metrics.timed
 def add_activity(activity_details):
     """
     adds a balance activity details to the database
@@ -112,18 +446,20 @@ def add_activity(activity_details):
     Displays a message if the activity details were added successfully or not
     """
     try:
-        doc_ref = db.collection(u"activities").add(
+        doc_ref = get_db().collection(u"activities").add(
             {
                 u"name": activity_details["activity_name"],
                 u"description": activity_details["description"],
                 u"time_limit": int(activity_details["time_limit"]),
             }
         )
+        activity_cache.invalidate()
         flash("SUCCESSFULLY Added activity.", "success")
     except Exception as e:
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def add_comment(comment, email, activity):
     """
     adds a comment for a patinets balance activity performance to the database
@@ -138,18 +474,164 @@ def add_comment(comment, email, activity):
     """
     try:
         today = date.today().strftime("%Y-%m-%d")
+        data = {u"comment": comment["comment"], u"date": today, u"activity": activity}
+        index = comment_index(email)
+        if not index.get().exists:
+            build_comment_index(email)
         doc_ref = (
-            db.collection(u"comments")
+            get_db().collection(u"comments")
             .document(email)
             .collection(activity)
-            .add(
-                {u"comment": comment["comment"], u"date": today, u"activity": activity,}
-            )
+            .document()
         )
+        commit_writes(
+            [
+                (doc_ref, data),
+                (index.collection(u"comments").document(doc_ref.id), data),
+            ]
+        )
+        comment_cache.invalidate(email)
     except Exception as e:
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+def comment_index(email):
+    """
+    returns the document of a patients comment index, its comments collection
+    holds a copy of every comment of every activity
+    """
+    return get_db().collection(u"patient_comments").document(email)
+
+
+@metrics.timed
+def build_comment_index(email):
+    """
+    copies the comments of every activity thread of a patient into the comment index,
+    used for comments written before the index existed
+
+    Parameters
+    -------------
+    email : patients email address
+
+    Returns the indexed comments as (document id, comment) pairs
+    """
+    index = comment_index(email)
+    comments = []
+    for thread in get_db().collection(u"comments").document(email).collections():
+        for doc in thread.stream():
+            comment = doc.to_dict()
+            comment.setdefault(u"activity", thread.id)
+            comments.append((doc.id, comment))
+    writes = [(index.collection(u"comments").document(i), c) for i, c in comments]
+    writes.append((index, {u"indexed": True}))
+    commit_writes(writes)
+    return comments
+
+
+@metrics.timed
+def get_patient_comments(email):
+    """
+    retrieves the comments of every activity of a patient with one query of the
+    comment index
+
+    Parameters
+    -------------
+    email : patients email address
+
+    Returns a map of activity name to a thread of the newest COMMENT_LIMIT comments
+    of the patient, see comment_thread. Each thread holds at most PAGE_SIZE
+    comments, the older comments are read a page at a time with
+    retrieve_comments_page from the thread next_page_token. The result is kept in
+    comment_cache until add_comment writes to the patient.
+    Displays a message if retrieving comments was unsuccessful
+    """
+    threads = comment_cache.get(email)
+    if threads is not None:
+        return copy_threads(threads)
+    try:
+        index = comment_index(email)
+        comments = [
+            (doc.id, doc.to_dict())
+            for doc in index.collection(u"comments")
+            .order_by(u"date", direction=DESCENDING)
+            .order_by(DOCUMENT_ID, direction=DESCENDING)
+            .limit(COMMENT_LIMIT)
+            .stream()
+        ]
+        if not comments and not index.get().exists:
+            comments = build_comment_index(email)
+        threads = group_comments(comments)
+        comment_cache.set(email, threads)
+        return copy_threads(threads)
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return {}
+
+
+def group_comments(comments):
+    """
+    returns the comment threads of every activity of a patient
+    
+    Parameters
+    -------------
+    comments : (document id, comment) pairs read from the comment index
+    
+    Returns a map of activity name to the thread of its newest comments among the
+    newest COMMENT_LIMIT comments, see comment_thread
+    """
+    comments = sorted(
+        comments, key=lambda c: (c[1].get(u"date", ""), c[0]), reverse=True
+    )
+    # comments older than the newest COMMENT_LIMIT may exist in any thread
+    truncated = len(comments) >= COMMENT_LIMIT
+    by_activity = {}
+    for doc_id, comment in comments[:COMMENT_LIMIT]:
+        activity = comment.get(u"activity")
+        by_activity.setdefault(activity, []).append((doc_id, comment))
+    return {
+        name: comment_thread(thread, truncated) for name, thread in by_activity.items()
+    }
+
+
+def comment_thread(comments, truncated=False):
+    """
+    returns the first page of a comment thread
+    
+    Parameters
+    -------------
+    comments : (document id, comment) pairs of the thread, newest first
+    truncated : older comments may exist that are not in comments
+    
+    Returns a map of
+        comments : the newest PAGE_SIZE comments
+        more : True if the thread has older comments
+        next_page_token : token of the page after comments for retrieve_comments_page,
+            None when more is set for a thread without comments, its first page
+            is then read
+    """
+    page = comments[:PAGE_SIZE]
+    more = truncated or len(comments) > PAGE_SIZE
+    next_page_token = None
+    if more and page:
+        doc_id, last = page[-1]
+        next_page_token = encode_page_token(
+            {u"date": last.get(u"date"), DOCUMENT_ID: doc_id}
+        )
+    return {
+        "comments": [comment for _, comment in page],
+        "more": more,
+        "next_page_token": next_page_token,
+    }
+
+
+def copy_threads(threads):
+    return {
+        name: dict(thread, comments=list(thread["comments"]))
+        for name, thread in threads.items()
+    }
+
+
+@metrics.timed
 def retrieve_comments(activity, email):
     """
     retrieves comments made for a patinets balance activity performance from the database
@@ -164,10 +646,10 @@ def retrieve_comments(activity, email):
     try:
         comments = []
         docs = (
-            db.collection(u"comments")
+            get_db().collection(u"comments")
             .document(email)
             .collection(activity)
-            .order_by(u"date", direction=firestore.Query.DESCENDING)
+            .order_by(u"date", direction=DESCENDING)
             .stream()
         )
         for doc in docs:
@@ -178,23 +660,69 @@ def retrieve_comments(activity, email):
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
+def retrieve_comments_page(activity, email, page_size=None, page_token=None):
+    """
+    retrieves one page of the comments made for a patients balance activity performance
+    
+    Parameters
+    -------------
+    activity : name of activity to retrieve comments from
+    email : patients email address
+    page_size : number of comments on a page, defaults to PAGE_SIZE
+    page_token : token of the page to read, None reads the newest comments
+    
+    Returns a tuple of the comments and the token of the next page.
+    Displays a message if retrieving activity comments was unsuccessful
+    """
+    try:
+        query = (
+            get_db().collection(u"comments")
+            .document(email)
+            .collection(activity)
+            .order_by(u"date", direction=DESCENDING)
+            .order_by(DOCUMENT_ID, direction=DESCENDING)
+        )
+        docs, next_page_token = get_page(
+            query, [u"date", DOCUMENT_ID], page_size, page_token
+        )
+        return [doc.to_dict() for doc in docs], next_page_token
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return [], None
+
+
+@metrics.timed
 def get_activities():
     """
     retrieves activities from the database  
+    results are served from the live cache when it is enabled, otherwise from
+    activity_cache until they expire or add_activity is called, so the counters of
+    each cache only count the reads it served
     
     Displays a message if retrieving activity comments was unsuccessful
     """
+    if live_cache is None:
+        activities = activity_cache.get("activities")
+        if activities is not None:
+            return [dict(a) for a in activities]
     try:
-        docs = db.collection(u"activities").stream()
+        documents = live_documents(u"activities")
+        if documents is not None:
+            return [data for _, data in documents]
+        docs = get_db().collection(u"activities").stream()
         activities = []
         for doc in docs:
             activity = doc.to_dict()
             activities.append(activity)
-        return activities
+        if live_cache is None:
+            activity_cache.set("activities", activities)
+        return [dict(a) for a in activities]
     except Exception as e:
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def add_patient(user_details):
     """
     adds a new patient details to the database
@@ -208,7 +736,7 @@ def add_patient(user_details):
     try:
         userid = session["userId"]
         doc_ref = (
-            db.collection(u"patients")
+            get_db().collection(u"patients")
             .document(userid)
             .collection(u"patient_details")
             .document(user_details["email"])
@@ -227,6 +755,7 @@ def add_patient(user_details):
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def add_activities(email):
     """
     adds activities for a patient to the database
@@ -235,28 +764,36 @@ def add_activities(email):
     -------------
     email : email address of patient
     
-    Displays a message if the patient activity was added unsuccessfully
+    All activities are written in a single batch
+    Displays a message if the patient activities were added unsuccessfully
     """
     activities = get_activities()
-    for a in activities:
-        try:
-            doc_ref = (
-                db.collection(u"patient_activities")
-                .document(email)
-                .collection(u"activities")
-                .document(a["name"])
-                .set(
+    if not activities:
+        return
+    try:
+        collection = (
+            get_db().collection(u"patient_activities")
+            .document(email)
+            .collection(u"activities")
+        )
+        commit_writes(
+            [
+                (
+                    collection.document(a["name"]),
                     {
                         u"name": a["name"],
                         u"description": a["description"],
                         u"time_limit": int(a["time_limit"]),
-                    }
+                    },
                 )
-            )
-        except Exception as e:
-            flash(json.loads(e.args[1])["error"]["message"], "error")
+                for a in activities
+            ]
+        )
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def get_patients():
     """
     retrieves patient lists related to the logged in medical personnel from the database
@@ -265,8 +802,11 @@ def get_patients():
     """
     try:
         userid = session["userId"]
+        documents = live_documents(u"patients/%s/patient_details" % userid)
+        if documents is not None:
+            return [data for _, data in documents]
         docs = (
-            db.collection(u"patients")
+            get_db().collection(u"patients")
             .document(userid)
             .collection(u"patient_details")
             .stream()
@@ -280,6 +820,39 @@ def get_patients():
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
+def get_patients_page(page_size=None, page_token=None):
+    """
+    retrieves one page of the patient list of the logged in medical personnel
+    
+    Parameters
+    -------------
+    page_size : number of patients on a page, defaults to PAGE_SIZE
+    page_token : token of the page to read, None reads the first page
+    
+    Returns a tuple of the patients and the token of the next page, patients are
+    ordered by email which is also their document id.
+    Displays a message if retrieving patients was unsuccessful
+    """
+    try:
+        userid = session["userId"]
+        documents = live_documents(u"patients/%s/patient_details" % userid)
+        if documents is not None:
+            return live_page(documents, page_size, page_token)
+        query = (
+            get_db().collection(u"patients")
+            .document(userid)
+            .collection(u"patient_details")
+            .order_by(DOCUMENT_ID)
+        )
+        docs, next_page_token = get_page(query, [DOCUMENT_ID], page_size, page_token)
+        return [doc.to_dict() for doc in docs], next_page_token
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+        return [], None
+
+
+@metrics.timed
 def get_patient(email):
     """
     retrieves a selected patients details from the database
@@ -293,7 +866,7 @@ def get_patient(email):
     try:
         userid = session["userId"]
         doc_ref = (
-            db.collection(u"patients")
+            get_db().collection(u"patients")
             .document(userid)
             .collection(u"patient_details")
             .document(email)
@@ -310,6 +883,7 @@ def get_patient(email):
         return None
 
 
+@metrics.timed
 def get_patient_activities(email):
     """
     retrieves activities set for a patient from the database
@@ -321,8 +895,11 @@ def get_patient_activities(email):
     Displays a message if the request was unsuccessful
     """
     try:
+        documents = live_documents(u"patient_activities/%s/activities" % email)
+        if documents is not None:
+            return [data for _, data in documents]
         docs = (
-            db.collection(u"patient_activities")
+            get_db().collection(u"patient_activities")
             .document(email)
             .collection(u"activities")
             .stream()
@@ -336,6 +913,7 @@ def get_patient_activities(email):
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def get_patient_scores(email):
     """
     retrieves a selected patients activity scores from the database
@@ -348,7 +926,7 @@ def get_patient_scores(email):
     """
     try:
         docs = (
-            db.collection(u"patient_scores")
+            get_db().collection(u"patient_scores")
             .document(email)
             .collection(u"scores")
             .stream()
@@ -362,6 +940,589 @@ def get_patient_scores(email):
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
+def get_patient_scores_frame(
+    email, activity_names=None, include_acc_data=False, since=None, until=None
+):
+    """
+    retrieves a selected patients activity scores from the database as a dataframe
+    
+    Parameters
+    -------------
+    email : email address of patient
+    activity_names : only load these activities, the query then only reads their
+        documents and fields
+    include_acc_data : load the raw accelerometer trace of each score
+    since : only load scores taken on or after this date
+    until : only load scores taken before this date
+       
+    The dataframe is built column by column straight from the document stream.
+    Frames are kept in score_cache with the latest date_set read, later requests
+    only query the scores taken on or after that date and add them to the frame.
+    A date range is read with range queries on date_set unless the patients
+    frame is already cached, so the range decides how many scores are read
+    Displays a message if request was unsuccessful
+    """
+    try:
+        key = (email, tuple(activity_names or ()), include_acc_data)
+        entry = score_cache.get(key)
+        if entry is None and (since is not None or until is not None):
+            names = activity_names or [a["name"] for a in get_activities() or []]
+            docs = stream_activity_scores(
+                email, names, names, include_acc_data, since, until
+            )
+            frame = scores_frame(
+                docs, activity_names, include_acc_data, traces_collection(email)
+            )
+            return date_range_rows(frame, since, until)
+        if entry is None:
+            docs = read_scores(email, activity_names, include_acc_data)
+            entry = new_score_entry(email, docs, activity_names, include_acc_data)
+            score_cache.set(key, entry)
+        else:
+            with entry["lock"]:
+                sync_score_entry(email, entry, activity_names, include_acc_data)
+        return date_range_rows(entry["frame"], since, until).copy()
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+def scores_query(email, activity_names=None, include_acc_data=False, db=None):
+    """
+    returns the query reading a patients score documents, projected to the fields
+    of the given activities, on db or the client of get_db
+    """
+    if db is None:
+        db = get_db()
+    query = (
+        db.collection(u"patient_scores")
+        .document(email)
+        .collection(u"scores")
+    )
+    if activity_names:
+        query = query.select(score_field_paths(activity_names, include_acc_data))
+    return query
+
+
+def activity_scores_query(
+    email,
+    activity,
+    activity_names=None,
+    include_acc_data=False,
+    since=None,
+    until=None,
+    db=None,
+):
+    """
+    returns the query reading a patients scores of one activity within a date range
+    
+    Parameters
+    -------------
+    email : email address of patient
+    activity : name of the activity whose date_set is filtered on
+    activity_names : activities projected, every field is read when None
+    include_acc_data : also read the raw accelerometer traces
+    since : first date read, every score of the activity is read when None
+    until : date the range ends before
+    db : client the query is made on, get_db by default
+    
+    Only documents holding the activity have its date_set, so the range filter also
+    skips the other activities scores. Both filters are on the one field, which
+    firestore serves from its automatic single field index on `activity`.date_set,
+    no composite index is required. Adding an order_by or equality filter on any
+    other field would need a composite index on
+        patient_scores/{email}/scores : `activity`.date_set, <other field>
+    to be created for every activity
+    """
+    field = "`%s`.date_set" % activity
+    query = scores_query(email, activity_names, include_acc_data, db).where(
+        field, ">=", date_string(since) if since is not None else ""
+    )
+    if until is not None:
+        query = query.where(field, "<", date_string(until))
+    return query
+
+
+@metrics.timed
+def stream_activity_scores(
+    email, names, activity_names=None, include_acc_data=False, since=None, until=None
+):
+    """
+    returns the score documents of the given activities within a date range, with
+    one query per activity
+    
+    A document holding several of the activities is only returned once
+    """
+    docs = {}
+    for name in names:
+        query = activity_scores_query(
+            email, name, activity_names, include_acc_data, since, until
+        )
+        for doc in query.stream():
+            docs.setdefault(doc.id, doc)
+    return list(docs.values())
+
+
+@metrics.timed
+def read_scores(email, activity_names=None, include_acc_data=False):
+    """
+    returns every score document of a patient holding one of the given activities,
+    every activity of the catalogue when activity_names is None
+    """
+    if activity_names:
+        return stream_activity_scores(
+            email, activity_names, activity_names, include_acc_data
+        )
+    # the documents are still projected to the score fields of every activity
+    names = [a["name"] for a in get_activities() or []]
+    return list(scores_query(email, names, include_acc_data).stream())
+
+
+def date_string(day):
+    return day if isinstance(day, str) else day.strftime("%Y-%m-%d")
+
+
+def date_range_rows(frame, since=None, until=None):
+    """
+    returns the rows of a score frame taken on or after since and before until
+    """
+    import pandas as pd
+
+    if since is not None:
+        frame = frame[frame["date_set"] >= pd.Timestamp(date_string(since))]
+    if until is not None:
+        frame = frame[frame["date_set"] < pd.Timestamp(date_string(until))]
+    return frame
+
+
+def score_watermark(docs, activity_names=None):
+    """
+    returns the latest date_set of the score documents and the ids of the
+    documents taken on that date
+    """
+    watermark, boundary_ids = None, set()
+    for doc in docs:
+        for score in progress_summary.score_entries(doc.to_dict()):
+            if activity_names and score["activityName"] not in activity_names:
+                continue
+            day = score.get("date_set")
+            if day is None or (watermark is not None and day < watermark):
+                continue
+            if day != watermark:
+                watermark, boundary_ids = day, set()
+            boundary_ids.add(doc.id)
+    return watermark, boundary_ids
+
+
+def new_score_entry(email, docs, activity_names=None, include_acc_data=False):
+    """
+    returns the score_cache entry of a patients full list of score documents
+    """
+    watermark, boundary_ids = score_watermark(docs, activity_names)
+    return {
+        "frame": scores_frame(
+            docs, activity_names, include_acc_data, traces_collection(email)
+        ),
+        "watermark": watermark,
+        "boundary_ids": boundary_ids,
+        "lock": threading.Lock(),
+    }
+
+
+@metrics.timed
+def sync_score_entry(email, entry, activity_names=None, include_acc_data=False):
+    """
+    adds the scores taken since a score_cache entry was read to the entry
+    
+    Parameters
+    -------------
+    email : email address of patient
+    entry : score_cache entry holding the frame, watermark and boundary ids
+    activity_names : activities the frame holds, every activity when None
+    include_acc_data : the frame holds the raw accelerometer traces
+    
+    One query per activity reads the scores whose date_set is on or after the
+    watermark, documents already read on the watermark date are skipped.
+    The entry is updated in place, so it still expires when it was first read
+    """
+    import pandas as pd
+
+    if entry["watermark"] is None:
+        docs = read_scores(email, activity_names, include_acc_data)
+        fresh = new_score_entry(email, docs, activity_names, include_acc_data)
+        del fresh["lock"]
+        entry.update(fresh)
+        return
+
+    names = activity_names
+    if not names:
+        names = sorted(
+            set(entry["frame"]["activityName"].cat.categories)
+            | set(activity["name"] for activity in get_activities() or [])
+        )
+    docs = [
+        doc
+        for doc in stream_activity_scores(
+            email, names, activity_names, include_acc_data, entry["watermark"]
+        )
+        if doc.id not in entry["boundary_ids"]
+    ]
+    if not docs:
+        return
+
+    frame = pd.concat(
+        [
+            entry["frame"],
+            scores_frame(
+                docs, activity_names, include_acc_data, traces_collection(email)
+            ),
+        ],
+        ignore_index=True,
+    )
+    frame["activityName"] = pd.Categorical(frame["activityName"].astype(object))
+    watermark, boundary_ids = score_watermark(docs, activity_names)
+    if watermark == entry["watermark"]:
+        boundary_ids |= entry["boundary_ids"]
+    entry.update(frame=frame, watermark=watermark, boundary_ids=boundary_ids)
+
+
+def traces_collection(email):
+    return get_db().collection(u"patient_scores").document(email).collection(u"traces")
+
+
+def score_field_paths(activity_names, include_acc_data=False):
+    """
+    returns the firestore field paths of the score entries of the given activities
+    """
+    fields = SCORE_FIELDS + (["acc_data", "acc_ref"] if include_acc_data else [])
+    return [
+        "`%s`.%s" % (name, field) for name in activity_names for field in fields
+    ]
+
+
+@metrics.timed
+def scores_frame(docs, activity_names=None, include_acc_data=False, traces=None):
+    """
+    builds a typed dataframe from a stream of score documents
+    
+    Parameters
+    -------------
+    docs : score document snapshots, each holding a map per activity taken
+    activity_names : only keep these activities
+    include_acc_data : keep the raw accelerometer trace of each score
+    traces : collection holding the encoded traces referenced by acc_ref, they are
+    	read in one request once the scores have been streamed
+    
+    Returns
+    ------------
+    Dataframe with a categorical activityName, datetime date_set, float
+    max/min/avg values, a bool completed column and optionally acc_data arrays
+    """
+    import numpy as np
+    import pandas as pd
+    from traces import decode_trace
+
+    names, dates, max_values, min_values, avg_values, completed = [], [], [], [], [], []
+    acc_data = []
+    acc_refs = {}
+    for doc in docs:
+        for score in doc.to_dict().values():
+            if not isinstance(score, dict) or "activityName" not in score:
+                continue
+            if activity_names and score["activityName"] not in activity_names:
+                continue
+            names.append(score["activityName"])
+            dates.append(score.get("date_set"))
+            max_values.append(score.get("max_value", np.nan))
+            min_values.append(score.get("min_value", np.nan))
+            avg_values.append(score.get("avg_value", np.nan))
+            completed.append(bool(score.get("completed", False)))
+            if include_acc_data:
+                if "acc_ref" in score and "acc_data" not in score:
+                    acc_refs[score["acc_ref"]] = len(acc_data)
+                acc_data.append(np.asarray(score.get("acc_data", []), dtype=float))
+
+    if acc_refs and traces is not None:
+        references = [traces.document(ref) for ref in acc_refs]
+        for snapshot in get_db().get_all(references):
+            if snapshot.exists:
+                acc_data[acc_refs[snapshot.id]] = decode_trace(snapshot.get("acc"))[0]
+
+    columns = {
+        "activityName": pd.Categorical(names),
+        "date_set": pd.to_datetime(pd.Series(dates, dtype=object), format="%Y-%m-%d"),
+        "max_value": np.array(max_values, dtype=float),
+        "min_value": np.array(min_values, dtype=float),
+        "avg_value": np.array(avg_values, dtype=float),
+        "completed": np.array(completed, dtype=bool),
+    }
+    if include_acc_data:
+        columns["acc_data"] = pd.Series(acc_data, dtype=object)
+    return pd.DataFrame(columns)
+
+
+@metrics.timed
+def add_patient_score(email, score, sample_rate=0.0):
+    """
+    adds a patients activity score to the database
+    
+    Parameters
+    -------------
+    email : email address of patient
+    score : map of activity name to score entry, an entry may hold an acc_data trace
+    sample_rate : accelerometer samples per second
+    
+    Raw traces are encoded with encode_trace and kept in the traces collection,
+    the score document only holds a reference to them. The score and its traces
+    are written in a single batch
+    Returns the id of the score document, displays a message if the request was unsuccessful
+    """
+    try:
+        get_patient_summary(email)
+        scores = get_db().collection(u"patient_scores").document(email)
+        doc_ref = scores.collection(u"scores").document()
+        score_doc, writes = split_traces(scores, doc_ref.id, score, sample_rate)
+        summary_ref = get_db().collection(u"patient_summaries").document(email)
+
+        def write_score(transaction):
+            snapshot = summary_ref.get(transaction=transaction)
+            summary = snapshot.to_dict() if snapshot.exists else None
+            if summary is None or summary.get("version") != progress_summary.SUMMARY_VERSION:
+                summary = progress_summary.empty_summary()
+            progress_summary.apply_score(summary, score_doc, doc_ref.id)
+            transaction.set(doc_ref, score_doc)
+            for trace_ref, trace in writes:
+                transaction.set(trace_ref, trace)
+            transaction.set(summary_ref, summary)
+
+        get_backend().run_transaction(write_score)
+        return doc_ref.id
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+@metrics.timed
+def get_patient_summary(email):
+    """
+    retrieves a patients progress summary from the database
+    
+    Parameters
+    -------------
+    email : email address of patient
+    
+    The summary is updated by add_patient_score, scores written straight to the
+    database by the mobile application are added by sync_patient_summary. If it
+    does not exist yet it is built from the patients full score history
+    Displays a message if the request was unsuccessful
+    """
+    try:
+        doc = get_db().collection(u"patient_summaries").document(email).get()
+        if doc.exists:
+            summary = doc.to_dict()
+            if summary.get("version") == progress_summary.SUMMARY_VERSION:
+                return sync_patient_summary(email, summary)
+        return rebuild_patient_summary(email)
+    except Exception as e:
+        flash(json.loads(e.args[1])["error"]["message"], "error")
+
+
+@metrics.timed
+def rebuild_patient_summary(email):
+    """
+    rebuilds a patients progress summary from their full score history
+    
+    Parameters
+    -------------
+    email : email address of patient
+    
+    Returns the summary stored
+    """
+    docs = list(
+        get_db().collection(u"patient_scores")
+        .document(email)
+        .collection(u"scores")
+        .stream()
+    )
+    summary = progress_summary.build_summary(
+        [doc.to_dict() for doc in docs], [doc.id for doc in docs]
+    )
+    get_db().collection(u"patient_summaries").document(email).set(summary)
+    return summary
+
+
+def count_scores(email):
+    """
+    returns the number of score documents of a patient, counted by firestore
+    """
+    result = (
+        get_db().collection(u"patient_scores")
+        .document(email)
+        .collection(u"scores")
+        .count()
+        .get()
+    )
+    return result[0][0].value
+
+
+@metrics.timed
+def sync_patient_summary(email, summary):
+    """
+    adds the scores written since a summary was last updated to it
+    
+    Parameters
+    -------------
+    email : email address of patient
+    summary : the patients stored summary
+    
+    One query per activity reads the scores whose date_set is on or after the
+    summary last_date, documents already in last_ids are skipped, so an up to date
+    summary costs a read of the last session only. A count aggregation of the
+    scores, one read per thousand documents, is compared with the sessions of the
+    summary and the new scores, a score uploaded with a date before last_date or a
+    deleted score makes them differ and the summary is rebuilt
+    Returns the summary, stored again if new scores were added
+    """
+    names = summary_activity_names(summary, get_activities())
+    known = set(summary["last_ids"])
+    docs = [
+        doc
+        for doc in stream_activity_scores(
+            email, names, names, False, summary["last_date"]
+        )
+        if doc.id not in known
+    ]
+    if count_scores(email) != summary["sessions"] + len(docs):
+        return rebuild_patient_summary(email)
+    if not docs:
+        return summary
+    return store_summary_scores(email, summary, docs)
+
+
+def summary_activity_names(summary, activities):
+    """
+    returns the names of the activities whose new scores are added to a summary,
+    those already in it and those of the catalogue
+    """
+    return sorted(
+        set(summary["activities"])
+        | set(activity["name"] for activity in activities or [])
+    )
+
+
+def store_summary_scores(email, summary, docs):
+    """
+    adds new scores to a patients summary and stores it in a transaction
+    
+    Parameters
+    -------------
+    email : email address of patient
+    summary : the patients summary the scores were read for
+    docs : score documents not yet in the summary
+    
+    Returns the summary stored
+    """
+    summary_ref = get_db().collection(u"patient_summaries").document(email)
+
+    def write_summary(transaction):
+        snapshot = summary_ref.get(transaction=transaction)
+        current = snapshot.to_dict() if snapshot.exists else None
+        if current is None or current.get("version") != progress_summary.SUMMARY_VERSION:
+            current = summary
+        # scores added by add_patient_score since the summary was read are skipped
+        applied = set(current["last_ids"])
+        for doc in docs:
+            if doc.id not in applied:
+                progress_summary.apply_score(current, doc.to_dict(), doc.id)
+        transaction.set(summary_ref, current)
+        return current
+
+    return get_backend().run_transaction(write_summary)
+
+
+@metrics.timed
+def migrate_patient_traces(email, sample_rate=0.0):
+    """
+    moves the inline acc_data traces of a patients existing scores into the traces collection
+    
+    Parameters
+    -------------
+    email : email address of patient
+    sample_rate : accelerometer samples per second
+    
+    Scores uploaded by the mobile application still hold their traces inline, they
+    are moved by the migrate-traces command of the application, see README.md.
+    Documents already migrated are left as they are, so it can be run repeatedly
+    Returns the number of score documents rewritten
+    """
+    scores = get_db().collection(u"patient_scores").document(email)
+    writes = []
+    migrated = 0
+    for doc in scores.collection(u"scores").stream():
+        score = doc.to_dict()
+        summary, trace_writes = split_traces(scores, doc.id, score, sample_rate)
+        if trace_writes:
+            writes += [(doc.reference, summary)] + trace_writes
+            migrated += 1
+    commit_writes(writes)
+    return migrated
+
+
+def patient_emails():
+    """
+    returns the email addresses of the patients of every medical personnel
+    """
+    emails = set()
+    for staff in get_db().collection(u"medical_staff").stream():
+        for doc in (
+            get_db().collection(u"patients")
+            .document(staff.id)
+            .collection(u"patient_details")
+            .stream()
+        ):
+            emails.add(doc.id)
+    return sorted(emails)
+
+
+def split_traces(scores, doc_id, score, sample_rate=0.0):
+    """
+    separates the raw traces from a score document
+    
+    Parameters
+    -------------
+    scores : patient_scores document of the patient
+    doc_id : id of the score document
+    score : map of activity name to score entry
+    sample_rate : accelerometer samples per second
+    
+    Returns
+    ------------
+    Tuple of the score document without traces and a list of (document reference,
+    data) writes for the encoded traces
+    """
+    from traces import encode_trace
+
+    summary = {}
+    writes = []
+    for key, entry in score.items():
+        if isinstance(entry, dict) and "acc_data" in entry:
+            trace_id = doc_id + "_" + key
+            writes.append(
+                (
+                    scores.collection(u"traces").document(trace_id),
+                    {
+                        u"activityName": entry.get("activityName", key),
+                        u"date_set": entry.get("date_set"),
+                        u"acc": encode_trace(entry["acc_data"], sample_rate),
+                    },
+                )
+            )
+            entry = {k: v for k, v in entry.items() if k != "acc_data"}
+            entry[u"acc_ref"] = trace_id
+        summary[key] = entry
+    return summary, writes
+
+
+@metrics.timed
 def add_patient_activity(activity_details, email):
     """
     adds activities for a patient to the database
@@ -375,7 +1536,7 @@ def add_patient_activity(activity_details, email):
     """
     try:
         doc_ref = (
-            db.collection(u"patient_activities")
+            get_db().collection(u"patient_activities")
             .document(email)
             .collection(u"activities")
             .document(activity_details["name"])
@@ -391,6 +1552,7 @@ def add_patient_activity(activity_details, email):
         flash(json.loads(e.args[1])["error"]["message"], "error")
 
 
+@metrics.timed
 def get_activity_results(activity, email):
     """
     retrieves a selected patients activity results from the database
@@ -404,7 +1566,7 @@ def get_activity_results(activity, email):
     """
     try:
         docs = (
-            db.collection(u"patient_activities")
+            get_db().collection(u"patient_activities")
             .document(email)
             .collection(u"activities")
             .document(activity)
@@ -0,0 +1,159 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+live_cache.py
+contains an in process copy of firestore collections kept current by snapshot listeners
+
+each watched collection is read once, after that firestore pushes every change to
+the listener so reads are served from memory without a request to the database
+
+a listener whose first snapshot does not arrive in time is dropped, and one whose
+watch stopped, after an error of its stream or its callback, is subscribed again
+so a collection is never served from a copy that stopped following its writes
+"""
+import threading
+from collections import OrderedDict
+
+
+class LiveCollection:
+    """
+    copy of the documents of one collection kept current by an on_snapshot listener
+
+    Parameters
+    -------------
+    query : collection or query to watch
+    """
+
+    def __init__(self, query):
+        self.ready = threading.Event()
+        self.updates = 0
+        self.error = None
+        self._documents = []
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # the listener always receives the full result set, so it replaces the copy
+        try:
+            self._documents = [(doc.id, doc.to_dict()) for doc in docs]
+        except Exception as e:
+            # raising here would stop the watch thread, or the write notifying
+            # the local backend, the cache subscribes again on its next read
+            self.error = e
+            return
+        self.updates += 1
+        self.ready.set()
+
+    def is_active(self):
+        """
+        returns False once the watch stopped, the firestore watch closes itself
+        when its stream fails, or once a snapshot could not be applied
+        """
+        return self.error is None and self._watch.is_active
+
+    def documents(self):
+        """
+        returns (document id, data) pairs of the watched documents, the data are copies
+        """
+        return [(doc_id, dict(data)) for doc_id, data in self._documents]
+
+    def close(self):
+        self._watch.unsubscribe()
+
+
+class LiveCache:
+    """
+    bounded set of watched collections
+
+    Parameters
+    -------------
+    maxsize : maximum number of listeners kept open, the least recently read
+        collection stops being watched first
+    timeout : number of seconds to wait for the first snapshot of a collection
+    """
+
+    def __init__(self, maxsize=100, timeout=10):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._collections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._collections)
+
+    def documents(self, path, query):
+        """
+        returns the (document id, data) pairs of a watched collection
+
+        Parameters
+        -------------
+        path : key of the collection, its firestore path
+        query : collection reference, a listener is attached on the first read
+
+        Returns None if the first snapshot did not arrive within the timeout, the
+        caller then reads the collection directly and the next read subscribes again
+        """
+        stopped = []
+        with self._lock:
+            collection = self._collections.get(path)
+            if collection is not None and not collection.is_active():
+                stopped.append(self._collections.pop(path))
+                collection = None
+            if collection is None:
+                self.misses += 1
+                collection = self._collections[path] = LiveCollection(query)
+                while len(self._collections) > self.maxsize:
+                    stopped.append(self._collections.popitem(last=False)[1])
+            else:
+                self.hits += 1
+            self._collections.move_to_end(path)
+        for old in stopped:
+            old.close()
+        if not collection.ready.wait(self.timeout):
+            with self._lock:
+                if self._collections.get(path) is collection:
+                    del self._collections[path]
+            collection.close()
+            return None
+        if not collection.is_active():
+            return None
+        return collection.documents()
+
+    def peek(self, path):
+        """
+        returns the (document id, data) pairs of a collection whose copy is already
+        current, without waiting, or None when it is not watched yet, still waiting
+        for its first snapshot or stopped, documents then subscribes and waits
+        """
+        with self._lock:
+            collection = self._collections.get(path)
+            if (
+                collection is None
+                or not collection.ready.is_set()
+                or not collection.is_active()
+            ):
+                return None
+            self.hits += 1
+            self._collections.move_to_end(path)
+        return collection.documents()
+
+    def close(self):
+        """
+        stops every listener
+        """
+        with self._lock:
+            collections, self._collections = self._collections, OrderedDict()
+        for collection in collections.values():
+            collection.close()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "size": len(self._collections),
+            "maxsize": self.maxsize,
+        }
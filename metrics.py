@@ -0,0 +1,472 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+metrics.py
+contains the counters and latency histograms of the web application, rendered in
+the prometheus text format by the /metrics url
+
+    balance_request_duration_seconds : request latency by endpoint
+    balance_data_call_duration_seconds : latency of each data_utils function
+    balance_firestore_* : database calls, documents read and latency by operation
+    balance_chart_* : chart renders by chart type and chart store hits
+    balance_cache_* : hit rates of the data caches, read when scraped
+
+the time each request spends in the database, the data layer and chart rendering
+is also returned in a Server-Timing header
+"""
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+from flask import has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIMINGS_KEY = "balance.timings"
+
+# number of instrumented data calls the current call is nested in, only the
+# outermost call adds to the data time of a request
+_data_depth = contextvars.ContextVar("balance_data_depth", default=0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    monotonically increasing value per combination of label values
+
+    Parameters
+    -------------
+    name : metric name
+    documentation : help text
+    labels : names of the labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "%s%s %s" % (self.name, _label_text(self.labels, key), _number(value))
+
+
+class Histogram:
+    """
+    distribution of observed values in cumulative buckets per combination of
+    label values
+
+    Parameters
+    -------------
+    name : metric name
+    documentation : help text
+    labels : names of the labels
+    buckets : upper bounds of the buckets in seconds
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        counts = self._values.get(key, ([0] * len(self.buckets), 0.0))[0]
+        return counts[-1]
+
+    def lines(self):
+        with self._lock:
+            values = sorted((key, (list(c), t)) for key, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                labels = _label_text(self.labels, key, [("le", _number(bound))])
+                yield "%s_bucket%s %d" % (self.name, labels, count)
+            labels = _label_text(self.labels, key)
+            yield "%s_sum%s %s" % (self.name, labels, _number(total))
+            yield "%s_count%s %d" % (self.name, labels, counts[-1])
+
+
+class Registry:
+    """
+    set of metrics rendered together, collectors add gauges read at render time
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        adds a function returning (name, documentation, labels, value) gauges
+        """
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        """
+        returns every metric in the prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend(metric.lines())
+        gauges = {}
+        for collector in self.collectors:
+            for name, documentation, labels, value in collector():
+                gauges.setdefault(name, (documentation, []))[1].append((labels, value))
+        for name, (documentation, samples) in gauges.items():
+            lines.append("# HELP %s %s" % (name, documentation))
+            lines.append("# TYPE %s gauge" % name)
+            for labels, value in samples:
+                names = sorted(labels)
+                lines.append(
+                    "%s%s %s"
+                    % (name, _label_text(names, [labels[n] for n in names]), _number(value))
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "balance_request_duration_seconds",
+    "Request latency by endpoint",
+    ["endpoint", "method", "status"],
+)
+DATA_LATENCY = registry.histogram(
+    "balance_data_call_duration_seconds",
+    "Latency of data layer functions",
+    ["function"],
+)
+FIRESTORE_CALLS = registry.counter(
+    "balance_firestore_calls_total", "Database calls by operation", ["operation"]
+)
+FIRESTORE_DOCUMENTS = registry.counter(
+    "balance_firestore_documents_read_total",
+    "Documents read by operation",
+    ["operation"],
+)
+FIRESTORE_LATENCY = registry.histogram(
+    "balance_firestore_call_duration_seconds",
+    "Database call latency by operation, streams are timed until fully read",
+    ["operation"],
+)
+CHART_RENDER = registry.histogram(
+    "balance_chart_render_duration_seconds", "Chart render time by chart", ["chart"]
+)
+CHART_STORE = registry.counter(
+    "balance_chart_store_requests_total",
+    "Chart store lookups by chart and result",
+    ["chart", "result"],
+)
+
+
+class RequestTimings:
+    """
+    time spent by one request in each part of the application, summed over
+    every thread working on the request
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self.durations.get(name, (0.0, 0))
+            self.durations[name] = (total + seconds, count + 1)
+
+    def header(self):
+        """
+        returns the Server-Timing header value, durations are in milliseconds
+        """
+        with self._lock:
+            durations = sorted(self.durations.items())
+        parts = [
+            '%s;dur=%.2f;desc="%d calls"' % (name, total * 1000, count)
+            for name, (total, count) in durations
+        ]
+        parts.append("total;dur=%.2f" % ((time.perf_counter() - self.started) * 1000))
+        return ", ".join(parts)
+
+
+def current_timings():
+    """
+    returns the timings of the current request, or None outside a request
+    """
+    if not has_request_context():
+        return None
+    return request.environ.get(TIMINGS_KEY)
+
+
+def record(name, seconds):
+    """
+    adds time spent in a part of the application to the current request
+    """
+    timings = current_timings()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def start_request():
+    request.environ[TIMINGS_KEY] = RequestTimings()
+
+
+def finish_request(response):
+    """
+    observes the latency of the request and adds its Server-Timing header
+    """
+    timings = current_timings()
+    if timings is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    REQUEST_LATENCY.observe(
+        time.perf_counter() - timings.started,
+        endpoint=endpoint,
+        method=request.method,
+        status=response.status_code,
+    )
+    response.headers["Server-Timing"] = timings.header()
+    return response
+
+
+def timed(function):
+    """
+    decorator observing the latency of a data layer function, sync or async
+    """
+    name = function.__name__
+
+    def enter():
+        return _data_depth.set(_data_depth.get() + 1), time.perf_counter()
+
+    def leave(token, start):
+        elapsed = time.perf_counter() - start
+        _data_depth.reset(token)
+        DATA_LATENCY.observe(elapsed, function=name)
+        if _data_depth.get() == 0:
+            record("data", elapsed)
+
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            token, start = enter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                leave(token, start)
+
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token, start = enter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            leave(token, start)
+
+    return wrapper
+
+
+def observe_render(chart, seconds):
+    CHART_RENDER.observe(seconds, chart=chart)
+    record("chart", seconds)
+
+
+def _observe_call(operation, seconds, documents=0):
+    FIRESTORE_CALLS.inc(operation=operation)
+    FIRESTORE_LATENCY.observe(seconds, operation=operation)
+    if documents:
+        FIRESTORE_DOCUMENTS.inc(documents, operation=operation)
+    record("db", seconds)
+
+
+# methods returning another reference or query, their result is instrumented too
+_NAVIGATION = {
+    "collection",
+    "document",
+    "where",
+    "order_by",
+    "limit",
+    "limit_to_last",
+    "offset",
+    "start_at",
+    "start_after",
+    "end_at",
+    "end_before",
+    "select",
+    "count",
+    "batch",
+}
+
+# methods making a request to the database
+_READS = {"get", "stream", "get_all", "collections"}
+_WRITES = {"set", "update", "delete", "add", "create", "commit"}
+
+
+def instrument_client(client):
+    """
+    returns client wrapped so every database call it makes is counted and timed
+    """
+    return InstrumentedReference(client, "client")
+
+
+def _unwrap(value):
+    if isinstance(value, InstrumentedReference):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    return value
+
+
+def _kind(target):
+    if hasattr(target, "commit"):
+        return "batch"
+    if hasattr(target, "get_all"):
+        return "client"
+    if hasattr(target, "set"):
+        return "document"
+    return "query"
+
+
+class InstrumentedReference:
+    """
+    wraps a firestore client, reference, query or write batch, counting and timing
+    the calls it makes to the database
+    """
+
+    def __init__(self, target, kind=None):
+        self._target = target
+        self._kind = kind or _kind(target)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute) or (
+            name not in _NAVIGATION and name not in _READS and name not in _WRITES
+        ):
+            return attribute
+
+        operation = "%s.%s" % (self._kind, name)
+
+        def call(*args, **kwargs):
+            args = [_unwrap(arg) for arg in args]
+            kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            if name in _NAVIGATION:
+                return InstrumentedReference(attribute(*args, **kwargs))
+            start = time.perf_counter()
+            result = attribute(*args, **kwargs)
+            if name == "collections":
+                collections = [InstrumentedReference(c) for c in result]
+                _observe_call(operation, time.perf_counter() - start)
+                return collections
+            if inspect.iscoroutine(result):
+                return _timed_coroutine(result, operation, start)
+            if inspect.isasyncgen(result):
+                return _timed_async_iter(result, operation, start)
+            if name in ("stream", "get_all"):
+                return _timed_iter(result, operation, start)
+            _observe_call(operation, time.perf_counter() - start, _documents(name, result))
+            return result
+
+        return call
+
+    def __len__(self):
+        return len(self._target)
+
+
+def _documents(name, result):
+    if name != "get":
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+def _timed_iter(iterator, operation, start):
+    count = 0
+    try:
+        for item in iterator:
+            count += 1
+            yield item
+    finally:
+        _observe_call(operation, time.perf_counter() - start, count)
+
+
+async def _timed_coroutine(coroutine, operation, start):
+    try:
+        result = await coroutine
+    finally:
+        elapsed = time.perf_counter() - start
+    name = operation.rsplit(".", 1)[-1]
+    _observe_call(operation, elapsed, _documents(name, result))
+    return result
+
+
+async def _timed_async_iter(iterator, operation, start):
+    count = 0
+    try:
+        async for item in iterator:
+            count += 1
+            yield item
+    finally:
+        _observe_call(operation, time.perf_counter() - start, count)
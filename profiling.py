@@ -0,0 +1,298 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+profiling.py
+contains the opt in profiling of single requests
+
+a request is profiled when it sends the admin token set by BALANCE_PROFILE_TOKEN
+in the X-Balance-Profile header or the profile query parameter, or when it is
+picked by the BALANCE_PROFILE_SAMPLE_RATE sampling rate (0 by default)
+
+the view, the data_utils reads it runs on the fetch pool and the charts drawn in
+the process pool are profiled with cProfile and merged, the result is stored as
+a pstats file and a text report in BALANCE_PROFILE_DIR/<endpoint>/<request id>
+an async view and the reads it runs on the client loop are profiled on the threads
+running their coroutines, only while their own steps run, so other requests
+sharing the loop are left out
+the newest BALANCE_PROFILE_KEEP profiles (200 by default) are kept, older ones
+are deleted when a profile is stored
+"""
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+import types
+import uuid
+
+from flask import has_request_context, request
+
+PROFILE_HEADER = "X-Balance-Profile"
+
+PROFILE_KEY = "balance.profile"
+
+# number of functions listed in the text report
+REPORT_LINES = 40
+
+# number of profiles kept in the profile directory
+DEFAULT_KEEP = 200
+
+# marks a thread running a step of a profiled coroutine
+_stepping = threading.local()
+
+
+def profile_dir():
+    return os.environ.get(
+        "BALANCE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "balance_profiles")
+    )
+
+
+def profile_keep():
+    return int(os.environ.get("BALANCE_PROFILE_KEEP", DEFAULT_KEEP))
+
+
+def matches_token(token, value):
+    """
+    returns True if value is the admin token, compared in constant time
+    """
+    if not value:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), value.encode("utf-8"))
+
+
+def requested():
+    """
+    returns True if the current request asks to be profiled
+    """
+    token = os.environ.get("BALANCE_PROFILE_TOKEN")
+    if token and any(
+        matches_token(token, value)
+        for value in (request.headers.get(PROFILE_HEADER), request.args.get("profile"))
+    ):
+        return True
+    rate = float(os.environ.get("BALANCE_PROFILE_SAMPLE_RATE", 0))
+    return rate > 0 and random.random() < rate
+
+
+class ProfileStats:
+    """
+    profile statistics received from another process, in the form pstats.Stats loads
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RequestProfile:
+    """
+    profile of one request, made of the profiles of every thread and process
+    that worked on it
+
+    Parameters
+    -------------
+    request_id : id the output is stored under
+    """
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.profiler = cProfile.Profile()
+        self._parts = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def wrap(self, function):
+        """
+        returns function profiled in whichever thread it runs in
+        """
+
+        def profiled(*args, **kwargs):
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                profiler.create_stats()
+                self.add(ProfileStats(profiler.stats))
+
+        return profiled
+
+    @types.coroutine
+    def wrap_coroutine(self, coroutine):
+        """
+        returns coroutine profiled in whichever thread runs it, the profiler is
+        only enabled while the coroutine itself runs, not while it waits
+        """
+        profiler = cProfile.Profile()
+        try:
+            return (yield from _profiled_steps(coroutine, profiler))
+        finally:
+            profiler.create_stats()
+            self.add(ProfileStats(profiler.stats))
+
+    def add(self, stats):
+        if not stats.stats:
+            # nothing ran while the profiler was enabled, pstats refuses to load it
+            return
+        with self._lock:
+            self._parts.append(stats)
+
+    def stats(self):
+        """
+        returns the merged pstats.Stats of the request
+        """
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        with self._lock:
+            for part in self._parts:
+                stats.add(part)
+        return stats
+
+    def save(self, endpoint):
+        """
+        stores the profile, returns the path of the pstats file
+        """
+        directory = os.path.join(profile_dir(), re.sub(r"[^\w.-]", "_", endpoint))
+        os.makedirs(directory, exist_ok=True)
+        name = "%s-%s" % (time.strftime("%Y%m%dT%H%M%S"), self.request_id)
+        path = os.path.join(directory, name + ".pstats")
+        stats = self.stats()
+        stats.dump_stats(path)
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+        with open(os.path.join(directory, name + ".txt"), "w") as f:
+            f.write(report.getvalue())
+        prune(profile_keep())
+        return path
+
+
+def _profiled_steps(coroutine, profiler):
+    # drives coroutine one step at a time, the same as await, with profiler
+    # enabled for each step
+    value, error = None, None
+    while True:
+        # a coroutine awaited inside the step of another profiled coroutine is
+        # already profiled by the profiler enabled for that step
+        nested = getattr(_stepping, "active", False)
+        if not nested:
+            _stepping.active = True
+            profiler.enable()
+        try:
+            if error is None:
+                step = coroutine.send(value)
+            else:
+                step = coroutine.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            if not nested:
+                profiler.disable()
+                _stepping.active = False
+        try:
+            value, error = (yield step), None
+        except GeneratorExit:
+            coroutine.close()
+            raise
+        except BaseException as e:
+            value, error = None, e
+
+
+def prune(keep):
+    """
+    deletes the oldest profiles so that at most keep are left in the profile
+    directory
+
+    Parameters
+    -------------
+    keep : number of profiles to keep
+    """
+    paths = []
+    for root, _, files in os.walk(profile_dir()):
+        paths.extend(os.path.join(root, f) for f in files if f.endswith(".pstats"))
+    paths.sort(key=lambda path: (os.path.getmtime(path), os.path.basename(path)))
+    for path in paths[: max(len(paths) - keep, 0)]:
+        for stored in (path, path[: -len(".pstats")] + ".txt"):
+            try:
+                os.remove(stored)
+            except FileNotFoundError:
+                pass
+
+
+def current_profile():
+    """
+    returns the profile of the current request, or None if it is not profiled
+    """
+    if not has_request_context():
+        return None
+    return request.environ.get(PROFILE_KEY)
+
+
+def profiled_view(view):
+    """
+    decorator profiling an async view on the thread its coroutine runs on
+    """
+
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        coroutine = view(*args, **kwargs)
+        profile = current_profile()
+        if profile is None:
+            return await coroutine
+        return await profile.wrap_coroutine(coroutine)
+
+    return wrapper
+
+
+def start_request():
+    if not requested():
+        return
+    request_id = re.sub(r"[^\w-]", "", request.headers.get("X-Request-ID", ""))
+    profile = RequestProfile(request_id or uuid.uuid4().hex)
+    request.environ[PROFILE_KEY] = profile
+    profile.start()
+
+
+def finish_request(response):
+    """
+    stores the profile of a profiled request and returns its id in a header
+    """
+    profile = current_profile()
+    if profile is None:
+        return response
+    profile.stop()
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    profile.save(endpoint)
+    response.headers[PROFILE_HEADER + "-Id"] = profile.request_id
+    return response
+
+
+def teardown_request(exception=None):
+    # stops the profiler when the view raised and finish_request was not called
+    profile = current_profile()
+    if profile is not None:
+        profile.stop()
+
+
+def profiled_call(function, *args):
+    """
+    runs function under cProfile, used in worker processes
+
+    Returns a tuple of the result and the profile statistics
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    profiler.create_stats()
+    return result, profiler.stats
@@ -0,0 +1,167 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+render_pool.py
+contains a pool of long lived kaleido renderers used to export plotly charts to images
+each worker keeps its own warmed kaleido process, so an export only pays for the
+render itself and the number of browser processes is fixed by the pool size
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+_STOP = object()
+
+
+class RenderTimeout(Exception):
+    """
+    raised when a chart could not be rendered within the render timeout
+    """
+
+
+def _create_scope():
+    import plotly
+    from kaleido.scopes.plotly import PlotlyScope
+
+    plotlyjs = os.path.join(
+        os.path.dirname(os.path.abspath(plotly.__file__)),
+        "package_data",
+        "plotly.min.js",
+    )
+    # the charts use no latex, so mathjax is disabled rather than fetched from a cdn
+    return PlotlyScope(plotlyjs=plotlyjs, mathjax=False)
+
+
+def _warm_up_figure():
+    return {"data": [{"type": "bar", "x": [0], "y": [0]}], "layout": {}}
+
+
+class _Worker(threading.Thread):
+    def __init__(self, pool, number):
+        super().__init__(name="kaleido-render-%d" % number, daemon=True)
+        self.pool = pool
+        self.scope = None
+        self.current = None
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            self.scope = _create_scope()
+            self.scope.transform(_warm_up_figure(), format="png")
+        except Exception:
+            # a failed warm up is retried by the first real render
+            pass
+        self.ready.set()
+        while True:
+            job = self.pool._jobs.get()
+            if job is _STOP:
+                break
+            future, fig_dict, options = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.current = future
+            try:
+                if self.scope is None:
+                    self.scope = _create_scope()
+                future.set_result(self.scope.transform(fig_dict, **options))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.current = None
+
+    def abort(self, future):
+        """
+        kills the kaleido process if it is still rendering future, a new process is
+        started by the next render
+        """
+        if self.current is future and self.scope is not None:
+            self.scope._shutdown_kaleido()
+
+
+class PlotlyRenderPool:
+    """
+    pool of worker threads each owning a warmed kaleido renderer
+
+    Parameters
+    -------------
+    size : number of kaleido processes, also the number of renders run at once
+    timeout : number of seconds a render may wait and run before RenderTimeout is raised
+    queue_size : number of renders allowed to wait for a free worker
+    """
+
+    def __init__(self, size=2, timeout=30, queue_size=64):
+        self.size = size
+        self.timeout = timeout
+        self._jobs = queue.Queue(queue_size)
+        self._workers = []
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return bool(self._workers)
+
+    def start(self):
+        """
+        starts the workers, each warms its renderer in the background
+        """
+        with self._lock:
+            if not self._workers:
+                self._workers = [_Worker(self, i) for i in range(self.size)]
+                for worker in self._workers:
+                    worker.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """
+        waits until every worker has warmed its renderer
+        """
+        return all(worker.ready.wait(timeout) for worker in self._workers)
+
+    def render(self, fig, format="png", width=None, height=None, scale=None, timeout=None):
+        """
+        renders a plotly figure to image bytes
+
+        Parameters
+        -------------
+        fig : plotly figure or figure dict
+        format : image format, png by default
+        width, height, scale : image size options passed to kaleido
+        timeout : overrides the pool timeout for this render
+        """
+        from plotly.io._utils import validate_coerce_fig_to_dict
+
+        if not self.started:
+            self.start()
+        timeout = self.timeout if timeout is None else timeout
+        future = Future()
+        options = dict(format=format, width=width, height=height, scale=scale)
+        try:
+            self._jobs.put(
+                (future, validate_coerce_fig_to_dict(fig, True), options),
+                timeout=timeout,
+            )
+        except queue.Full:
+            raise RenderTimeout("Chart render queue is full")
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if not future.cancel():
+                for worker in self._workers:
+                    worker.abort(future)
+            raise RenderTimeout("Chart render timed out after %s seconds" % timeout)
+
+    def shutdown(self):
+        """
+        stops the workers and their kaleido processes
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            self._jobs.put(_STOP)
+        for worker in workers:
+            worker.join()
+            if worker.scope is not None:
+                worker.scope._shutdown_kaleido()
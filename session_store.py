@@ -0,0 +1,197 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+session_store.py
+contains the server side session store of the web application
+
+the session cookie only holds a random session id, the session data are kept in a
+sqlite database shared by every worker process on the host, so large values such
+as patient details do not travel with every request and response
+"""
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SESSION_DB_ENV = "BALANCE_SESSION_DB"
+
+# expired sessions are deleted at most once in this number of seconds
+PURGE_INTERVAL = 600
+
+_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{43}")
+
+
+def default_session_db(instance_path):
+    """
+    returns the sqlite file named by BALANCE_SESSION_DB, by default a file in the
+    instance folder of the application rather than the shared temporary directory
+    """
+    return os.environ.get(
+        SESSION_DB_ENV, os.path.join(instance_path, "balance_sessions.sqlite3")
+    )
+
+
+def create_private_file(path):
+    """
+    creates path readable and writable only by the owner, in a directory only the
+    owner can enter if it is created too, and tightens the mode of an existing file
+    sqlite gives its journal files the mode of the database file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    os.chmod(path, 0o600)
+
+
+class SessionStore:
+    """
+    sqlite table of session data keyed by session id
+
+    Parameters
+    -------------
+    path : sqlite database file, ":memory:" keeps sessions in process
+    timer : clock used for expiry, defaults to time.time
+    """
+
+    def __init__(self, path, timer=time.time):
+        self.path = path
+        self.timer = timer
+        if path != ":memory:":
+            create_private_file(path)
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=30
+        )
+        self.lock = threading.Lock()
+        self.last_purge = 0.0
+        # the serializer of flask's cookie sessions, so tuples, dates and bytes
+        # come back as they were stored
+        self.serializer = TaggedJSONSerializer()
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, session_id):
+        """
+        returns the data of a session, or None if it is missing or expired
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM sessions WHERE id = ? AND expires > ?",
+                (session_id, self.timer()),
+            ).fetchone()
+        return self.serializer.loads(row[0]) if row else None
+
+    def save(self, session_id, data, lifetime):
+        """
+        stores the data of a session for lifetime seconds
+        """
+        now = self.timer()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                (session_id, self.serializer.dumps(data), now + lifetime),
+            )
+            if now - self.last_purge > PURGE_INTERVAL:
+                self.last_purge = now
+                self.connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def delete(self, session_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    session whose data are kept in the session store
+
+    Parameters
+    -------------
+    session_id : id sent in the session cookie, None starts a new session
+    data : data of the session
+    """
+
+    def __init__(self, session_id=None, data=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(data, on_update)
+        self.new = session_id is None
+        self.session_id = session_id or secrets.token_urlsafe(32)
+        self.previous_id = None
+        self.modified = False
+
+    def regenerate(self):
+        """
+        moves the session to a new id, called on login so an id known before
+        logging in cannot be used to reach the logged in session
+        """
+        if not self.new and self.previous_id is None:
+            self.previous_id = self.session_id
+        self.session_id = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    flask session interface keeping session data in a SessionStore
+
+    Parameters
+    -------------
+    store : session store the session data are kept in
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id and _SESSION_ID.fullmatch(session_id):
+            data = self.store.get(session_id)
+            if data is not None:
+                return ServerSession(session_id, data)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_id is not None:
+            self.store.delete(session.previous_id)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.session_id)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        self.store.save(
+            session.session_id,
+            dict(session),
+            app.permanent_session_lifetime.total_seconds(),
+        )
+        response.vary.add("Cookie")
+        response.set_cookie(
+            name,
+            session.session_id,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
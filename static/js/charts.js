@@ -0,0 +1,78 @@
+/*
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+charts.js - draws the balance performance charts in the browser with plotly.js
+from the series returned by the chart data api
+*/
+
+var chartTitleFont = {size: 18, color: "#8C55AA"};
+
+var chartBuilders = {
+	activity_week: function (data) {
+		return {
+			data: [{type: "bar", x: data.dates, y: data.attempts, marker: {color: "red"}}],
+			layout: {title: {text: "Dates activities taken last week", font: chartTitleFont},
+				yaxis: {dtick: 1}}
+		};
+	},
+	activities_completed: function (data) {
+		return {
+			data: [
+				{type: "bar", name: "completed", x: data.activities, y: data.completed,
+					text: data.completed},
+				{type: "bar", name: "failed", x: data.activities, y: data.failed,
+					text: data.failed}
+			],
+			layout: {title: {text: "Activities completed"}, barmode: "group",
+				yaxis: {title: {text: "Activities carried out"}}}
+		};
+	},
+	results_sunburst: sunburstChart,
+	activity_sunburst: sunburstChart,
+	activity_average: function (data) {
+		return {
+			data: [
+				{type: "scatter", mode: "lines", name: "avg_value", x: data.dates, y: data.avg_value},
+				{type: "scatter", mode: "lines", name: "max_value", x: data.dates, y: data.max_value}
+			],
+			layout: {title: {text: "Overall Average Score"}}
+		};
+	},
+	activity_movements: function (data, series) {
+		var traces = data.traces.map(function (trace, i) {
+			var axis = i === 0 ? "" : String(i + 1);
+			return {
+				type: "scatter", mode: "lines", name: series.activity + " " + trace.date,
+				x: trace.x, y: trace.y, xaxis: "x" + axis, yaxis: "y" + axis,
+				line: trace.completed ? {} : {color: "red"}
+			};
+		});
+		return {
+			data: traces,
+			layout: {grid: {rows: 3, columns: 3, pattern: "independent"}}
+		};
+	}
+};
+
+function sunburstChart(data) {
+	return {
+		data: [{type: "sunburst", ids: data.ids, labels: data.labels, parents: data.parents,
+			values: data.values, branchvalues: "total"}],
+		layout: {margin: {t: 10, l: 10, r: 10, b: 10}}
+	};
+}
+
+function renderCharts(url) {
+	fetch(url, {credentials: "same-origin"})
+		.then(function (response) { return response.json(); })
+		.then(function (series) {
+			Object.keys(chartBuilders).forEach(function (name) {
+				var element = document.getElementById(name);
+				if (element && series[name]) {
+					var chart = chartBuilders[name](series[name], series);
+					Plotly.newPlot(element, chart.data, chart.layout, {responsive: true});
+				}
+			});
+		});
+}
@@ -0,0 +1,278 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+summary.py
+contains methods for maintaining a patients progress summary
+
+the summary is a single document updated as each score arrives, holding
+    activities : per activity attempts, completed count, min/max values, sum of
+        average values and last date taken
+    daily : per day and activity attempts and completed counts of the DAILY_DAYS
+        days up to last_date, so the document does not grow with the history
+    last_date : date of the last session
+    last_session : score entries of the last session
+    last_ids : ids of the score documents taken on last_date
+    sessions : number of score documents applied
+so the progress page does not need the patients full score history, last_date and
+last_ids are the watermark scores written straight to the database are synced from
+and sessions detects a score dated before the watermark, see
+data_utils.sync_patient_summary
+"""
+from datetime import datetime, timedelta
+
+SUMMARY_VERSION = 3
+
+# days of daily counts kept, the longest window drawn by the progress page
+DAILY_DAYS = 28
+
+SUMMARY_FIELDS = [
+    "activityName",
+    "date_set",
+    "max_value",
+    "min_value",
+    "avg_value",
+    "completed",
+]
+
+
+def empty_summary():
+    return {
+        "version": SUMMARY_VERSION,
+        "sessions": 0,
+        "activities": {},
+        "daily": {},
+        "last_date": None,
+        "last_session": [],
+        "last_ids": [],
+    }
+
+
+def score_entries(score):
+    """
+    returns the activity score entries of a score document
+    """
+    return [
+        entry
+        for entry in score.values()
+        if isinstance(entry, dict) and "activityName" in entry
+    ]
+
+
+def apply_score(summary, score, doc_id=None):
+    """
+    adds a score document to a summary
+
+    Parameters
+    -------------
+    summary : summary map, updated in place
+    score : map of activity name to score entry
+    doc_id : id of the score document, kept in last_ids when taken on last_date
+
+    Returns the updated summary
+    """
+    summary["sessions"] += 1
+    for entry in score_entries(score):
+        name = entry["activityName"]
+        day = entry.get("date_set")
+        completed = bool(entry.get("completed", False))
+
+        stats = summary["activities"].setdefault(
+            name,
+            {
+                "attempts": 0,
+                "completed": 0,
+                "min_value": None,
+                "max_value": None,
+                "total_avg": 0.0,
+                "last_date": None,
+            },
+        )
+        stats["attempts"] += 1
+        stats["completed"] += int(completed)
+        stats["min_value"] = _min(stats["min_value"], entry.get("min_value"))
+        stats["max_value"] = _max(stats["max_value"], entry.get("max_value"))
+        stats["total_avg"] += entry.get("avg_value") or 0.0
+        stats["last_date"] = _max(stats["last_date"], day)
+
+        if day is None:
+            continue
+        counts = summary["daily"].setdefault(day, {}).setdefault(
+            name, {"attempts": 0, "completed": 0}
+        )
+        counts["attempts"] += 1
+        counts["completed"] += int(completed)
+
+        row = {field: entry.get(field) for field in SUMMARY_FIELDS}
+        if summary["last_date"] is None or day > summary["last_date"]:
+            summary["last_date"] = day
+            summary["last_session"] = [row]
+            summary["last_ids"] = []
+        elif day == summary["last_date"]:
+            summary["last_session"].append(row)
+        if day == summary["last_date"] and doc_id and doc_id not in summary["last_ids"]:
+            summary["last_ids"].append(doc_id)
+    trim_daily(summary)
+    return summary
+
+
+def trim_daily(summary):
+    """
+    removes the daily counts of days more than DAILY_DAYS before last_date
+    """
+    if summary["last_date"] is None:
+        return
+    first = (last_date(summary) - timedelta(DAILY_DAYS - 1)).strftime("%Y-%m-%d")
+    for day in [day for day in summary["daily"] if day < first]:
+        del summary["daily"][day]
+
+
+def build_summary(scores, doc_ids=None):
+    """
+    builds a summary from a patients full list of score documents
+
+    Parameters
+    -------------
+    scores : score documents
+    doc_ids : ids of the score documents in the same order, kept in last_ids
+    """
+    summary = empty_summary()
+    if doc_ids is None:
+        for score in scores:
+            apply_score(summary, score)
+    else:
+        for score, doc_id in zip(scores, doc_ids):
+            apply_score(summary, score, doc_id)
+    return summary
+
+
+def activity_stats(summary, activity_names=None):
+    """
+    returns the per activity statistics of a summary
+
+    Parameters
+    -------------
+    summary : patient summary
+    activity_names : names of the activities in the catalogue, activities in the
+        summary but not in the catalogue are added after them
+
+    Returns
+    ------------
+    List containing a map for each activity with the number of attempts, the number
+    completed, the percentage completed and the min, average and max values, an
+    activity with no attempts has a percentage of None
+    """
+    names = list(activity_names or [])
+    names += [name for name in summary["activities"] if name not in names]
+    stats = []
+    for name in names:
+        activity = summary["activities"].get(name)
+        attempts = activity["attempts"] if activity else 0
+        completed = activity["completed"] if activity else 0
+        stats.append(
+            {
+                "activityName": name,
+                "attempts": attempts,
+                "completed": completed,
+                "percentage": round(completed / attempts * 100, 2) if attempts else None,
+                "min_value": activity["min_value"] if activity else None,
+                "avg_value": round(activity["total_avg"] / attempts, 2)
+                if attempts
+                else None,
+                "max_value": activity["max_value"] if activity else None,
+            }
+        )
+    return stats
+
+
+def daily_counts(summary, start, end):
+    """
+    returns the number of activities taken on each day from start to end inclusive
+
+    Parameters
+    -------------
+    summary : patient summary
+    start : first date
+    end : last date
+
+    Returns
+    ------------
+    List of (date, attempts, completed) tuples
+    """
+    counts = []
+    day = start
+    while day <= end:
+        activities = summary["daily"].get(day.strftime("%Y-%m-%d"), {})
+        counts.append(
+            (
+                day,
+                sum(a["attempts"] for a in activities.values()),
+                sum(a["completed"] for a in activities.values()),
+            )
+        )
+        day += timedelta(1)
+    return counts
+
+
+def rolling_stats(summary, today, days):
+    """
+    returns the number of activities attempted and completed in the last number of days
+
+    Parameters
+    -------------
+    summary : patient summary
+    today : last day of the window
+    days : length of the window
+    """
+    window = daily_counts(summary, today - timedelta(days - 1), today)
+    attempts = sum(count[1] for count in window)
+    completed = sum(count[2] for count in window)
+    return {
+        "days": days,
+        "attempts": attempts,
+        "completed": completed,
+        "active_days": sum(1 for count in window if count[1]),
+        "percentage": round(completed / attempts * 100, 2) if attempts else None,
+    }
+
+
+def daily_activity_rows(summary):
+    """
+    returns one row per day and activity with its attempts and completed counts,
+    for the DAILY_DAYS days up to the last session
+    """
+    return [
+        {
+            "activityName": name,
+            "date_set": day,
+            "attempts": counts["attempts"],
+            "completed": counts["completed"],
+        }
+        for day, activities in sorted(summary["daily"].items())
+        for name, counts in activities.items()
+    ]
+
+
+def last_date(summary):
+    """
+    returns the date of the last session as a date, or None
+    """
+    if summary["last_date"] is None:
+        return None
+    return datetime.strptime(summary["last_date"], "%Y-%m-%d").date()
+
+
+def _min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
@@ -0,0 +1,68 @@
+import summary as progress_summary
+from conftest import make_score
+
+
+def test_activity_stats_any_activity_set():
+    summary = progress_summary.build_summary(
+        [
+            {"Tandem Stance": make_score("Tandem Stance", "2022-03-01", True)},
+            {"Tandem Stance": make_score("Tandem Stance", "2022-03-02", False)},
+            {"Heel Raise": make_score("Heel Raise", "2022-03-02", True)},
+        ]
+    )
+    stats = progress_summary.activity_stats(summary, ["Instep Stance", "Tandem Stance"])
+
+    assert [s["activityName"] for s in stats] == [
+        "Instep Stance",
+        "Tandem Stance",
+        "Heel Raise",
+    ]
+    assert stats[0]["attempts"] == 0
+    assert stats[0]["percentage"] is None
+    assert stats[1]["attempts"] == 2
+    assert stats[1]["completed"] == 1
+    assert stats[1]["percentage"] == 50.0
+    assert stats[1]["min_value"] == 0.1
+    assert stats[2]["percentage"] == 100.0
+
+
+def test_activity_stats_no_scores():
+    stats = progress_summary.activity_stats(
+        progress_summary.empty_summary(), ["Instep Stance"]
+    )
+    assert stats[0]["attempts"] == 0
+
+
+def test_scores_frame_is_typed(app, scores, patient):
+    import data_utils
+
+    with app.test_request_context():
+        df = data_utils.get_patient_scores_frame(patient)
+    assert len(df) == 28
+    assert str(df["activityName"].dtype) == "category"
+    assert str(df["date_set"].dtype).startswith("datetime64")
+    assert df["completed"].dtype == bool
+    assert df["avg_value"].dtype == float
+    assert "acc_data" not in df.columns
+
+
+def test_scores_frame_selected_activity_with_traces(app, scores, patient):
+    import data_utils
+
+    with app.test_request_context():
+        df = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"], True)
+    assert set(df["activityName"]) == {"Tandem Stance"}
+    assert len(df) == 7
+    assert len(df["acc_data"].iloc[0]) == 50
+
+
+def test_every_activity_read_is_projected(app, scores, patient):
+    import data_utils
+
+    with app.test_request_context():
+        docs = data_utils.read_scores(patient)
+    assert len(docs) == 28
+    for doc in docs:
+        (entry,) = doc.to_dict().values()
+        assert "acc_data" not in entry
+        assert entry["date_set"]
@@ -0,0 +1,105 @@
+import asyncio
+
+from flask import session
+
+import async_data_utils
+import data_utils
+from conftest import make_score
+
+
+def test_async_reads_match_sync_reads(app, backend):
+    patients = backend.db.collection("patients/staff1/patient_details")
+    for i in range(3):
+        patients.document("pat%d@email.com" % i).set(
+            {"email": "pat%d@email.com" % i, "firstname": "Pat"}
+        )
+    backend.db.collection("activities").add({"name": "Tandem Stance"})
+    comments = backend.db.collection("comments/pat0@email.com/General comments")
+    for day in ["2022-03-01", "2022-03-02", "2022-03-03"]:
+        comments.add({"comment": day, "date": day})
+
+    async def read():
+        return await async_data_utils.gather(
+            (async_data_utils.get_patient, "pat1@email.com"),
+            (async_data_utils.get_activities,),
+            (async_data_utils.get_patients_page, 2),
+            (
+                async_data_utils.retrieve_comments_page,
+                "General comments",
+                "pat0@email.com",
+                2,
+            ),
+            (async_data_utils.get_patient_summary, "pat0@email.com"),
+        )
+
+    with app.test_request_context():
+        session["userId"] = "staff1"
+        patient, activities, patients_page, comments_page, summary = asyncio.run(
+            read()
+        )
+        assert patient["email"] == "pat1@email.com"
+        assert activities == data_utils.get_activities()
+        assert patients_page == data_utils.get_patients_page(2)
+        assert comments_page == data_utils.retrieve_comments_page(
+            "General comments", "pat0@email.com", 2
+        )
+        assert [c["date"] for c in comments_page[0]] == ["2022-03-03", "2022-03-02"]
+        assert summary["sessions"] == 0
+
+
+def test_async_client_per_event_loop(backend):
+    async def client():
+        return backend.async_db()
+
+    assert asyncio.run(client()) is not asyncio.run(client())
+
+
+def test_reads_share_one_client(backend):
+    @async_data_utils.on_client_loop
+    async def client():
+        return backend.async_db()
+
+    assert asyncio.run(client()) is asyncio.run(client())
+    assert len(backend._async_clients) == 1
+
+
+def test_patient_details_async_view(logged_in_client, patient, backend):
+    backend.db.collection("comments/%s/General comments" % patient).add(
+        {"comment": "steady", "date": "2022-03-01", "activity": "General comments"}
+    )
+    response = logged_in_client.get("/patient_details")
+    assert response.status_code == 200
+    assert b"steady" in response.data
+    assert b"Pat" in response.data
+
+    logged_in_client.get("/patient_details")
+    assert list(backend._async_clients) == [async_data_utils.get_client_loop()]
+
+
+def test_async_summary_sync_matches_rebuild(app, scores, patient):
+    with app.test_request_context():
+        data_utils.get_patient_summary(patient)
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-08", True)})
+        synced = asyncio.run(async_data_utils.get_patient_summary(patient))
+        assert synced == data_utils.rebuild_patient_summary(patient)
+        assert synced["sessions"] == 29
+        # back-dated, the count of the scores no longer matches the summary
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-02", True)})
+        rebuilt = asyncio.run(async_data_utils.get_patient_summary(patient))
+        assert rebuilt["sessions"] == 30
+        assert rebuilt == asyncio.run(async_data_utils.get_patient_summary(patient))
+
+
+def test_async_comments_match_sync_reads(app, patient, backend):
+    comments = backend.db.collection("comments/%s/General comments" % patient)
+    for day in ["2022-03-01", "2022-03-02"]:
+        comments.add({"comment": day, "date": day})
+    with app.test_request_context():
+        # the index of comments written before it existed is built on the first read
+        built = asyncio.run(async_data_utils.get_patient_comments(patient))
+        data_utils.clear_caches()
+        indexed = asyncio.run(async_data_utils.get_patient_comments(patient))
+        data_utils.clear_caches()
+        assert built == indexed == data_utils.get_patient_comments(patient)
+    thread = indexed["General comments"]
+    assert [c["comment"] for c in thread["comments"]] == ["2022-03-02", "2022-03-01"]
@@ -0,0 +1,139 @@
+import time
+import urllib.error
+
+import pytest
+
+import data_utils
+from auth_tokens import CERTS_URL, InvalidToken, PublicKeyCache, TokenExpired, TokenVerifier
+from backends import LOCAL_PROJECT_ID
+
+USER = {
+    "email": "bob@email.com",
+    "password": "bob123",
+    "confirm_password": "bob123",
+    "first_name": "Bob",
+    "last_name": "Smith",
+}
+
+
+def test_token_verified_locally(backend):
+    login = backend.auth.create_user_with_email_and_password("a@email.com", "pw")
+    claims = backend.verify_id_token(login["idToken"])
+    assert claims["sub"] == login["localId"]
+    assert claims["aud"] == LOCAL_PROJECT_ID
+
+    header, payload, signature = login["idToken"].split(".")
+    with pytest.raises(InvalidToken):
+        backend.verify_id_token(header + "." + payload + "." + signature[::-1])
+    with pytest.raises(InvalidToken):
+        backend.verify_id_token("not a token")
+
+    other = TokenVerifier("other-project", backend.auth.verifier.keys)
+    with pytest.raises(InvalidToken):
+        other.verify(login["idToken"])
+
+
+def test_expired_token(backend, monkeypatch):
+    monkeypatch.setattr(backend.auth, "token_lifetime", -3600)
+    login = backend.auth.create_user_with_email_and_password("a@email.com", "pw")
+    with pytest.raises(TokenExpired):
+        backend.verify_id_token(login["idToken"])
+
+
+def test_token_accepted_within_clock_skew(backend, monkeypatch):
+    monkeypatch.setattr(backend.auth, "token_lifetime", -5)
+    login = backend.auth.create_user_with_email_and_password("a@email.com", "pw")
+    backend.verify_id_token(login["idToken"])
+
+    # a token issued by a server whose clock is a few seconds ahead
+    monkeypatch.setattr(backend.auth, "token_lifetime", 3600)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    token = backend.auth.create_token(login["localId"], "a@email.com")
+    monkeypatch.undo()
+    assert backend.verify_id_token(token)["sub"] == login["localId"]
+
+
+def test_public_keys_kept_when_fetch_fails():
+    now = [0.0]
+    responses = [({"kid": "cert"}, 100)]
+
+    def fetch():
+        if not responses:
+            raise urllib.error.URLError("unreachable")
+        return responses.pop()
+
+    keys = PublicKeyCache(fetch, timer=lambda: now[0])
+    assert keys.certs() == {"kid": "cert"}
+    now[0] = 101
+    assert keys.certs() == {"kid": "cert"}
+    # the failed fetch is retried after a minute, not on every request
+    keys.certs()
+    assert keys.fetches == 2
+
+    with pytest.raises(InvalidToken):
+        PublicKeyCache(fetch).certs()
+
+
+def test_public_keys_cached_by_max_age():
+    now = [0.0]
+    keys = PublicKeyCache(lambda: ({"kid": "cert"}, 100), timer=lambda: now[0])
+    keys.certs()
+    keys.certs()
+    assert keys.fetches == 1
+    now[0] = 101
+    keys.certs()
+    assert keys.fetches == 2
+    # unknown key ids refetch at most once a minute
+    keys.certs(refresh=True)
+    assert keys.fetches == 2
+    now[0] = 200
+    keys.certs(refresh=True)
+    assert keys.fetches == 3
+
+
+def test_request_needs_valid_token(app, backend, client):
+    client.post("/register", data=USER)
+    client.post("/login", data=USER)
+    assert client.get("/welcome").status_code == 200
+
+    with client.session_transaction() as sess:
+        sess["idToken"] = sess["idToken"][:-4] + "AAAA"
+    assert client.get("/welcome").status_code == 302
+
+    with client.session_transaction() as sess:
+        del sess["idToken"]
+    assert client.get("/welcome").status_code == 302
+
+
+def test_staff_lookup_cached(logged_in_client):
+    stats = data_utils.staff_cache.stats()
+    logged_in_client.get("/welcome")
+    logged_in_client.get("/welcome")
+    assert data_utils.staff_cache.stats()["hits"] >= stats["hits"] + 2
+    assert data_utils.staff_cache.stats()["misses"] == stats["misses"]
+
+
+def test_expired_token_refreshed(app, backend, client, monkeypatch):
+    client.post("/register", data=USER)
+    monkeypatch.setattr(backend.auth, "token_lifetime", -3600)
+    client.post("/login", data=USER)
+    with client.session_transaction() as sess:
+        expired = sess["idToken"]
+    monkeypatch.setattr(backend.auth, "token_lifetime", 3600)
+
+    assert client.get("/welcome").status_code == 200
+    with client.session_transaction() as sess:
+        assert sess["idToken"] != expired
+        backend.verify_id_token(sess["idToken"])
+
+
+def test_login_needed_when_keys_cannot_be_fetched(logged_in_client, backend, monkeypatch):
+    def fetch():
+        raise urllib.error.HTTPError(CERTS_URL, 503, "unavailable", {}, None)
+
+    keys = PublicKeyCache(fetch)
+    monkeypatch.setattr(backend.auth.verifier, "keys", keys)
+    response = logged_in_client.get("/welcome")
+    assert response.status_code == 302
+    assert response.location.endswith("/login")
@@ -0,0 +1,107 @@
+import pytest
+from flask import session
+
+import data_utils
+from backends import DESCENDING
+
+
+def test_local_collection_layout(backend):
+    db = backend.db
+    db.collection("patients").document("uid1").collection("patient_details").document(
+        "a@email.com"
+    ).set({"email": "a@email.com"})
+
+    doc = db.document("patients/uid1/patient_details/a@email.com").get()
+    assert doc.exists
+    assert doc.to_dict() == {"email": "a@email.com"}
+    assert not db.collection("patients").document("uid2").get().exists
+
+
+def test_local_query_order_limit_and_cursor(backend):
+    scores = backend.db.collection("patient_scores").document("a").collection("scores")
+    for day in ["2022-03-01", "2022-03-03", "2022-03-02"]:
+        scores.add({"date_set": day})
+
+    docs = scores.order_by("date_set", direction=DESCENDING).limit(2).get()
+    assert [d.to_dict()["date_set"] for d in docs] == ["2022-03-03", "2022-03-02"]
+
+    rest = scores.order_by("date_set", direction=DESCENDING).start_after(docs[-1]).get()
+    assert [d.to_dict()["date_set"] for d in rest] == ["2022-03-01"]
+
+    newer = scores.where("date_set", ">", "2022-03-01").get()
+    assert len(newer) == 2
+
+
+def test_local_array_operators(backend):
+    activities = backend.db.collection("activities")
+    activities.document("a").set({"tags": ["balance", "legs"]})
+    activities.document("b").set({"tags": ["arms"]})
+
+    docs = activities.where("tags", "array-contains", "legs").get()
+    assert [d.id for d in docs] == ["a"]
+    docs = activities.where("tags", "array-contains-any", ["arms", "legs"]).get()
+    assert sorted(d.id for d in docs) == ["a", "b"]
+
+
+def test_local_auth(backend):
+    user = backend.auth.create_user_with_email_and_password("bob@email.com", "bob123")
+    login = backend.auth.sign_in_with_email_and_password("bob@email.com", "bob123")
+    assert login["localId"] == user["localId"]
+    with pytest.raises(Exception):
+        backend.auth.sign_in_with_email_and_password("bob@email.com", "wrong")
+
+
+def test_data_utils_with_local_backend(app, backend):
+    details = {
+        "email": "bob@email.com",
+        "password": "bob123",
+        "first_name": "Bob",
+        "last_name": "Smith",
+    }
+    with app.test_request_context():
+        assert data_utils.register_user(details) is not None
+        login = data_utils.login_user(details)
+        assert login is not None
+        session["userId"] = login["localId"]
+
+        data_utils.add_patient(
+            {
+                "email": "pat@email.com",
+                "first_name": "Pat",
+                "last_name": "Jones",
+                "age": "1950-01-01",
+                "condition": "none",
+            }
+        )
+        assert [p["email"] for p in data_utils.get_patients()] == ["pat@email.com"]
+        assert data_utils.get_patient("pat@email.com")["firstname"] == "Pat"
+
+        data_utils.add_comment({"comment": "good"}, "pat@email.com", "Tandem Stance")
+        comments = data_utils.retrieve_comments("Tandem Stance", "pat@email.com")
+        assert comments[0]["comment"] == "good"
+
+
+def test_add_activities_uses_batches(app, backend, monkeypatch):
+    commits = []
+    make_batch = backend.db.batch
+
+    def counting_batch():
+        batch = make_batch()
+        commit = batch.commit
+        batch.commit = lambda: commits.append(len(batch)) or commit()
+        return batch
+
+    monkeypatch.setattr(backend.db, "batch", counting_batch)
+    monkeypatch.setattr(data_utils, "BATCH_LIMIT", 2)
+    for i in range(5):
+        backend.db.collection("activities").add(
+            {"name": "activity %d" % i, "description": "d", "time_limit": 30}
+        )
+
+    del commits[:]
+
+    with app.test_request_context():
+        data_utils.add_activities("pat@email.com")
+    assert commits == [2, 2, 1]
+    with app.test_request_context():
+        assert len(data_utils.get_patient_activities("pat@email.com")) == 5
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from benchmarks import run as bench
+from benchmarks import synthetic
+
+
+def test_synthetic_sessions_are_repeatable():
+    first = synthetic.make_sessions(30, samples=40, seed=3)
+    assert first == synthetic.make_sessions(30, samples=40, seed=3)
+    assert len(first) == 30
+    for score in first:
+        assert 1 <= len(score) <= 4
+        for name, entry in score.items():
+            assert entry["activityName"] == name
+            assert len(entry["acc_data"]) == 40
+    days = [next(iter(score.values()))["date_set"] for score in first]
+    assert days == sorted(days)
+
+
+def test_compare_reports_regressions():
+    results = {
+        "scores_frame[10]": {"median": 0.010, "min": 0.009},
+        "build_summary[10]": {"median": 0.100, "min": 0.090},
+        "new_benchmark[10]": {"median": 1.0, "min": 1.0},
+    }
+    baseline = {"scores_frame[10]": 0.009, "build_summary[10]": 0.050}
+    assert bench.compare(results, baseline, threshold=0.5, min_slack=0.001) == [
+        ("build_summary[10]", 0.100, 0.050)
+    ]
+
+
+def test_route_benchmarks_render_charts(monkeypatch):
+    import charts
+
+    renders = []
+    save = charts.ChartStore.save
+
+    def counting_save(store, key, image):
+        renders.append(key)
+        return save(store, key, image)
+
+    monkeypatch.setattr(charts.ChartStore, "save", counting_save)
+    counts = []
+    for name in ["route_view_selected_activity", "route_view_selected_activity_cached"]:
+        renders.clear()
+        bench.run([10], repeat=2, samples=50, only=[name], output=lambda line: None)
+        counts.append(len(renders))
+    # the warm up call renders the charts, then every timed call renders them again
+    assert counts[0] == 3 * counts[1] > 0
+
+
+def test_suite_runs_at_small_scale():
+    results = bench.run([10], repeat=1, samples=50, output=lambda line: None)
+    assert len(results) == 18
+    assert "render_activity_movements[10]" in results
+    assert "route_view_activity_progress[10]" in results
+    assert "route_view_activity_progress_cached[10]" in results
+    assert all(result["median"] > 0 for result in results.values())
+
+
+@pytest.mark.skipif(
+    os.environ.get("BALANCE_BENCHMARK") != "1",
+    reason="set BALANCE_BENCHMARK=1 to compare with the stored baseline",
+)
+def test_no_regressions_against_baseline():
+    if bench.load_baseline_environment() != bench.environment(500):
+        pytest.skip("the baseline was recorded on another kind of machine")
+    results = bench.run(repeat=5, output=lambda line: None)
+    assert bench.compare(results, bench.load_baseline()) == []
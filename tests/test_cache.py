@@ -0,0 +1,40 @@
+import data_utils
+from cache import TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expiry_and_bound():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=2, ttl=10, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    timer.now = 11
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_activity_catalogue_cached_until_add_activity(app, backend):
+    with app.test_request_context():
+        data_utils.add_activity(
+            {"activity_name": "Tandem Stance", "description": "d", "time_limit": "30"}
+        )
+        assert len(data_utils.get_activities()) == 1
+        backend.db.collection("activities").add({"name": "Hidden"})
+        assert len(data_utils.get_activities()) == 1
+        assert data_utils.activity_cache.stats()["hits"] == 1
+
+        data_utils.add_activity(
+            {"activity_name": "Instep Stance", "description": "d", "time_limit": "30"}
+        )
+        assert len(data_utils.get_activities()) == 3
@@ -0,0 +1,162 @@
+import re
+
+import charts
+
+
+def chart_keys(response):
+    return re.findall(rb"/charts/([a-z_]+-[0-9a-f]{32}-[0-9a-f]{16})\.png", response.data)
+
+
+def test_progress_charts_rendered_once(logged_in_client, scores, chart_store, monkeypatch):
+    response = logged_in_client.get("/view_activity_progress")
+    assert response.status_code == 200
+    keys = chart_keys(response)
+    assert len(keys) == 3
+
+    calls = []
+    monkeypatch.setattr(
+        charts, "render_results_sunburst", lambda df: calls.append(df) or b""
+    )
+    response = logged_in_client.get("/view_activity_progress")
+    assert chart_keys(response) == keys
+    assert calls == []
+
+
+def test_chart_url_is_cacheable(logged_in_client, scores, chart_store):
+    response = logged_in_client.get("/view_selected_activity/Tandem Stance")
+    assert response.status_code == 200
+    keys = chart_keys(response)
+    assert len(keys) == 3
+
+    url = "/charts/%s.png" % keys[0].decode()
+    image = logged_in_client.get(url)
+    assert image.status_code == 200
+    assert image.mimetype == "image/png"
+    assert "immutable" in image.headers["Cache-Control"]
+
+    cached = logged_in_client.get(url, headers={"If-None-Match": image.headers["ETag"]})
+    assert cached.status_code == 304
+    assert logged_in_client.get("/charts/unknown.png").status_code == 404
+
+
+def test_chart_keys_isolate_patients(tmp_path):
+    store = charts.ChartStore(str(tmp_path))
+    data = charts.data_hash([{"a": 1}])
+    assert store.key("uid1", "a@email.com", "activity_week", data) != store.key(
+        "uid1", "b@email.com", "activity_week", data
+    )
+    key = store.key("uid1", "a@email.com", "activity_week", data)
+    assert key != store.key("uid2", "a@email.com", "activity_week", data)
+    assert store.owns(key, "uid1")
+    assert not store.owns(key, "uid2")
+
+
+def test_chart_served_to_its_owner_only(logged_in_client, scores, chart_store):
+    response = logged_in_client.get("/view_selected_activity/Tandem Stance")
+    url = "/charts/%s.png" % chart_keys(response)[0].decode()
+    assert logged_in_client.get(url).status_code == 200
+
+    logged_in_client.get("/logout")
+    other = {
+        "email": "alice@email.com",
+        "password": "alice123",
+        "confirm_password": "alice123",
+        "first_name": "Alice",
+        "last_name": "Brown",
+    }
+    logged_in_client.post("/register", data=other)
+    logged_in_client.post("/login", data=other)
+    assert logged_in_client.get(url).status_code == 404
+
+
+def test_chart_store_pruned_by_age_and_size(tmp_path):
+    import os
+
+    store = charts.ChartStore(str(tmp_path), max_age=3600, max_bytes=250)
+    now = 100000.0
+    for i, age in enumerate([7200, 30, 20, 10]):
+        store.save("chart-%d" % i, b"x" * 100)
+        os.utime(store.path("chart-%d" % i), (now - age, now - age))
+    assert store.prune(now) == 2
+    # the chart older than max_age goes, then the least recently served
+    assert [store.exists("chart-%d" % i) for i in range(4)] == [
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_matplotlib_charts_render_in_process_pool(app):
+    import pandas as pd
+    from conftest import make_score
+
+    assert charts.process_pool is not None
+    df = pd.DataFrame(
+        [make_score("Tandem Stance", "2022-03-0%d" % d, d % 2 == 0) for d in range(1, 8)]
+    )
+    image = charts.render_activity_movements(df, "Tandem Stance")
+    assert image.startswith(b"\x89PNG")
+
+
+def test_downsample_keeps_extremes():
+    import numpy as np
+
+    y = np.sin(np.linspace(0, 20, 10000))
+    y[1234] = 5.0
+    for method in ["minmax", "lttb"]:
+        x, reduced = charts.downsample(y, 200, method)
+        assert len(reduced) <= 200
+        assert np.all(np.diff(x) > 0)
+        assert 5.0 in reduced
+
+    x, reduced = charts.downsample([1, 2, 3], 200)
+    assert list(reduced) == [1, 2, 3]
+
+
+def test_client_mode_pages_load_chart_data(app, logged_in_client, scores, monkeypatch):
+    monkeypatch.setitem(app.config, "CHART_MODE", "client")
+    calls = []
+    monkeypatch.setattr(charts, "render_week_activity", lambda c: calls.append(c))
+
+    page = logged_in_client.get("/view_activity_progress")
+    assert chart_keys(page) == []
+    assert b'renderCharts("/api/progress")' in page.data
+    assert calls == []
+
+    page = logged_in_client.get("/view_selected_activity/Tandem Stance")
+    assert chart_keys(page) == []
+    assert b"/api/activity/Tandem%20Stance" in page.data
+
+    assert logged_in_client.get("/js/plotly.min.js").status_code == 200
+
+
+def test_progress_chart_data(logged_in_client, scores):
+    response = logged_in_client.get("/api/progress")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data["activity_week"]["dates"]) == 7
+    completed = data["activities_completed"]
+    assert completed["completed"][0] + completed["failed"][0] == 7
+
+    sunburst = data["results_sunburst"]
+    root = sunburst["ids"].index("Tandem Stance")
+    assert sunburst["parents"][root] == ""
+    assert sunburst["values"][root] == 7
+
+    again = logged_in_client.get(
+        "/api/progress", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert again.status_code == 304
+
+
+def test_activity_chart_data(logged_in_client, scores):
+    data = logged_in_client.get("/api/activity/Tandem Stance").get_json()
+    assert len(data["activity_average"]["dates"]) == 7
+    traces = data["activity_movements"]["traces"]
+    assert len(traces) == 7
+    assert len(traces[0]["x"]) == len(traces[0]["y"])
+
+
+def test_chart_data_requires_login(client, backend):
+    assert client.get("/api/progress").status_code == 401
@@ -0,0 +1,109 @@
+import data_utils
+
+
+def add_thread_comment(backend, email, activity, comment, day):
+    backend.db.collection("comments/%s/%s" % (email, activity)).add(
+        {"comment": comment, "date": day, "activity": activity}
+    )
+
+
+def comment_texts(threads, activity):
+    return [c["comment"] for c in threads[activity]["comments"]]
+
+
+def test_comment_index_built_from_threads(app, backend):
+    add_thread_comment(backend, "pat@email.com", "Tandem Stance", "older", "2022-03-01")
+    add_thread_comment(backend, "pat@email.com", "Tandem Stance", "newer", "2022-03-02")
+    add_thread_comment(backend, "pat@email.com", "General comments", "hello", "2022-03-01")
+
+    with app.test_request_context():
+        threads = data_utils.get_patient_comments("pat@email.com")
+    assert comment_texts(threads, "Tandem Stance") == ["newer", "older"]
+    assert comment_texts(threads, "General comments") == ["hello"]
+    index = backend.db.collection("patient_comments/pat@email.com/comments")
+    assert len(list(index.stream())) == 3
+
+
+def test_comment_index_read_is_bounded(app, backend, monkeypatch):
+    for day in range(1, 6):
+        add_thread_comment(
+            backend, "pat@email.com", "Tandem Stance", str(day), "2022-03-0%d" % day
+        )
+    with app.test_request_context():
+        data_utils.get_patient_comments("pat@email.com")
+        monkeypatch.setattr(data_utils, "COMMENT_LIMIT", 3)
+        data_utils.comment_cache.invalidate()
+        threads = data_utils.get_patient_comments("pat@email.com")
+    assert comment_texts(threads, "Tandem Stance") == ["5", "4", "3"]
+
+
+def test_patient_comments_cached_until_comment_added(app, backend):
+    add_thread_comment(backend, "pat@email.com", "Tandem Stance", "older", "2022-03-01")
+    with app.test_request_context():
+        data_utils.get_patient_comments("pat@email.com")
+        hits = data_utils.comment_cache.stats()["hits"]
+        data_utils.get_patient_comments("pat@email.com")
+        assert data_utils.comment_cache.stats()["hits"] == hits + 1
+
+        data_utils.add_comment({"comment": "steady"}, "pat@email.com", "Instep Stance")
+        threads = data_utils.get_patient_comments("pat@email.com")
+    assert comment_texts(threads, "Instep Stance") == ["steady"]
+    assert comment_texts(threads, "Tandem Stance") == ["older"]
+    # the comment is still written to its activity thread
+    assert data_utils.retrieve_comments("Instep Stance", "pat@email.com")
+
+
+def test_patient_details_shows_every_thread(logged_in_client, patient, backend):
+    add_thread_comment(backend, patient, "Tandem Stance", "wobbly", "2022-03-01")
+    add_thread_comment(backend, patient, "General comments", "steady", "2022-03-01")
+    response = logged_in_client.get("/patient_details")
+    assert b"wobbly" in response.data
+    assert b"steady" in response.data
+    assert b'id="comments_general_comments" >' in response.data
+    assert b'id="comments_tandem_stance" hidden>' in response.data
+
+    hits = data_utils.comment_cache.stats()["hits"]
+    response = logged_in_client.post(
+        "/patient_details", data={"activity": "tandem_stance"}
+    )
+    assert b'id="comments_tandem_stance" >' in response.data
+    assert data_utils.comment_cache.stats()["hits"] == hits + 1
+
+
+def test_comment_threads_follow_activities(logged_in_client, patient, backend):
+    backend.db.collection("activities").document("Heel Raise").set(
+        {"name": "Heel Raise", "description": "rise onto the toes", "time_limit": 30}
+    )
+    add_thread_comment(backend, patient, "Retired Stance", "old", "2022-03-01")
+    response = logged_in_client.get("/patient_details")
+    assert b'<option value="heel_raise" >Heel Raise</option>' in response.data
+    # comments under an activity no longer listed are still shown
+    assert b'id="comments_retired_stance" hidden>' in response.data
+    assert b"old" in response.data
+
+
+def test_older_comments_paged_per_thread(
+    logged_in_client, patient, backend, monkeypatch
+):
+    import re
+
+    monkeypatch.setattr(data_utils, "PAGE_SIZE", 2)
+    for day in range(1, 6):
+        add_thread_comment(
+            backend, patient, "Tandem Stance", "day %d" % day, "2022-03-0%d" % day
+        )
+    pages = []
+    url = "/patient_details"
+    while url:
+        html = logged_in_client.get(url).get_data(as_text=True)
+        thread = html.split('id="comments_tandem_stance"')[1].split("comment_thread")[0]
+        pages.append(re.findall(r"<td>(day \d)</td>", thread))
+        older = re.search(r'href="([^"]+)"><button class="table_button">Older', thread)
+        url = older and older.group(1).replace("&amp;", "&")
+    assert pages == [["day 5", "day 4"], ["day 3", "day 2"], ["day 1"]]
+
+
+def test_thread_outside_comment_limit_links_first_page():
+    thread = data_utils.comment_thread([], truncated=True)
+    assert thread == {"comments": [], "more": True, "next_page_token": None}
+    assert not data_utils.comment_thread([("c1", {"date": "2022-03-01"})])["more"]
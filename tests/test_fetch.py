@@ -0,0 +1,33 @@
+import time
+
+from flask import session
+
+import data_utils
+
+
+def slow_read(value):
+    time.sleep(0.2)
+    return value
+
+
+def test_fetch_all_runs_reads_concurrently():
+    start = time.perf_counter()
+    results = data_utils.fetch_all((slow_read, 1), (slow_read, 2), (slow_read, 3))
+    assert results == [1, 2, 3]
+    assert time.perf_counter() - start < 0.5
+
+
+def test_fetch_all_copies_request_context(app):
+    with app.test_request_context():
+        session["userId"] = "uid1"
+        assert data_utils.fetch_all((lambda: session["userId"],)) == ["uid1"]
+
+
+def test_patient_details_page(patient, backend, logged_in_client):
+    with logged_in_client.application.test_request_context():
+        data_utils.add_comment({"comment": "steady"}, patient, "General comments")
+    response = logged_in_client.get("/patient_details")
+    assert response.status_code == 200
+    assert b"Pat" in response.data
+    assert b"steady" in response.data
+    assert b"Instep Stance" in response.data
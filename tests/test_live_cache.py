@@ -0,0 +1,130 @@
+from flask import session
+
+import data_utils
+from live_cache import LiveCache
+
+
+def test_live_collection_follows_writes(backend):
+    cache = LiveCache()
+    activities = backend.db.collection("activities")
+    assert cache.documents("activities", activities) == []
+
+    activities.document("a1").set({"name": "Tandem Stance"})
+    assert cache.documents("activities", activities) == [
+        ("a1", {"name": "Tandem Stance"})
+    ]
+    activities.document("a1").delete()
+    assert cache.documents("activities", activities) == []
+    assert cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_peek_serves_only_current_copies(backend):
+    cache = LiveCache()
+    activities = backend.db.collection("activities")
+    activities.document("a1").set({"name": "Tandem Stance"})
+    assert cache.peek("activities") is None
+    cache.documents("activities", activities)
+    assert cache.peek("activities") == [("a1", {"name": "Tandem Stance"})]
+    assert cache.stats()["hits"] == 1
+    cache.close()
+    assert cache.peek("activities") is None
+
+
+def test_live_cache_closes_least_recently_read(backend):
+    cache = LiveCache(maxsize=1)
+    first = backend.db.collection("patient_activities/a@email.com/activities")
+    second = backend.db.collection("patient_activities/b@email.com/activities")
+    cache.documents("a", first)
+    cache.documents("b", second)
+    assert len(cache) == 1
+    assert len(backend.db._listeners) == 1
+    cache.close()
+    assert len(backend.db._listeners) == 0
+
+
+class SilentWatch:
+    is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class SilentQuery:
+    """
+    query whose listener never receives a snapshot
+    """
+
+    def __init__(self):
+        self.watches = []
+
+    def on_snapshot(self, callback):
+        self.watches.append(SilentWatch())
+        return self.watches[-1]
+
+
+def test_listener_without_snapshot_is_dropped():
+    cache = LiveCache(timeout=0.01)
+    query = SilentQuery()
+    assert cache.documents("activities", query) is None
+    assert len(cache) == 0
+    assert cache.documents("activities", query) is None
+    assert len(query.watches) == 2
+    assert not any(watch.is_active for watch in query.watches)
+
+
+def test_stopped_watch_subscribes_again(backend):
+    cache = LiveCache()
+    activities = backend.db.collection("activities")
+    assert cache.documents("activities", activities) == []
+    # the firestore watch closes itself when its stream fails
+    (watch,) = list(backend.db._listeners)
+    backend.db._listeners.pop(watch)
+    watch.is_active = False
+
+    activities.document("a1").set({"name": "Tandem Stance"})
+    assert cache.documents("activities", activities) == [
+        ("a1", {"name": "Tandem Stance"})
+    ]
+    assert cache.stats()["misses"] == 2
+    cache.close()
+
+
+def test_reads_are_served_from_memory(app, backend, monkeypatch):
+    monkeypatch.setattr(data_utils, "live_cache", LiveCache())
+    with app.test_request_context():
+        session["userId"] = "staff1"
+        assert data_utils.get_patients() == []
+        assert data_utils.get_activities() == []
+        assert data_utils.get_patient_activities("pat@email.com") == []
+
+        data_utils.add_patient(
+            {
+                "email": "pat@email.com",
+                "first_name": "Pat",
+                "last_name": "Jones",
+                "age": "1950-01-01",
+                "condition": "none",
+            }
+        )
+        data_utils.add_activity(
+            {"activity_name": "Tandem Stance", "description": "d", "time_limit": "30"}
+        )
+        data_utils.add_activities("pat@email.com")
+
+        reads = []
+        monkeypatch.setattr(
+            backend.db, "_list", lambda parent: reads.append(parent) or []
+        )
+        assert [p["email"] for p in data_utils.get_patients()] == ["pat@email.com"]
+        patients, next_page_token = data_utils.get_patients_page(1)
+        assert [p["email"] for p in patients] == ["pat@email.com"]
+        assert next_page_token is None
+        assert [a["name"] for a in data_utils.get_activities()] == ["Tandem Stance"]
+        assert len(data_utils.get_patient_activities("pat@email.com")) == 1
+    assert reads == []
+    # the activity cache is not consulted while the live cache serves the reads
+    stats = data_utils.get_cache_stats()
+    assert stats["activities"]["hits"] == stats["activities"]["misses"] == 0
+    assert stats["live"]["hits"] > 0
+    data_utils.clear_caches()
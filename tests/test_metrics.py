@@ -0,0 +1,69 @@
+import asyncio
+import re
+
+import metrics
+import async_data_utils
+import data_utils
+
+
+def sample(text, line):
+    match = re.search(r"^%s (\S+)$" % re.escape(line), text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_exposition():
+    registry = metrics.Registry()
+    histogram = registry.histogram("test_seconds", "Test", ["op"], buckets=(0.1, 1))
+    histogram.observe(0.05, op="a")
+    histogram.observe(0.5, op="a")
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{op="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{op="a",le="1"} 2' in text
+    assert 'test_seconds_bucket{op="a",le="+Inf"} 2' in text
+    assert 'test_seconds_count{op="a"} 2' in text
+
+
+def test_request_metrics_and_server_timing(logged_in_client, scores, chart_store):
+    before = metrics.REQUEST_LATENCY.count(
+        endpoint="view_activity_progress", method="GET", status=200
+    )
+    response = logged_in_client.get("/view_activity_progress")
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert re.search(r"db;dur=[0-9.]+", timing)
+    assert re.search(r"data;dur=[0-9.]+", timing)
+    assert re.search(r"chart;dur=[0-9.]+", timing)
+    assert re.search(r"total;dur=[0-9.]+$", timing)
+    after = metrics.REQUEST_LATENCY.count(
+        endpoint="view_activity_progress", method="GET", status=200
+    )
+    assert after == before + 1
+
+    text = logged_in_client.get("/metrics").data.decode()
+    assert 'balance_firestore_calls_total{operation="query.stream"}' in text
+    assert 'balance_data_call_duration_seconds_count{function="get_patient_summary"}' in text
+    assert 'balance_chart_render_duration_seconds_count{chart="results_sunburst"}' in text
+    assert 'balance_cache_hit_rate{cache="scores"}' in text
+
+
+def test_firestore_documents_counted(backend, scores):
+    line = 'balance_firestore_documents_read_total{operation="query.stream"}'
+    before = sample(metrics.registry.render(), line)
+    docs = list(data_utils.scores_query("pat@email.com").stream())
+    assert len(docs) == 28
+    assert sample(metrics.registry.render(), line) == before + 28
+
+
+def test_async_reads_counted(backend, scores):
+    before = metrics.FIRESTORE_CALLS.value(operation="document.get")
+    asyncio.run(async_data_utils.get_patient_summary("pat@email.com"))
+    assert metrics.FIRESTORE_CALLS.value(operation="document.get") > before
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setenv("BALANCE_METRICS_TOKEN", "secret")
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
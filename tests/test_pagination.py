@@ -0,0 +1,104 @@
+from flask import session
+
+import data_utils
+
+
+def add_patients(app, backend, count):
+    with app.test_request_context():
+        session["userId"] = "staff1"
+        for i in range(count):
+            data_utils.add_patient(
+                {
+                    "email": "pat%02d@email.com" % i,
+                    "first_name": "Pat",
+                    "last_name": str(i),
+                    "age": "1950-01-01",
+                    "condition": "none",
+                }
+            )
+
+
+def test_patients_are_paged_by_email(app, backend):
+    add_patients(app, backend, 5)
+    emails = []
+    page_token = None
+    with app.test_request_context():
+        session["userId"] = "staff1"
+        while True:
+            patients, page_token = data_utils.get_patients_page(2, page_token)
+            assert len(patients) <= 2
+            emails += [p["email"] for p in patients]
+            if page_token is None:
+                break
+    assert emails == ["pat%02d@email.com" % i for i in range(5)]
+
+
+def test_comments_are_paged_newest_first(app, backend):
+    comments = backend.db.collection("comments").document("pat@email.com")
+    for i, day in enumerate(["2022-03-01", "2022-03-02", "2022-03-02", "2022-03-03"]):
+        comments.collection("Tandem Stance").document("c%d" % i).set(
+            {"comment": "comment %d" % i, "date": day, "activity": "Tandem Stance"}
+        )
+
+    with app.test_request_context():
+        first, page_token = data_utils.retrieve_comments_page(
+            "Tandem Stance", "pat@email.com", 2
+        )
+        second, last_token = data_utils.retrieve_comments_page(
+            "Tandem Stance", "pat@email.com", 2, page_token
+        )
+    assert [c["comment"] for c in first] == ["comment 3", "comment 2"]
+    assert [c["comment"] for c in second] == ["comment 1", "comment 0"]
+    assert last_token is None
+
+
+def test_invalid_page_token_reads_first_page():
+    fields = ["date", "__name__"]
+    assert data_utils.decode_page_token("not a token!", fields) is None
+    token = data_utils.encode_page_token({"date": "2022-03-01", "__name__": "c1"})
+    assert data_utils.decode_page_token(token, fields) == {
+        "date": "2022-03-01",
+        "__name__": "c1",
+    }
+    for forged in [
+        {"__name__": "c1"},
+        {"date": "2022-03-01", "__name__": "c1", "other": 1},
+        {"date": "2022-03-01", "__name__": 5},
+        {"date": {"nested": 1}, "__name__": "c1"},
+    ]:
+        token = data_utils.encode_page_token(forged)
+        assert data_utils.decode_page_token(token, fields) is None
+
+
+def test_forged_page_token_reads_first_page(app, backend):
+    add_patients(app, backend, 3)
+    token = data_utils.encode_page_token({"__name__": ["pat00@email.com"]})
+    with app.test_request_context():
+        session["userId"] = "staff1"
+        patients, _ = data_utils.get_patients_page(2, token)
+    assert [p["email"] for p in patients] == ["pat00@email.com", "pat01@email.com"]
+
+
+def test_view_patients_links_next_page(logged_in_client, monkeypatch):
+    monkeypatch.setattr(data_utils, "PAGE_SIZE", 1)
+    for i in range(2):
+        logged_in_client.post(
+            "/create_patient",
+            data={
+                "email": "pat%d@email.com" % i,
+                "first_name": "Pat",
+                "last_name": str(i),
+                "age": "1950-01-01",
+                "condition": "none",
+            },
+        )
+
+    first = logged_in_client.get("/view_patients").get_data(as_text=True)
+    assert "pat0@email.com" in first and "pat1@email.com" not in first
+    token = data_utils.encode_page_token({"__name__": "pat0@email.com"})
+    assert "page_token=" + token in first
+
+    second = logged_in_client.get("/view_patients?page_token=" + token)
+    text = second.get_data(as_text=True)
+    assert "pat1@email.com" in text and "pat0@email.com" not in text
+    assert "Next page" not in text
@@ -0,0 +1,101 @@
+import os
+import pstats
+
+import profiling
+
+
+def profiles(directory, endpoint):
+    path = os.path.join(str(directory), endpoint)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".pstats"))
+
+
+def functions(path):
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+
+def test_requests_not_profiled_by_default(logged_in_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.delenv("BALANCE_PROFILE_TOKEN", raising=False)
+    response = logged_in_client.get("/welcome", headers={profiling.PROFILE_HEADER: ""})
+    assert profiling.PROFILE_HEADER + "-Id" not in response.headers
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_profile_requires_token(logged_in_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("BALANCE_PROFILE_TOKEN", "admin")
+    logged_in_client.get("/welcome?profile=guess")
+    assert profiles(tmp_path, "welcome") == []
+
+    response = logged_in_client.get("/welcome?profile=admin")
+    request_id = response.headers[profiling.PROFILE_HEADER + "-Id"]
+    [path] = profiles(tmp_path, "welcome")
+    assert path.endswith(request_id + ".pstats")
+    assert os.path.exists(path[: -len(".pstats")] + ".txt")
+    assert "welcome" in functions(path)
+
+
+def test_profile_covers_data_and_charts(
+    logged_in_client, scores, chart_store, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("BALANCE_PROFILE_TOKEN", "admin")
+    response = logged_in_client.get(
+        "/view_selected_activity/Tandem Stance",
+        headers={profiling.PROFILE_HEADER: "admin", "X-Request-ID": "req-1"},
+    )
+    assert response.status_code == 200
+    assert response.headers[profiling.PROFILE_HEADER + "-Id"] == "req-1"
+    [path] = profiles(tmp_path, "view_selected_activity")
+    names = functions(path)
+    assert "view_selected_activity" in names
+    assert "get_patient_scores_frame" in names
+    # drawn in the process pool and merged into the request profile
+    assert "_draw_activity_movements" in names
+
+
+def test_sampling_rate(logged_in_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("BALANCE_PROFILE_SAMPLE_RATE", "1")
+    logged_in_client.get("/welcome")
+    assert len(profiles(tmp_path, "welcome")) == 1
+
+
+def test_profile_covers_async_view(logged_in_client, patient, tmp_path, monkeypatch):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("BALANCE_PROFILE_TOKEN", "admin")
+    response = logged_in_client.get("/patient_details?profile=admin")
+    assert response.status_code == 200
+    [path] = profiles(tmp_path, "patient_details")
+    names = functions(path)
+    # the view runs on the loop flask starts, the reads on the client loop and
+    # the comments on a worker thread
+    assert "patient_details" in names
+    assert "get_patient" in names
+    assert "get_patient_comments" in names
+
+
+def test_profile_directory_is_pruned(logged_in_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("BALANCE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("BALANCE_PROFILE_SAMPLE_RATE", "1")
+    monkeypatch.setenv("BALANCE_PROFILE_KEEP", "2")
+    ids = [
+        logged_in_client.get(
+            "/welcome", headers={"X-Request-ID": "req-%d" % i}
+        ).headers[profiling.PROFILE_HEADER + "-Id"]
+        for i in range(4)
+    ]
+    kept = profiles(tmp_path, "welcome")
+    assert [os.path.basename(path).split("-", 1)[1] for path in kept] == [
+        request_id + ".pstats" for request_id in ids[2:]
+    ]
+    assert len(os.listdir(os.path.join(str(tmp_path), "welcome"))) == 4
+
+
+def test_token_compare():
+    assert profiling.matches_token("admin", "admin")
+    assert not profiling.matches_token("admin", "admi")
+    assert not profiling.matches_token("admin", None)
+    assert not profiling.matches_token("admin", "é")
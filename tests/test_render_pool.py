@@ -0,0 +1,27 @@
+import time
+
+import plotly.express as px
+import pytest
+
+from render_pool import PlotlyRenderPool, RenderTimeout
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = PlotlyRenderPool(size=1, timeout=30).start()
+    assert pool.wait_ready(60)
+    yield pool
+    pool.shutdown()
+
+
+def test_render_pool_renders_png(pool):
+    start = time.perf_counter()
+    image = pool.render(px.bar(x=[1, 2], y=[3, 4]))
+    assert image.startswith(b"\x89PNG")
+    assert time.perf_counter() - start < 1
+
+
+def test_render_pool_timeout(pool):
+    with pytest.raises(RenderTimeout):
+        pool.render(px.bar(x=list(range(2000)), y=list(range(2000))), timeout=0.001)
+    assert pool.render(px.bar(x=[1], y=[1])).startswith(b"\x89PNG")
@@ -0,0 +1,58 @@
+import data_utils
+from conftest import ACTIVITY_NAMES, count_reads, make_score
+
+
+def test_repeat_views_only_read_new_scores(app, scores, patient, monkeypatch):
+    reads = count_reads(monkeypatch)
+    with app.test_request_context():
+        first = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"])
+        assert len(first) == 7
+        assert reads == [7]
+
+        del reads[:]
+        again = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"])
+        assert len(again) == 7
+        # the delta query only reads the scores of the latest day
+        assert reads == [1]
+
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-07")})
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-08")})
+        del reads[:]
+        synced = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"])
+    assert reads == [3]
+    assert len(synced) == 9
+    assert str(synced["date_set"].max().date()) == "2022-03-08"
+    assert synced["activityName"].dtype == "category"
+
+
+def test_every_activity_frame_is_synced(app, scores, patient):
+    with app.test_request_context():
+        assert len(data_utils.get_patient_scores_frame(patient)) == 28
+        for activity in ACTIVITY_NAMES[:2]:
+            scores.add({activity: make_score(activity, "2022-03-09")})
+        df = data_utils.get_patient_scores_frame(patient)
+    assert len(df) == 30
+    assert data_utils.get_cache_stats()["scores"]["hits"] >= 1
+
+
+def test_date_range_is_read_by_the_query(app, scores, patient, monkeypatch):
+    reads = count_reads(monkeypatch)
+    with app.test_request_context():
+        df = data_utils.get_patient_scores_frame(
+            patient, ["Tandem Stance", "Instep Stance"], since="2022-03-05",
+            until="2022-03-07",
+        )
+    assert sorted(df["date_set"].dt.strftime("%Y-%m-%d").unique()) == [
+        "2022-03-05",
+        "2022-03-06",
+    ]
+    assert len(df) == 4
+    assert reads == [2, 2]
+
+
+def test_last_week_results(logged_in_client, scores, patient):
+    response = logged_in_client.post(
+        "/view_activity_progress",
+        data={"comment_made": "", "results": "row_data_lastweek"},
+    )
+    assert response.status_code == 200
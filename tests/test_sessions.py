@@ -0,0 +1,83 @@
+import os
+import stat
+
+import app as webapp
+from session_store import SessionStore, default_session_db
+
+USER = {
+    "email": "bob@email.com",
+    "password": "bob123",
+    "confirm_password": "bob123",
+    "first_name": "Bob",
+    "last_name": "Smith",
+}
+
+
+def session_cookie(client):
+    cookie = client.get_cookie(webapp.app.config["SESSION_COOKIE_NAME"])
+    return cookie.value if cookie else None
+
+
+def test_cookie_only_holds_session_id(logged_in_client, patient):
+    response = logged_in_client.get("/patient_details")
+    assert response.status_code == 200
+    session_id = session_cookie(logged_in_client)
+    assert len(session_id) == 43
+    data = webapp.app.session_interface.store.get(session_id)
+    assert data["patient_detail"]["email"] == patient
+    assert "Pat" not in session_id
+
+
+def test_login_is_per_session(app, logged_in_client):
+    other = app.test_client()
+    assert logged_in_client.get("/welcome").status_code == 200
+    response = other.get("/welcome")
+    assert response.status_code == 302
+    assert response.location.endswith("/login")
+
+
+def test_login_regenerates_session_and_logout_deletes_it(app, backend, client):
+    client.post("/register", data=USER)
+    client.get("/welcome")
+    before = session_cookie(client)
+    client.post("/login", data=USER)
+    after = session_cookie(client)
+    assert after is not None and after != before
+
+    store = app.session_interface.store
+    assert store.get(after)["userId"]
+    client.get("/logout")
+    assert store.get(after) is None
+    assert session_cookie(client) is None
+    assert client.get("/welcome").status_code == 302
+
+
+def test_sessions_shared_between_workers(backend, tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    config = {"TESTING": True, "WARM_CHARTS": False, "SESSION_DB": path}
+    first = webapp.create_app(config).test_client()
+    second = webapp.create_app(config).test_client()
+    first.post("/register", data=USER)
+    first.post("/login", data=USER)
+    second.set_cookie(
+        webapp.app.config["SESSION_COOKIE_NAME"], session_cookie(first)
+    )
+    assert second.get("/welcome").status_code == 200
+
+
+def test_expired_sessions_are_not_loaded():
+    now = [1000.0]
+    store = SessionStore(":memory:", timer=lambda: now[0])
+    store.save("a" * 43, {"userId": "1"}, 60)
+    assert store.get("a" * 43) == {"userId": "1"}
+    now[0] += 61
+    assert store.get("a" * 43) is None
+
+
+def test_session_db_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv("BALANCE_SESSION_DB", raising=False)
+    path = default_session_db(str(tmp_path / "instance"))
+    assert path.startswith(str(tmp_path / "instance"))
+    SessionStore(path).save("a" * 43, {"userId": "1"}, 60)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
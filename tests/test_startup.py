@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import app as webapp
+from backends import LocalBackend, get_backend, set_backend
+
+# seconds importing the application may take before its first request
+STARTUP_BUDGET = float(os.environ.get("BALANCE_STARTUP_BUDGET", 1.0))
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "plotly", "firebase_admin", "pyrebase"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_is_within_budget_and_lazy():
+    script = (
+        "import json, sys, app; print(json.dumps({'startup_time': app.startup_time,"
+        " 'modules': [m for m in %r if m in sys.modules],"
+        " 'render_pool': app.render_pool is not None}))" % HEAVY_MODULES
+    )
+    # the default configuration, chart warming included, is measured
+    env = dict(os.environ, BALANCE_BACKEND="firestore")
+    env.pop("BALANCE_WARM_CHARTS", None)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    assert result["modules"] == []
+    assert not result["render_pool"]
+    assert result["startup_time"] < STARTUP_BUDGET
+
+
+def test_create_app_uses_given_backend():
+    backend = LocalBackend()
+    try:
+        app = webapp.create_app({"WARM_CHARTS": False, "TESTING": True}, backend)
+        assert get_backend() is backend
+        assert app is not webapp.app
+        assert "view_patients" in app.view_functions
+        assert app.test_client().get("/login").status_code == 200
+    finally:
+        set_backend(None)
@@ -0,0 +1,98 @@
+from datetime import date
+
+import data_utils
+import summary as progress_summary
+from conftest import count_reads, make_score
+
+
+def test_summary_updated_on_score_arrival(app, scores, patient):
+    with app.test_request_context():
+        before = data_utils.get_patient_summary(patient)
+        assert before["sessions"] == 28
+        assert before["last_date"] == "2022-03-07"
+
+        data_utils.add_patient_score(
+            patient, {"Instep Stance": make_score("Instep Stance", "2022-03-09", False)}
+        )
+        updated = data_utils.get_patient_summary(patient)
+        rebuilt = data_utils.rebuild_patient_summary(patient)
+
+    assert updated == rebuilt
+    assert updated["last_date"] == "2022-03-09"
+    assert updated["activities"]["Instep Stance"]["attempts"] == 8
+    assert [row["completed"] for row in updated["last_session"]] == [False]
+
+
+def test_summary_windows():
+    summary = progress_summary.build_summary(
+        [
+            {"Tandem Stance": make_score("Tandem Stance", "2022-03-01", True)},
+            {"Tandem Stance": make_score("Tandem Stance", "2022-03-05", False)},
+            {"Instep Stance": make_score("Instep Stance", "2022-03-05", True)},
+        ]
+    )
+    week = progress_summary.rolling_stats(summary, date(2022, 3, 7), 7)
+    assert week["attempts"] == 3
+    assert week["active_days"] == 2
+    assert week["percentage"] == 66.67
+    recent = progress_summary.rolling_stats(summary, date(2022, 3, 7), 3)
+    assert recent["attempts"] == 2
+    assert recent["percentage"] == 50.0
+
+    stats = progress_summary.activity_stats(summary, ["Stand on one foot"])
+    assert stats[0]["percentage"] is None
+    assert stats[1]["activityName"] == "Tandem Stance"
+    assert stats[1]["percentage"] == 50.0
+
+
+def test_progress_page_reads_summary_only(logged_in_client, scores, backend, chart_store, monkeypatch):
+    assert logged_in_client.get("/view_activity_progress").status_code == 200
+
+    reads = count_reads(monkeypatch)
+    response = logged_in_client.get("/view_activity_progress")
+    assert response.status_code == 200
+    assert b"2022-03-07" in response.data
+    # only the last session is read to check for new scores
+    assert sum(reads) == 4
+
+    response = logged_in_client.post(
+        "/view_activity_progress", data={"comment_made": "", "results": "row_data_all"}
+    )
+    assert response.status_code == 200
+    assert response.data.count(b"<td> Tandem Stance </td>") == 7
+
+
+def test_summary_syncs_scores_written_directly(app, scores, patient):
+    with app.test_request_context():
+        before = data_utils.get_patient_summary(patient)
+        # the mobile application writes score documents straight to the database
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-08", True)})
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-08", False)})
+        updated = data_utils.get_patient_summary(patient)
+        again = data_utils.get_patient_summary(patient)
+        rebuilt = data_utils.rebuild_patient_summary(patient)
+
+    assert before["sessions"] == 28
+    assert updated["sessions"] == 30
+    assert updated["last_date"] == "2022-03-08"
+    assert updated == again == rebuilt
+
+
+def test_summary_rebuilt_for_back_dated_scores(app, scores, patient):
+    with app.test_request_context():
+        data_utils.get_patient_summary(patient)
+        # uploaded late, dated before the last session of the summary
+        scores.add({"Tandem Stance": make_score("Tandem Stance", "2022-03-02", True)})
+        updated = data_utils.get_patient_summary(patient)
+    assert updated["sessions"] == 29
+    assert updated["activities"]["Tandem Stance"]["attempts"] == 8
+    assert updated["daily"]["2022-03-02"]["Tandem Stance"]["attempts"] == 2
+
+
+def test_summary_keeps_daily_window():
+    summary = progress_summary.build_summary(
+        {"Tandem Stance": make_score("Tandem Stance", "2022-%02d-01" % month)}
+        for month in range(1, 13)
+    )
+    assert sorted(summary["daily"]) == ["2022-12-01"]
+    assert summary["activities"]["Tandem Stance"]["attempts"] == 12
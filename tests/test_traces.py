@@ -0,0 +1,61 @@
+import numpy as np
+
+import data_utils
+from conftest import make_score
+from traces import encode_trace, decode_trace, INT16
+
+
+def test_trace_round_trip():
+    values = np.sin(np.linspace(0, 10, 5000))
+    encoded = encode_trace(values, sample_rate=100)
+    assert len(encoded) < values.nbytes / 2
+
+    decoded, sample_rate = decode_trace(encoded)
+    assert sample_rate == 100
+    assert decoded.dtype == np.float32
+    assert not decoded.flags.writeable
+    assert np.allclose(decoded, values, atol=1e-6)
+
+    decoded, _ = decode_trace(encode_trace(values, sample_type=INT16))
+    assert np.allclose(decoded, values, atol=1e-4)
+
+
+def test_traces_kept_out_of_score_documents(app, backend, patient):
+    score = {"Tandem Stance": make_score("Tandem Stance", "2022-03-01")}
+    with app.test_request_context():
+        doc_id = data_utils.add_patient_score(patient, score, sample_rate=50)
+        stored = data_utils.get_patient_scores(patient)[0]["Tandem Stance"]
+        assert "acc_data" not in stored
+        assert stored["acc_ref"] == doc_id + "_Tandem Stance"
+
+        df = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"], True)
+    assert np.allclose(df["acc_data"].iloc[0], score["Tandem Stance"]["acc_data"])
+
+
+def test_migrate_patient_traces(app, backend, scores, patient):
+    originals = {doc.id: doc.to_dict() for doc in scores.stream()}
+    with app.test_request_context():
+        before = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"], True)
+        assert data_utils.migrate_patient_traces(patient) == 28
+        assert data_utils.migrate_patient_traces(patient) == 0
+        # the frame is read again from the migrated documents and their traces
+        data_utils.score_cache.invalidate()
+        data_utils.activity_cache.invalidate()
+        after = data_utils.get_patient_scores_frame(patient, ["Tandem Stance"], True)
+    assert len(after) == len(before) == 7
+    for a, b in zip(before["acc_data"], after["acc_data"]):
+        assert np.allclose(a, b, atol=1e-6)
+
+    traces = backend.db.collection("patient_scores/%s/traces" % patient)
+    for doc in scores.stream():
+        ((name, entry),) = doc.to_dict().items()
+        assert "acc_data" not in entry
+        decoded, _ = decode_trace(traces.document(entry["acc_ref"]).get().get("acc"))
+        assert np.allclose(decoded, originals[doc.id][name]["acc_data"], atol=1e-6)
+
+
+def test_migrate_traces_command(app, scores, patient):
+    result = app.test_cli_runner().invoke(args=["migrate-traces"])
+    assert "%s: 28 score documents migrated" % patient in result.output
+    for doc in scores.stream():
+        assert all("acc_ref" in entry for entry in doc.to_dict().values())
@@ -0,0 +1,80 @@
+"""
+Name : Diarmuid Brennan
+Project : Balance Health Web Application
+Date : 18/10/2026
+traces.py
+contains methods for encoding accelerometer traces into a compact binary format
+
+an encoded trace is an 18 byte header followed by the zlib compressed samples
+    magic "BHTR", format version, sample type, sample rate, sample count, int16 scale
+samples are stored as little endian float32, or as int16 scaled by the header scale
+"""
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"BHTR"
+VERSION = 1
+
+FLOAT32 = 1
+INT16 = 2
+
+_HEADER = struct.Struct("<4sBBfIf")
+_DTYPES = {FLOAT32: np.dtype("<f4"), INT16: np.dtype("<i2")}
+
+
+def encode_trace(values, sample_rate=0.0, sample_type=FLOAT32, level=6):
+    """
+    encodes an accelerometer trace
+
+    Parameters
+    -------------
+    values : sequence of trace values
+    sample_rate : number of samples per second, 0 if unknown
+    sample_type : FLOAT32 keeps full precision, INT16 halves the size by scaling
+        the samples to the int16 range
+    level : zlib compression level
+
+    Returns
+    ------------
+    bytes holding the header and compressed samples
+    """
+    values = np.asarray(values, dtype=float)
+    scale = 1.0
+    if sample_type == INT16:
+        peak = float(np.max(np.abs(values))) if len(values) else 0.0
+        scale = peak / 32767 if peak else 1.0
+        samples = np.round(values / scale).astype(_DTYPES[INT16])
+    elif sample_type == FLOAT32:
+        samples = values.astype(_DTYPES[FLOAT32])
+    else:
+        raise ValueError("Unknown sample type: %s" % sample_type)
+    header = _HEADER.pack(
+        MAGIC, VERSION, sample_type, float(sample_rate), len(samples), scale
+    )
+    return header + zlib.compress(samples.tobytes(), level)
+
+
+def decode_trace(data):
+    """
+    decodes an encoded accelerometer trace
+
+    Parameters
+    -------------
+    data : bytes returned by encode_trace
+
+    Returns
+    ------------
+    Tuple of a read only numpy array of the samples and the sample rate.
+    float32 samples are viewed directly over the decompressed buffer without a copy
+    """
+    magic, version, sample_type, sample_rate, length, scale = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an encoded accelerometer trace")
+    payload = zlib.decompress(memoryview(data)[_HEADER.size :])
+    samples = np.frombuffer(payload, dtype=_DTYPES[sample_type], count=length)
+    if sample_type == INT16:
+        samples = samples * scale
+        samples.flags.writeable = False
+    return samples, sample_rate